@@ -1,17 +1,30 @@
 import argparse
 import os
+import shutil
 import sys
 from argparse import RawDescriptionHelpFormatter
 from configparser import ConfigParser
+from contextlib import suppress
 from pathlib import Path
 from textwrap import dedent
+from time import monotonic
 from traceback import print_exc
 from types import SimpleNamespace
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple, Union
+
+from texttable import Texttable
 
 from existance import actions
-from existance.constants import TMP
+from existance.constants import TIMINGS_FILENAME, TMP
 from existance.templates import TEMPLATES
+from existance.utils import (
+    TimingHistory,
+    command_runner,
+    configure_command_runner,
+    format_bytes,
+    format_duration,
+    state_directory,
+)
 
 
 #
@@ -34,15 +47,30 @@ class PlanExecutor:
         plan: List[actions.ActionBase],
         args: argparse.Namespace,
         config: ConfigParser,
+        interactive: bool = True,
+        progress: Optional[Callable[[actions.ProgressEvent], None]] = None,
     ):
+        """ :param interactive: Whether missing values may be asked for.
+            :param progress: A callable that receives
+                             :class:`existance.actions.ProgressEvent` objects
+                             instead of the printed messages.
+        """
 
         self.plan = plan
         self.args = args
         self.config = config
+        self.interactive = interactive
+        self.progress = progress
 
         self.context = SimpleNamespace()
         self.rollback_plan = []
 
+        self.dry_run = getattr(args, "dry_run", False)
+        self.timings = None
+        self.simulation = []
+        self.durations = []
+        self.error = None
+
     def __call__(self) -> int:
         return self.execute_plan()
 
@@ -60,32 +88,248 @@ class PlanExecutor:
 
     def execute_plan(self) -> int:
         """ Runs all designated actions and rolls back on encountered errors.
+        The durations of the actions are recorded. In a dry run only the
+        read-only actions are performed and the duration of all others is
+        estimated from the recorded ones, external commands aren't executed.
 
         :returns: The exit code that shall be emitted.
         """
 
-        for action in self.plan:
-            try:
-                action = action(self)
-                if not isinstance(action, actions.EphemeralAction):
-                    self.rollback_plan.insert(0, action)
-                action.do()
-            except KeyboardInterrupt:
-                print("Process aborted.")
-                self.do_rollback()
-                raise SystemExit(1)
-            except Exception:
-                print("Please report this unhandled exception:")
-                print_exc()
-                self.do_rollback()
-                raise SystemExit(3)
-
+        stub = command_runner.stub
+        if self.dry_run:
+            command_runner.stub = {}
+        listener = None
+        if self.progress is not None:
+            listener = actions.progress_listener.set(self.progress)
+
+        try:
+            self.timings = TimingHistory(
+                state_directory(self.config) / TIMINGS_FILENAME
+            )
+            for action in self.plan:
+                self.execute_action(action)
+        except OSError as e:
+            # the actions' errors are handled by execute_action
+            print(f"The state directory isn't accessible: {e}")
+            self.error = str(e)
+            raise SystemExit(1)
+        finally:
+            command_runner.stub = stub
+            if listener is not None:
+                actions.progress_listener.reset(listener)
+            if self.timings is not None and not self.dry_run:
+                # the records only improve estimates and aren't worth a failure
+                with suppress(OSError):
+                    self.timings.save()
+
+        if self.dry_run:
+            self.print_simulation()
         return 0
 
+    def execute_action(self, action_cls: type):
+        try:
+            action = action_cls(self)
+            name = self.action_name(action)
+
+            if self.dry_run and not action.read_only:
+                workload = self.workload(action)
+                self.simulation.append(
+                    (name, self.timings.estimate(name, workload), workload)
+                )
+                return
+
+            if not isinstance(action, actions.EphemeralAction):
+                self.rollback_plan.insert(0, action)
+            self.notify("started", name)
+            started = monotonic()
+            action.do()
+            duration = monotonic() - started - action.prompted
+            self.notify("finished", name, duration)
+            self.durations.append((name, duration))
+
+            if self.dry_run:
+                self.simulation.append((name, duration, None))
+            else:
+                # the processed data is still in place after all actions
+                # that declare a workload
+                self.timings.record(name, duration, self.workload(action))
+        except KeyboardInterrupt:
+            print("Process aborted.")
+            self.fail(action_cls, "Process aborted.")
+            raise SystemExit(1)
+        except actions.Abort as e:
+            print(e)
+            self.fail(action_cls, str(e))
+            raise SystemExit(1)
+        except Exception as e:
+            print("Please report this unhandled exception:")
+            print_exc()
+            self.fail(action_cls, repr(e))
+            raise SystemExit(3)
+
+    @staticmethod
+    def workload(action: actions.ActionBase) -> Optional[int]:
+        try:
+            return action.workload()
+        except OSError:
+            return None
+
+    def fail(self, action_cls: type, error: str):
+        self.error = error
+        self.notify("failed", self.action_name(action_cls), error)
+        self.do_rollback()
+
+    def notify(self, kind: str, subject: str, detail=None):
+        if self.progress is not None:
+            self.progress(actions.ProgressEvent(kind, subject, detail))
+
+    @staticmethod
+    def action_name(action: Union[actions.ActionBase, type]) -> str:
+        counterpart = getattr(action, "counterpart", None)
+        if counterpart is not None:
+            return f"undo {counterpart.__name__}"
+        return action.__name__ if isinstance(action, type) else type(action).__name__
+
+    def print_simulation(self):
+        table = Texttable(max_width=shutil.get_terminal_size().columns - 2)
+        table.header(("action", "duration", "processed", "instance"))
+        table.set_cols_align(("l", "r", "r", "l"))
+        table.set_deco(Texttable.HEADER | Texttable.VLINES)
+
+        total = downtime = 0.0
+        processed, unknown, down = 0, [], False
+        for name, duration, workload in self.simulation:
+            if name == "undo StartSystemdUnit":
+                down = True
+            if duration is None:
+                unknown.append(name)
+            else:
+                total += duration
+                if down:
+                    downtime += duration
+            processed += workload or 0
+            table.add_row((
+                name,
+                "unknown" if duration is None else format_duration(duration),
+                "" if workload is None else format_bytes(workload),
+                "stopped" if down else "",
+            ))
+            if name == "StartSystemdUnit":
+                down = False
+
+        print("\n" + table.draw() + "\n")
+        print(f"Estimated duration: {format_duration(total)}")
+        print(f"Estimated data to process: {format_bytes(processed)}")
+        if down:
+            print("The instance remains stopped.")
+        elif downtime:
+            print(f"Estimated downtime: {format_duration(downtime)}")
+        if unknown:
+            print(
+                "No durations were recorded for these actions yet: "
+                + ", ".join(sorted(set(unknown)))
+            )
+
 
 # initialization
 
 
+def make_backup_export_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
+    plan = [
+        actions.ReadInstancesSettings,
+        actions.SelectInstanceID,
+        actions.GetInstanceName,
+        actions.CalculateTargetPaths,
+    ]
+
+    if args.output is None:
+        plan.insert(0, actions.DivertMessagesToStderr)
+
+    if args.source == "data":
+        plan.extend((
+            actions.counter(actions.StartSystemdUnit, reversible=True),
+            actions.ExportArchive,
+            actions.StartSystemdUnit,
+        ))
+    else:
+        plan.append(actions.ExportArchive)
+
+    return plan
+
+
+def make_backup_restore_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
+    return [
+        actions.ReadInstancesSettings,
+        actions.SelectInstanceID,
+        actions.GetInstanceName,
+        actions.CalculateTargetPaths,
+
+        actions.counter(actions.StartSystemdUnit, reversible=True),
+        actions.RestoreArchive,
+        actions.SetFilePermissions,
+        actions.StartSystemdUnit,
+        actions.WarmUpInstance,
+    ]
+
+
+def make_bench_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
+    return [
+        actions.ReadInstancesSettings,
+        actions.SelectInstanceID,
+        actions.GetInstanceName,
+        actions.BenchmarkInstance,
+    ]
+
+
+def make_clone_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
+    return [
+        actions.ReadInstancesSettings,
+        actions.SelectInstanceID,
+        actions.GetInstanceName,
+        actions.CalculateTargetPaths,
+        actions.SetCloneSource,
+        actions.SetDesignatedInstanceID,
+        actions.SetDesignatedInstanceName,
+        actions.CalculateTargetPaths,
+        actions.ResolveJVMOptions,
+        actions.ResolveResourceControls,
+
+        actions.MakeInstanceDirectory,
+        actions.CloneInstanceFiles,
+        actions.CreateBackupDirectory,
+        actions.SetFilePermissions,
+        actions.SetJettyWebappContext,
+        actions.ConfigureJetty,
+        actions.AddBackupTask,
+        actions.SetupLoggingAggregation,
+        actions.WriteInstanceSettings,
+        actions.WriteProxyMappings,
+        actions.ConfigureResourceControls,
+        actions.EnableSystemdUnit,
+        actions.StartSystemdUnit,
+        actions.ReloadNginx,
+        actions.WarmUpInstance,
+    ]
+
+
+def make_diagnose_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
+    plan = [actions.ReadInstancesSettings, actions.CaptureDiagnostics]
+    if not args.all:
+        plan.insert(1, actions.SelectInstanceID)
+    return plan
+
+
+def make_events_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
+    return [actions.ReadInstancesSettings, actions.ReportUnitEvents]
+
+
+def make_gc_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
+    plan = [actions.ReadInstancesSettings, actions.ReportGarbageCollection]
+    if not args.all:
+        plan.insert(1, actions.SelectInstanceID)
+    return plan
+
+
 def make_install_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
     return [
         actions.GetLatestExistVersion,
@@ -95,39 +339,119 @@ def make_install_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
         actions.SetDesignatedInstanceName,
         actions.SetDesignatedExistDBVersion,
         actions.CalculateTargetPaths,
+        actions.ResolveJVMOptions,
+        actions.ResolveResourceControls,
+        actions.CheckDiskSpace,
 
         actions.DownloadInstaller,
         actions.MakeInstanceDirectory,
         actions.MakeDataDir,
         actions.InstallerPrologue,
         actions.RunExistInstaller,
+        actions.BuildInstanceOverlay,
         actions.CreateBackupDirectory,
         actions.SetFilePermissions,
         actions.SetJettyWebappContext,
+        actions.ConfigureJetty,
         actions.AddBackupTask,
         actions.ConfigureSerialization,
-        actions.AddProxyMapping,
+        actions.ConfigureCacheSizes,
         actions.SetupLoggingAggregation,
         actions.WriteInstanceSettings,
+        actions.WriteProxyMappings,
+        actions.ConfigureResourceControls,
         actions.EnableSystemdUnit,
         actions.StartSystemdUnit,
+        actions.SetAdminPassword,
         actions.ReloadNginx,
+        actions.WarmUpInstance,
     ]
 
 
 def make_list_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
-    if args.paths:
-        raise NotImplementedError
     return [
         actions.ReadInstancesSettings,
         actions.ListInstances
     ]
 
 
+def make_logs_rotate_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
+    plan = [actions.ReadInstancesSettings, actions.RotateLogs]
+    if not args.all:
+        plan.insert(1, actions.SelectInstanceID)
+    return plan
+
+
+def make_reconcile_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
+    plan = [
+        actions.ReadInstancesSettings,
+        actions.ReconcileInstances,
+        actions.ReloadNginx,
+    ]
+    if not args.all:
+        plan.insert(1, actions.SelectInstanceID)
+    return plan
+
+
+def make_snapshots_list_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
+    plan = [actions.ReadInstancesSettings, actions.ListSnapshots]
+    if args.id is not None:
+        plan.insert(1, actions.SelectInstanceID)
+    return plan
+
+
+def make_snapshots_prune_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
+    plan = [actions.ReadInstancesSettings, actions.PruneSnapshots]
+    if not args.all:
+        plan.insert(1, actions.SelectInstanceID)
+    return plan
+
+
+def make_snapshots_restore_plan(
+    args: argparse.Namespace
+) -> List[actions.ActionBase]:
+    return [
+        actions.ReadInstancesSettings,
+        actions.SelectInstanceID,
+        actions.GetInstanceName,
+        actions.CalculateTargetPaths,
+
+        actions.counter(actions.StartSystemdUnit, reversible=True),
+        actions.RestoreSnapshot,
+        actions.StartSystemdUnit,
+        actions.WarmUpInstance,
+    ]
+
+
 def make_template_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
     return [actions.DumpTemplate]
 
 
+def make_trash_purge_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
+    return [actions.PurgeTrash]
+
+
+def make_trash_status_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
+    return [actions.ShowTrashStatus]
+
+
+def make_tune_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
+    return [
+        actions.ReadInstancesSettings,
+        actions.SelectInstanceID,
+        actions.GetInstanceName,
+        actions.CalculateTargetPaths,
+
+        actions.ResolveJVMOptions,
+        actions.ResolveResourceControls,
+        actions.UpdateInstanceSettings,
+        actions.ConfigureResourceControls,
+        actions.ConfigureCacheSizes,
+        actions.ConfigureJetty,
+        actions.RestartSystemdUnitIfRequired,
+    ]
+
+
 def make_uninstall_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
     return [
         actions.ReadInstancesSettings,
@@ -137,8 +461,9 @@ def make_uninstall_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
 
         actions.counter(actions.StartSystemdUnit),
         actions.counter(actions.EnableSystemdUnit),
+        actions.counter(actions.ConfigureResourceControls),
         actions.counter(actions.WriteInstanceSettings),
-        actions.counter(actions.AddProxyMapping),
+        actions.WriteProxyMappings,
         actions.ReloadNginx,
         actions.counter(actions.MakeInstanceDirectory),
         actions.counter(actions.SetupLoggingAggregation),
@@ -146,7 +471,7 @@ def make_uninstall_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
 
 
 def make_upgrade_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
-    return [
+    plan = [
         actions.GetLatestExistVersion,
 
         actions.ReadInstancesSettings,
@@ -154,6 +479,9 @@ def make_upgrade_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
         actions.GetInstanceName,
         actions.SetDesignatedExistDBVersion,
         actions.CalculateTargetPaths,
+        actions.ResolveJVMOptions,
+        actions.ResolveResourceControls,
+        actions.CheckDiskSpace,
 
         actions.counter(actions.StartSystemdUnit),
         actions.LoadRetainedConfigs,
@@ -163,16 +491,28 @@ def make_upgrade_plan(args: argparse.Namespace) -> List[actions.ActionBase]:
         actions.MakeDataDir,
         actions.InstallerPrologue,
         actions.RunExistInstaller,
+        actions.BuildInstanceOverlay,
 
         actions.SaveRetainedConfigs,
+        actions.ConfigureCacheSizes,
         actions.RemoveUnwantedJettyConfig,
+        actions.ConfigureJetty,
         actions.counter(actions.MakeDataDir),
         actions.CopyDatasnapshot,
 
         actions.SetFilePermissions,
+        actions.UpdateInstanceSettings,
         actions.StartSystemdUnit,
+        actions.WarmUpInstance,
     ]
 
+    if args.bench:
+        plan.insert(plan.index(actions.CheckDiskSpace) + 1,
+                    actions.BenchmarkBeforeUpgrade)
+        plan.append(actions.BenchmarkAfterUpgrade)
+
+    return plan
+
 
 #
 
@@ -191,12 +531,59 @@ def add_version_arg(subparser: argparse.ArgumentParser) -> None:
     )
 
 
+def add_dry_run_arg(subparser: argparse.ArgumentParser) -> None:
+    subparser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only prints the actions that would be performed with estimates of "
+        "their durations and the processed data, based on earlier runs.",
+    )
+
+
+def add_jvm_args(subparser: argparse.ArgumentParser) -> None:
+    subparser.add_argument(
+        "--jvm-profile",
+        metavar="NAME",
+        help="Specifies the named set of JVM options that is used for the instance.",
+    )
+    subparser.add_argument(
+        "--jvm-options",
+        dest="jvm_overrides",
+        metavar="OPTIONS",
+        help="Specifies JVM options that override or extend those of the profile, "
+        "the options must be separated by spaces and quoted as one argument.",
+    )
+
+
+def add_resource_args(subparser: argparse.ArgumentParser) -> None:
+    subparser.add_argument(
+        "--cpu-weight", metavar="WEIGHT",
+        help="Specifies the systemd CPUWeight of the instance."
+    )
+    subparser.add_argument(
+        "--io-weight", metavar="WEIGHT",
+        help="Specifies the systemd IOWeight of the instance."
+    )
+    subparser.add_argument(
+        "--memory-max", metavar="VALUE",
+        help="Specifies the systemd MemoryMax of the instance, 'auto' derives it "
+        "from the XmX value.",
+    )
+    subparser.add_argument(
+        "--tasks-max", metavar="VALUE",
+        help="Specifies the systemd TasksMax of the instance."
+    )
+
+
 def make_argparser(config: ConfigParser) -> argparse.ArgumentParser:
     global cli_parser
 
-    if cli_parser is not None:
-        return cli_parser
+    if cli_parser is None:
+        cli_parser = build_argparser(config)
+    return cli_parser
+
 
+def build_argparser(config: ConfigParser) -> argparse.ArgumentParser:
     cli_parser = argparse.ArgumentParser(formatter_class=RawDescriptionHelpFormatter)
     cli_parser.description = dedent("""\
     existance is a tool to manage several instances of eXist-db instances on a
@@ -263,6 +650,137 @@ def make_argparser(config: ConfigParser) -> argparse.ArgumentParser:
         help="The system usergroup that is supposed to run the installed instances.",
     )
 
+    backup_parser = subcommands.add_parser("backup")
+    backup_parser.description = (
+        "Streams an instance's backups or data as compressed archive from and to "
+        "another location."
+    )
+    backup_subcommands = backup_parser.add_subparsers()
+
+    backup_export_parser = backup_subcommands.add_parser("export")
+    backup_export_parser.description = (
+        "Writes a compressed tar archive of an instance's backup folder or its data "
+        "folder to stdout or a file. The instance is stopped while its data folder "
+        "is exported."
+    )
+    backup_export_parser.set_defaults(plan_factory=make_backup_export_plan)
+    add_id_arg(backup_export_parser)
+    backup_export_parser.add_argument(
+        "--source",
+        choices=("backup", "data"),
+        default="backup",
+        help="The folder to export, defaults to the backup folder.",
+    )
+    backup_export_parser.add_argument(
+        "--output",
+        type=Path,
+        metavar="FILEPATH",
+        help="A new file to write to instead of stdout.",
+    )
+
+    backup_restore_parser = backup_subcommands.add_parser("restore")
+    backup_restore_parser.description = (
+        "Extracts an archive that was produced by the export subcommand into an "
+        "instance's folder. The replaced folder is kept with a datetime suffix."
+    )
+    backup_restore_parser.set_defaults(plan_factory=make_backup_restore_plan)
+    add_id_arg(backup_restore_parser)
+    backup_restore_parser.add_argument(
+        "--input",
+        type=Path,
+        metavar="FILEPATH",
+        help="The archive file to read instead of stdin.",
+    )
+
+    bench_parser = subcommands.add_parser("bench")
+    bench_parser.description = (
+        "Measures an instance's throughput and latencies with the requests that "
+        "are configured in the bench section and compares them to the stored "
+        "baseline for the installed version."
+    )
+    bench_parser.set_defaults(plan_factory=make_bench_plan)
+    add_id_arg(bench_parser)
+    bench_parser.add_argument(
+        "--concurrency", type=int, metavar="NUMBER",
+        help="The number of concurrent clients.",
+    )
+    bench_parser.add_argument(
+        "--duration", type=float, metavar="SECONDS",
+        help="The duration of the benchmark.",
+    )
+    bench_parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Stores the result as baseline for the installed version.",
+    )
+
+    clone_parser = subcommands.add_parser("clone")
+    clone_parser.description = (
+        "Creates a new instance as copy of an existing one, e.g. for staging "
+        "purposes. Files are copied as reflinks where the filesystem supports it."
+    )
+    clone_parser.set_defaults(plan_factory=make_clone_plan)
+    add_id_arg(clone_parser)
+    clone_parser.add_argument(
+        "--clone-id", type=int, help="Specifies the id of the new instance."
+    )
+    clone_parser.add_argument(
+        "--clone-name", help="Specifies the name of the new instance."
+    )
+
+    diagnose_parser = subcommands.add_parser("diagnose")
+    diagnose_parser.description = (
+        "Captures thread dumps and class histograms of running instances with "
+        "jcmd, stores them in the state directory and summarizes the busiest "
+        "threads and the largest heap consumers."
+    )
+    diagnose_parser.set_defaults(plan_factory=make_diagnose_plan)
+    diagnose_selection = diagnose_parser.add_mutually_exclusive_group()
+    add_id_arg(diagnose_selection)
+    diagnose_selection.add_argument(
+        "--all", action="store_true", help="Diagnoses all running instances."
+    )
+    diagnose_parser.add_argument(
+        "--heap-dump",
+        action="store_true",
+        help="Also writes a heap dump of each instance, this pauses an instance "
+        "for a while.",
+    )
+
+    events_parser = subcommands.add_parser("events")
+    events_parser.description = (
+        "Reports restart loops, OOM kills, failures and slow starts of the "
+        "instances' systemd units from the journal entries since the last "
+        "invocation."
+    )
+    events_parser.set_defaults(plan_factory=make_events_plan)
+    events_parser.add_argument(
+        "--journal-export",
+        type=Path,
+        metavar="FILEPATH",
+        help="A file with entries as written by journalctl --output=json that is "
+        "read as a whole instead of the journal, the position of the last "
+        "invocation is neither considered nor updated.",
+    )
+    events_parser.add_argument(
+        "--from-start",
+        action="store_true",
+        help="Ignores where the last invocation stopped reading.",
+    )
+
+    gc_parser = subcommands.add_parser("gc")
+    gc_parser.description = (
+        "Summarizes the GC logs of instances with pause time percentiles, the "
+        "allocation rate and the heap occupancy after collections to review "
+        "their XmX values."
+    )
+    gc_parser.set_defaults(plan_factory=make_gc_plan)
+    gc_selection = gc_parser.add_mutually_exclusive_group()
+    add_id_arg(gc_selection)
+    gc_selection.add_argument(
+        "--all", action="store_true", help="Summarizes the GC logs of all instances."
+    )
+
     install_parser = subcommands.add_parser("install")
     install_parser.description = "Installs a new eXist-db instance."
 
@@ -278,6 +796,9 @@ def make_argparser(config: ConfigParser) -> argparse.ArgumentParser:
         default=config.get("exist-db", "XmX_default"),
         help="Specifies the assigned XmX value for the new instance.",
     )
+    add_jvm_args(install_parser)
+    add_resource_args(install_parser)
+    add_dry_run_arg(install_parser)
 
     list_parser = subcommands.add_parser("list")
     list_parser.description = "Lists all installed instances."
@@ -285,7 +806,90 @@ def make_argparser(config: ConfigParser) -> argparse.ArgumentParser:
     list_parser.add_argument(
         "--paths",
         action="store_true",
-        help="Also displays relevant paths of an instance."
+        help="Also displays relevant paths of an instance and the disk space that "
+        "their content occupies."
+    )
+
+    logs_parser = subcommands.add_parser("logs")
+    logs_parser.description = "Maintains the aggregated log folders of instances."
+    logs_subcommands = logs_parser.add_subparsers()
+
+    logs_rotate_parser = logs_subcommands.add_parser("rotate")
+    logs_rotate_parser.description = (
+        "Rotates log files that exceed the configured size, compresses those "
+        "that aren't written anymore with parallel processes at a low priority "
+        "and deletes expired ones."
+    )
+    logs_rotate_parser.set_defaults(plan_factory=make_logs_rotate_plan)
+    logs_rotate_selection = logs_rotate_parser.add_mutually_exclusive_group()
+    add_id_arg(logs_rotate_selection)
+    logs_rotate_selection.add_argument(
+        "--all", action="store_true", help="Rotates the logs of all instances."
+    )
+
+    reconcile_parser = subcommands.add_parser("reconcile")
+    reconcile_parser.description = (
+        "Compares the configurations, links, permissions and systemd settings of "
+        "instances with the state that derives from the configuration file and "
+        "the instances' settings and corrects only the found differences. "
+        "Instances are restarted if their eXist-db or Jetty configuration changed."
+    )
+    reconcile_parser.set_defaults(plan_factory=make_reconcile_plan)
+    reconcile_selection = reconcile_parser.add_mutually_exclusive_group()
+    add_id_arg(reconcile_selection)
+    reconcile_selection.add_argument(
+        "--all", action="store_true", help="Reconciles all instances."
+    )
+    reconcile_parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only reports the drift without correcting it.",
+    )
+
+    snapshots_parser = subcommands.add_parser("snapshots")
+    snapshots_parser.description = (
+        "Manages the folders that upgrades and restores keep with a datetime "
+        "suffix in an instance's directory."
+    )
+    snapshots_subcommands = snapshots_parser.add_subparsers()
+
+    snapshots_list_parser = snapshots_subcommands.add_parser("list")
+    snapshots_list_parser.description = (
+        "Lists the snapshots of all or one instance with their age and size."
+    )
+    snapshots_list_parser.set_defaults(plan_factory=make_snapshots_list_plan)
+    add_id_arg(snapshots_list_parser)
+
+    snapshots_prune_parser = snapshots_subcommands.add_parser("prune")
+    snapshots_prune_parser.description = (
+        "Removes the snapshots that aren't retained, the folders are moved to a "
+        "trash on the same filesystem and deleted in the background."
+    )
+    snapshots_prune_parser.set_defaults(plan_factory=make_snapshots_prune_plan)
+    snapshots_prune_selection = snapshots_prune_parser.add_mutually_exclusive_group()
+    add_id_arg(snapshots_prune_selection)
+    snapshots_prune_selection.add_argument(
+        "--all", action="store_true", help="Prunes the snapshots of all instances."
+    )
+    snapshots_prune_parser.add_argument(
+        "--keep", type=int, metavar="NUMBER",
+        help="The number of the newest snapshots that are retained.",
+    )
+    snapshots_prune_parser.add_argument(
+        "--max-age", type=int, metavar="DAYS",
+        help="Snapshots that are younger are retained as well.",
+    )
+
+    snapshots_restore_parser = snapshots_subcommands.add_parser("restore")
+    snapshots_restore_parser.description = (
+        "Stops an instance and swaps its folders with those of a snapshot. The "
+        "replaced folders are kept as a new snapshot."
+    )
+    snapshots_restore_parser.set_defaults(plan_factory=make_snapshots_restore_plan)
+    add_id_arg(snapshots_restore_parser)
+    snapshots_restore_parser.add_argument(
+        "--snapshot", metavar="SUFFIX",
+        help="The snapshot's datetime suffix as displayed by the list subcommand.",
     )
 
     template_parser = subcommands.add_parser("template")
@@ -295,16 +899,58 @@ def make_argparser(config: ConfigParser) -> argparse.ArgumentParser:
     template_parser.set_defaults(plan_factory=make_template_plan)
     template_parser.add_argument("name", choices=tuple(x for x in TEMPLATES))
 
+    trash_parser = subcommands.add_parser("trash")
+    trash_parser.description = (
+        "Deleted instances and folders are moved to a trash folder at the root "
+        "of their filesystem and purged in the background."
+    )
+    trash_subcommands = trash_parser.add_subparsers()
+
+    trash_purge_parser = trash_subcommands.add_parser("purge")
+    trash_purge_parser.description = (
+        "Deletes the content of all trash folders with parallel threads."
+    )
+    trash_purge_parser.set_defaults(plan_factory=make_trash_purge_plan)
+
+    trash_status_parser = trash_subcommands.add_parser("status")
+    trash_status_parser.description = (
+        "Displays the trash folders with the disk space that is pending to be "
+        "freed and whether a purge is running."
+    )
+    trash_status_parser.set_defaults(plan_factory=make_trash_status_plan)
+
+    tune_parser = subcommands.add_parser("tune")
+    tune_parser.description = (
+        "Changes performance related settings of an instance. Resource controls "
+        "are applied immediately, the instance is restarted if its effective "
+        "JVM options or the cache sizes that are derived from XmX changed."
+    )
+    tune_parser.set_defaults(plan_factory=make_tune_plan)
+    add_id_arg(tune_parser)
+    tune_parser.add_argument(
+        "--xmx", metavar="VALUE", help="Specifies the assigned XmX value."
+    )
+    add_jvm_args(tune_parser)
+    add_resource_args(tune_parser)
+
     uninstall_parser = subcommands.add_parser("uninstall")
     uninstall_parser.description = "Uninstalls an existing instance."
     uninstall_parser.set_defaults(plan_factory=make_uninstall_plan)
     add_id_arg(uninstall_parser)
+    add_dry_run_arg(uninstall_parser)
 
     upgrade_parser = subcommands.add_parser("upgrade")
     upgrade_parser.description = "Upgrades an existing instance to a new version."
     upgrade_parser.set_defaults(plan_factory=make_upgrade_plan)
     add_id_arg(upgrade_parser)
     add_version_arg(upgrade_parser)
+    upgrade_parser.add_argument(
+        "--bench",
+        action="store_true",
+        help="Benchmarks the instance before and after the upgrade and reports "
+        "regressions.",
+    )
+    add_dry_run_arg(upgrade_parser)
 
     return cli_parser
 
@@ -343,6 +989,7 @@ def main(command=sys.argv[0], args=sys.argv[1:]):
             if os.geteuid() != 0:
                 os.execvp("sudo", ["sudo", command] + args)
             config = read_config()
+            configure_command_runner(config)
         else:
             config = {}
 
@@ -0,0 +1,4 @@
+from existance import main
+
+
+main()
@@ -1,44 +1,134 @@
-import csv
+import asyncio
+import grp
+import json
+import os
+import pwd
 import re
 import shutil
+import sys
+import tarfile
 import textwrap
 from abc import ABC, abstractmethod
-from datetime import datetime
-from os import get_terminal_size
-from pathlib import Path
+from base64 import b64encode
+from collections import OrderedDict, namedtuple
+from contextlib import suppress
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from pathlib import Path, PurePosixPath
+from stat import S_ISREG, S_IWGRP
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import monotonic
+from types import SimpleNamespace
+from typing import Callable, Dict, Mapping, Optional, Tuple
 from xml.etree import ElementTree
 
 import requests
 from texttable import Texttable
 
 from existance.constants import (
+    BENCHMARK_DEFAULTS,
+    CACHE_SIZING_DEFAULTS,
+    CLONE_INHERITED_FIELDS,
+    DIAGNOSTICS_DEFAULTS,
+    DISK_SPACE_RESERVE,
+    DISK_USAGE_CACHE_FILENAME,
+    DISTRIBUTION_LINK_NAME,
+    EVENTS_DEFAULTS,
+    EVENTS_STATE_FILENAME,
     EXISTDB_INSTALLER_URL,
+    GC_LOG_FILENAME,
+    GC_LOGGING_DEFAULTS,
+    IMMUTABLE_FILE_SUFFIXES,
+    INSTALLATION_SIZE_ESTIMATE,
+    JETTY_CONFIG_DIRECTORY,
+    JETTY_PROFILES,
+    JETTY_PROPERTIES,
+    JVM_PROFILES,
+    NGINX_MAPPINGS_FILENAME,
+    OVERLAY_COPIED_PATHS,
+    OVERLAY_PRIVATE_DIRECTORIES,
+    PID_DIRECTORY,
     LATEST_EXISTDB_RECORD_URL,
     INSTANCE_PORT_RANGE_START,
-    INSTANCE_SETTINGS_FIELDS,
+    LOG_ROTATION_DEFAULTS,
+    RESTART_REQUIRING_FIELDS,
+    RESTORABLE_FOLDERS,
+    SNAPSHOT_RETENTION_COUNT,
+    SNAPSHOT_SUFFIX_FORMAT,
+    SNAPSHOT_SUFFIX_PATTERN,
+    SNAPSHOTTED_FOLDERS,
+    SYSTEMD_MEMORY_OVERHEAD_MINIMUM,
+    SYSTEMD_RESOURCE_DEFAULTS,
+    SYSTEMD_UNITS_DIRECTORY,
+    TRASH_PURGE_LOCK_FILENAME,
 )
+from existance.diagnostics import (
+    busiest_threads,
+    parse_class_histogram,
+    parse_thread_dump,
+    summarize_gc_log,
+)
+from existance.http_client import (
+    ConnectionPool,
+    HTTPError,
+    measure_load,
+    parse_request_specs,
+    wait_until_reachable,
+)
+from existance.journal import analyze_journal, parse_journal_export
+from existance.settings import InstancesSettings, parse_extra_fields
 from existance.templates import (
-    NGINX_MAPPING_ROUTE,
-    NGINX_MAPPING_STATUS_FILTER,
+    NGINX_MAPPINGS_HEADER,
+    NGINX_VALIDATION_HARNESS,
     TEMPLATES,
+    render_nginx_mapping,
+    render_template,
 )
 from existance.utils import (
+    ArchiveStream,
+    as_user,
+    build_overlay,
+    clone_tree,
+    command_runner,
+    compress_files,
+    discard,
+    disk_usage,
     external_command,
+    find_mountpoint,
+    format_bytes,
+    format_size,
+    instance_options,
     make_password_proposal,
-    relative_path
+    merge_jvm_options,
+    move_to_trash,
+    parse_size,
+    purge_in_background,
+    purge_running,
+    purge_trash,
+    relative_path,
+    run_coroutine,
+    state_directory,
+    trash_directories,
 )
 
 
 is_semantical_version = re.compile(r"^\d+\.\d+(\.\d+)?").match
-is_valid_xmx_value = re.compile(r"^\d+[kmg]]$").match
+is_valid_xmx_value = re.compile(r"^\d+[kKmMgG]$").match
 
 
-csv.register_dialect(
-    "instances_settings",
-    csv.unix_dialect,
-    quoting=csv.QUOTE_NONE,
-    skipinitialspace=True,
-)
+# extraction filters were added with Python 3.12 and backported to some releases
+EXTRACTION_KWARGS = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+
+
+# the kinds are "started", "finished" and "failed" for actions with the duration
+# as detail and "message" and "concluded" for messages with the success as detail
+ProgressEvent = namedtuple("ProgressEvent", ("kind", "subject", "detail"))
+
+# a callable that receives ProgressEvents instead of printing the messages
+progress_listener = ContextVar(
+    "progress_listener", default=None
+)  # type: ContextVar[Optional[Callable[[ProgressEvent], None]]]
 
 
 __all__ = []
@@ -55,8 +145,32 @@ class Abort(Exception):
 
 
 class ActionBase(ABC):
+    # actions that don't change anything on the host are also performed in
+    # simulations of a plan
+    read_only = False
+
     def __init__(self, executor: "PlanExecutor"):
         self.executor = executor
+        # the seconds that were spent waiting for the user's input
+        self.prompted = 0.0
+
+    def workload(self) -> Optional[int]:
+        """ Returns the number of bytes that an action processes if its duration
+            depends on it. """
+        return None
+
+    def prompt(self, message: str, default: Optional[str] = None) -> str:
+        """ Asks the user for a value. If the executor isn't interactive, the
+            default is returned instead or the plan is aborted without one. """
+        if getattr(self.executor, "interactive", True):
+            started = monotonic()
+            try:
+                return input(message)
+            finally:
+                self.prompted += monotonic() - started
+        if default is None:
+            raise Abort(f"A value is required but can't be asked for: {message.strip()}")
+        return default
 
     def __getattr__(self, item):
         if hasattr(self.executor, item):
@@ -76,16 +190,24 @@ class Action(ActionBase):
         pass
 
 
-def counter(action_cls: type) -> type:
+def counter(action_cls: type, reversible: bool = False) -> type:
+    """ Returns an action that performs the given action's undo. Only if it's
+        reversible, the given action's do is performed on a rollback. """
+
     class CounterAction(Action):
+        counterpart = action_cls
+
         def __init__(self, executor):
+            super().__init__(executor)
             self._action = action_cls(executor)
 
         def do(self):
             self._action.undo()
 
         def undo(self):
-            raise RuntimeError("This code path is not expected yet.")
+            if not reversible:
+                raise RuntimeError("This code path is not expected yet.")
+            self._action.do()
 
     return CounterAction
 
@@ -104,10 +226,17 @@ class ConcludedMessage:
         self.message = message
 
     def __enter__(self):
-        print(self.message, end=" ", flush=True)
+        listener = progress_listener.get()
+        if listener is None:
+            print(self.message, end=" ", flush=True)
+        else:
+            listener(ProgressEvent("message", self.message, None))
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if exc_type is None:
+        listener = progress_listener.get()
+        if listener is not None:
+            listener(ProgressEvent("concluded", self.message, exc_type is None))
+        elif exc_type is None:
             print("\033[92m✔\033[0m", flush=True)
         else:
             print("\033[91m✖️\033[0m", flush=True)
@@ -118,6 +247,151 @@ def export(obj):
     return obj
 
 
+def gc_logging_options(config, log_directory: Path, row: dict) -> str:
+    """ Returns the JVM option that enables the rotated GC log of an instance or
+        an empty string if it's disabled. It contains commas and is therefore
+        only written to the instance's environment file. """
+    options = {
+        **GC_LOGGING_DEFAULTS,
+        **instance_options(config, "gc-logging", row["id"]),
+    }
+    if options["enabled"].lower() not in ("1", "yes", "true", "on"):
+        return ""
+    log_file = (
+        aggregated_log_directory(log_directory, row["id"], row["name"])
+        / GC_LOG_FILENAME
+    )
+    return (
+        f"-Xlog:{options['selectors']}:file={log_file}:time,uptime,level,tags"
+        f":filecount={options['filecount']},filesize={options['filesize']}"
+    )
+
+
+def instance_executor(executor, _id: int, *actions: type) -> SimpleNamespace:
+    """ Returns a namespace that can serve as executor for actions that concern
+        another instance than the one designated by the arguments, the given
+        actions are performed with it. """
+    args = SimpleNamespace(**vars(executor.args))
+    args.id, args.name = _id, executor.context.instances_settings[_id]["name"]
+    result = SimpleNamespace(
+        args=args,
+        config=executor.config,
+        context=SimpleNamespace(instances_settings=executor.context.instances_settings),
+        interactive=getattr(executor, "interactive", True),
+    )
+    for action in actions:
+        action(result).do()
+    return result
+
+
+def instance_pid(_id: int) -> Optional[int]:
+    """ Returns the process id of a running instance from its pid file that
+        ``existctl`` maintains. """
+    pid_file = Path(PID_DIRECTORY) / f"{_id}.pid"
+    try:
+        pid = int(pid_file.read_text().strip())
+    except (OSError, ValueError):
+        return None
+    return pid if Path(f"/proc/{pid}").exists() else None
+
+
+def installation_required(context: SimpleNamespace) -> bool:
+    """ Tells whether eXist-db needs to be installed, i.e. unless the shared
+        distribution of the designated version exists already. """
+    return context.distribution_dir is None or not context.distribution_dir.exists()
+
+
+def jetty_settings(config, _id: int) -> Tuple[str, "OrderedDict[str, str]"]:
+    """ Returns the name of an instance's Jetty profile and the values of its
+        options. Options in the ``jetty`` section of an instance override those
+        of the profile. """
+    options = instance_options(config, "jetty", _id)
+    name = options.pop("profile", "default")
+    if name not in JETTY_PROFILES and not config.has_section(f"jetty-profile:{name}"):
+        raise Abort(f"Unknown Jetty profile: {name}")
+
+    result = OrderedDict()
+    for profile in dict.fromkeys(("default", name)):
+        result.update(JETTY_PROFILES.get(profile, {}))
+        if config.has_section(f"jetty-profile:{profile}"):
+            result.update(config.items(f"jetty-profile:{profile}", raw=True))
+    result.update(options)
+
+    for option, value in result.items():
+        if option not in JETTY_PROPERTIES:
+            raise Abort(f"Unknown option for the Jetty configuration: {option}")
+        if not re.match(r"^-?\d+$", value):
+            raise Abort(f"The Jetty option {option} must be an integer: {value}")
+    return name, result
+
+
+def read_jetty_settings(installation_dir: Path) -> "OrderedDict[str, str]":
+    """ Returns the values of the Jetty profiles' options that are set in an
+        installation's configuration, options whose property isn't found are
+        omitted. """
+    result, trees = OrderedDict(), {}
+    for option, (filename, name) in JETTY_PROPERTIES.items():
+        path = installation_dir / JETTY_CONFIG_DIRECTORY / filename
+        if path not in trees:
+            trees[path] = ElementTree.parse(path) if path.exists() else None
+        element = (
+            None if trees[path] is None
+            else trees[path].find(f".//Property[@name='{name}']")
+        )
+        if element is not None:
+            result[option] = element.get("default")
+    return result
+
+
+def occupied_bytes(*directories: Path) -> int:
+    return sum(disk_usage(directories).values())
+
+
+def aggregated_log_directory(log_directory: Path, _id: int, name: str) -> Path:
+    return Path(log_directory) / f"{_id}_{name}"
+
+
+def find_snapshots(instance_dir: Path) -> "OrderedDict[str, dict]":
+    """ Returns the folders that were kept with a datetime suffix by upgrades
+        and restores in an instance's directory, grouped by their suffix and
+        ordered from the oldest to the newest. """
+    match = re.compile(
+        rf"^({'|'.join(SNAPSHOTTED_FOLDERS)}){SNAPSHOT_SUFFIX_PATTERN}$"
+    ).match
+    result = {}
+    if instance_dir.is_dir():
+        for path in instance_dir.iterdir():
+            matched = match(path.name)
+            if matched is not None and path.is_dir():
+                result.setdefault(matched.group(2), {})[matched.group(1)] = path
+    return OrderedDict(sorted(result.items()))
+
+
+def snapshot_age(name: str) -> timedelta:
+    return datetime.now() - datetime.strptime(name, SNAPSHOT_SUFFIX_FORMAT[1:])
+
+
+def throughput_report(verb: str, archive_stream: ArchiveStream, duration: float) -> str:
+    megabytes = archive_stream.raw_bytes / 1024 ** 2
+    compressed = archive_stream.compressed_bytes / 1024 ** 2
+    return (
+        f"{verb} {megabytes:.1f} MB ({compressed:.1f} MB compressed) in "
+        f"{duration:.1f} s, {megabytes / max(duration, 0.001):.1f} MB/s."
+    )
+
+
+def xml_equals(a: ElementTree.Element, b: ElementTree.Element) -> bool:
+    """ Compares two elements' names, attributes and children while ignoring
+        whitespace around them. """
+    return (
+        a.tag == b.tag
+        and a.attrib == b.attrib
+        and (a.text or "").strip() == (b.text or "").strip()
+        and len(a) == len(b)
+        and all(xml_equals(x, y) for x, y in zip(a, b))
+    )
+
+
 #
 
 
@@ -127,70 +401,229 @@ class AddBackupTask(EphemeralAction):
     def do(self):
         with ConcludedMessage("Adding backup job to exist's config."):
             tree = ElementTree.parse(self.context.existdb_config)
+            if self.patch(tree):
+                tree.write(self.context.existdb_config)
+
+    def drift(self) -> Optional[str]:
+        if self.patch(ElementTree.parse(self.context.existdb_config)):
+            return "The backup job is missing or differs."
+
+    def patch(self, tree: ElementTree.ElementTree) -> bool:
+        scheduler = tree.find("./scheduler")
+        suffix = "_consistency_check_and_backup"
+        name = f"{self.args.name}{suffix}"
+
+        job = ElementTree.Element("job")
+        job.set("name", name)
+        job.set("type", "system")
+        job.set("class", "org.exist.storage.ConsistencyCheckTask")
+        job.set("period", str(4 * 60 * 60 * 1000))  # every 4h
+        job.set(
+            "delay",
+            str((self.args.id - INSTANCE_PORT_RANGE_START) * 15 * 60 * 1000),
+        )  # 15min offset per instance
+
+        for key, value in (
+            ("output", "../backup"),
+            ("backup", "yes"),
+            ("incremental", "yes"),
+            ("incremental-check", "yes"),
+            ("max", "6"),
+        ):
+            parameter = ElementTree.SubElement(job, "parameter")
+            parameter.set("name", key)
+            parameter.set("value", value)
+
+        # a clone's copied configuration contains the job of its source
+        existing = [
+            x for x in scheduler.findall("./job")
+            if x.get("name", "").endswith(suffix)
+        ]
+        if len(existing) == 1 and xml_equals(existing[0], job):
+            return False
 
-            scheduler = tree.find("./scheduler")
-
-            job = ElementTree.SubElement(scheduler, "job")
-            job.set("name", f"{self.args.name}_consistency_check_and_backup")
-            job.set("type", "system")
-            job.set("class", "org.exist.storage.ConsistencyCheckTask")
-            job.set("period", str(4 * 60 * 60 * 1000))  # every 4h
-            job.set(
-                "delay",
-                str((self.args.id - INSTANCE_PORT_RANGE_START) * 15 * 60 * 1000),
-            )  # 15min offset per instance
-
-            for name, value in (
-                ("output", "../backup"),
-                ("backup", "yes"),
-                ("incremental", "yes"),
-                ("incremental-check", "yes"),
-                ("max", "6"),
-            ):
-                parameter = ElementTree.SubElement(job, "parameter")
-                parameter.set("name", name)
-                parameter.set("value", value)
+        for element in existing:
+            scheduler.remove(element)
+        scheduler.append(job)
+        return True
+
+
+@export
+class BenchmarkInstance(EphemeralAction):
+    """ Replays the configured requests against an instance and reports the
+        throughput and latencies in comparison to a stored baseline. """
+
+    phase = None
+
+    def do(self):
+        options = {
+            **BENCHMARK_DEFAULTS,
+            **instance_options(self.config, "bench", self.args.id),
+        }
+        for option in ("concurrency", "duration"):
+            if getattr(self.args, option, None) is not None:
+                options[option] = getattr(self.args, option)
+        requests_specs = parse_request_specs(
+            options.get("requests", ""), self.args.name
+        )
+        if not requests_specs:
+            print("No requests for benchmarks are configured.")
+            return
+
+        version = self._version()
+        with ConcludedMessage(
+            f"Benchmarking instance with {options['concurrency']} concurrent clients "
+            f"for {options['duration']} s."
+        ):
+            try:
+                result = run_coroutine(self._measure(requests_specs, options))
+            except HTTPError as e:
+                raise Abort(f"The instance can't be benchmarked: {e}")
+        self.context.benchmark = result
+
+        baselines_path = state_directory(self.config, "benchmarks") / f"{self.args.id}.json"
+        baselines = json.loads(baselines_path.read_text()) if baselines_path.exists() else {}
+
+        if self.phase == "after":
+            reference, reference_label = self.context.benchmark_before, "before upgrade"
+        else:
+            reference, reference_label = baselines.get(version), f"baseline {version}"
+        self._report(result, reference, reference_label)
+
+        if self.phase == "before":
+            self.context.benchmark_before = result
+        if self.phase is not None or getattr(self.args, "save_baseline", False):
+            baselines[version] = result
+            baselines_path.write_text(json.dumps(baselines, indent=2))
+
+        if reference is not None:
+            self._flag_regression(result, reference, float(options["regression_threshold"]))
+
+    async def _measure(self, requests_specs, options) -> dict:
+        await wait_until_reachable(
+            "localhost", self.args.id, f"/{self.args.name}/",
+            timeout=float(options["timeout"]),
+        )
+        return await measure_load(
+            "localhost", self.args.id, requests_specs,
+            int(options["concurrency"]), float(options["duration"]),
+        )
+
+    def _version(self) -> str:
+        if self.phase == "after":
+            return self.args.version
+        settings = self.context.instances_settings[self.args.id]
+        return settings.get("version") or "unknown"
+
+    @staticmethod
+    def _report(result: dict, reference: Optional[dict], reference_label: str):
+        table = Texttable(max_width=shutil.get_terminal_size().columns - 2)
+        table.set_deco(Texttable.HEADER | Texttable.VLINES)
+        columns = [("measure", "l"), ("result", "r")]
+        if reference is not None:
+            columns.append((reference_label, "r"))
+        table.header([x[0] for x in columns])
+        table.set_cols_align([x[1] for x in columns])
+
+        for key, label, factor, unit in (
+            ("requests", "requests", 1, ""),
+            ("errors", "errors", 1, ""),
+            ("throughput", "throughput", 1, " req/s"),
+            ("p50", "p50 latency", 1000, " ms"),
+            ("p95", "p95 latency", 1000, " ms"),
+            ("p99", "p99 latency", 1000, " ms"),
+            ("max", "max latency", 1000, " ms"),
+        ):
+            row = [label, f"{result[key] * factor:.1f}{unit}"]
+            if reference is not None:
+                row.append(f"{reference[key] * factor:.1f}{unit}")
+            table.add_row(row)
+
+        print("\n" + table.draw() + "\n")
+
+    @staticmethod
+    def _flag_regression(result: dict, reference: dict, threshold: float):
+        regressions = []
+        if result["throughput"] < reference["throughput"] * (1 - threshold):
+            regressions.append("throughput")
+        for key in ("p50", "p95", "p99"):
+            if result[key] > reference[key] * (1 + threshold):
+                regressions.append(f"{key} latency")
+        if regressions:
+            print(
+                "\033[91mPerformance regression of more than "
+                f"{threshold:.0%} in: {', '.join(regressions)}\033[0m"
+            )
+
+
+@export
+class BenchmarkBeforeUpgrade(BenchmarkInstance):
+    phase = "before"
+
+
+@export
+class BenchmarkAfterUpgrade(BenchmarkInstance):
+    phase = "after"
 
-            tree.write(self.context.existdb_config)
 
+@export
+class BuildInstanceOverlay(Action):
+    """ Creates an instance's installation folder as overlay of a shared and
+        read-only distribution if the shared layout is used. """
 
-class AddProxyMapping(Action):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # TODO make this configurable
-        self.mapping_path = (
-            Path("/etc") / "nginx" / "proxy-mappings" / str(self.args.id)
-        )
+        self.built = False
 
     def do(self):
-        snippet = NGINX_MAPPING_ROUTE
-        trusted_clients = [
-            x
-            for x in self.config.get("nginx", "trusted_clients", fallback="").split(",")
-            if x
-        ]
-        if trusted_clients:
-            snippet += NGINX_MAPPING_STATUS_FILTER
+        distribution_dir = self.context.distribution_dir
+        if distribution_dir is None:
+            return
 
-        snippet = snippet.replace("<instance_id>", str(self.args.id))
-        snippet = snippet.replace("<instance_name>", self.args.name)
-        snippet = snippet.replace(
-            "allow <trusted_client>;", " ".join(f"allow {x};" for x in trusted_clients)
+        with ConcludedMessage(f"Protecting the distribution {distribution_dir}."):
+            external_command("chmod", "-R", "a-w", distribution_dir)
+
+        copied_paths = OVERLAY_COPIED_PATHS + tuple(
+            x.strip()
+            for x in self.config.get(
+                "exist-db", "overlay_copied_paths", fallback=""
+            ).split(",")
+            if x.strip()
         )
+        installation_dir = self.context.installation_dir
+        with ConcludedMessage(f"Building overlay at {installation_dir}."):
+            self.built = True
+            linked, copied = build_overlay(
+                distribution_dir, installation_dir, copied_paths,
+                OVERLAY_PRIVATE_DIRECTORIES,
+            )
+            (installation_dir / DISTRIBUTION_LINK_NAME).symlink_to(distribution_dir)
+            print(f"({linked} linked, {copied} copied)", end=" ")
 
-        with ConcludedMessage("Writing instance specific nginx config."):
-            with self.mapping_path.open("wt") as f:
-                print(snippet, file=f)
-            external_command("chown", f"root:{self.args.group}", self.mapping_path)
-            external_command("chmod", "ug=rw,o=r", self.mapping_path)
+        # the distribution's conf.xml refers to the data of the instance that
+        # it was installed for; a relative path also remains valid in clones
+        data_dir = str(
+            relative_path(self.context.data_dir, self.context.installation_dir)
+        )
+        with ConcludedMessage(f"Setting the data directory to {data_dir}."):
+            tree = ElementTree.parse(self.context.existdb_config)
+            db_connection = tree.find("./db-connection")
+            db_connection.set("files", data_dir)
+            recovery = db_connection.find("./recovery")
+            if recovery is not None:
+                recovery.set("journal-dir", data_dir)
+            tree.write(self.context.existdb_config)
 
     def undo(self):
-        with ConcludedMessage("Removing instance specific nginx config."):
-            self.mapping_path.unlink()
+        if self.built:
+            with ConcludedMessage("Removing overlay."):
+                discard(self.context.installation_dir)
 
 
 @export
 class CalculateTargetPaths(EphemeralAction):
+    read_only = True
+
     def do(self):
         instance_base = self.context.instance_dir = self.args.base_directory / self.config[
             "exist-db"
@@ -217,6 +650,448 @@ class CalculateTargetPaths(EphemeralAction):
             / "exist-webapp-context.xml"
         )
 
+        self.context.distribution_dir = self._distribution_dir()
+        self.context.installer_target = (
+            self.context.distribution_dir or self.context.installation_dir
+        )
+
+    def _distribution_dir(self) -> Optional[Path]:
+        version = getattr(self.args, "version", None)
+        if (
+            version is not None
+            and self.config.get("exist-db", "layout", fallback="standalone") == "shared"
+        ):
+            return (
+                Path(self.config.get(
+                    "exist-db",
+                    "distributions_directory",
+                    fallback=self.args.base_directory / "distributions",
+                ))
+                / version
+            )
+
+        link = self.context.installation_dir / DISTRIBUTION_LINK_NAME
+        if link.is_symlink():
+            return Path(os.readlink(link))
+
+        return None
+
+
+@export
+class CaptureDiagnostics(EphemeralAction):
+    """ Takes thread dumps, class histograms and optionally heap dumps of the
+        selected running instances with ``jcmd``. The instances are inspected
+        concurrently up to a limit so that the pauses don't coincide. The
+        results are stored in the state directory and summarized. """
+
+    def do(self):
+        options = {**DIAGNOSTICS_DEFAULTS}
+        if self.config.has_section("diagnose"):
+            options.update(self.config.items("diagnose", raw=True))
+        command_runner.limits.setdefault("jcmd", int(options["concurrency"]))
+
+        if self.args.all:
+            ids = sorted(self.context.instances_settings)
+        else:
+            ids = [self.args.id]
+
+        pids = {}
+        for _id in ids:
+            pid = instance_pid(_id)
+            if pid is None:
+                print(f"Instance {_id} isn't running.")
+            else:
+                pids[_id] = pid
+        if not pids:
+            return
+
+        timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        directories = {
+            _id: state_directory(self.config, "diagnostics", str(_id), timestamp)
+            for _id in pids
+        }
+        # heap dumps are written by the JVM, like those of the server profile
+        heap_dumps = {
+            _id: instance_executor(self.executor, _id, CalculateTargetPaths)
+            .context.instance_dir / f"heap-{timestamp}.hprof"
+            for _id in pids
+        } if self.args.heap_dump else {}
+
+        async def capture_all():
+            return await asyncio.gather(*(
+                self._capture(
+                    pid,
+                    directories[_id],
+                    heap_dumps.get(_id),
+                    float(options["sample_interval"]),
+                )
+                for _id, pid in pids.items()
+            ))
+
+        with ConcludedMessage(f"Capturing diagnostics of {len(pids)} instance(s)."):
+            results = run_coroutine(capture_all())
+
+        self.context.diagnostics = directories
+        for _id, (threads, histogram, errors) in zip(pids, results):
+            self._report(
+                _id, directories[_id], threads, histogram, errors, int(options["top"])
+            )
+            if _id in heap_dumps and heap_dumps[_id].exists():
+                print(f"Heap dump: {heap_dumps[_id]}")
+
+    async def _capture(
+        self, pid: int, directory: Path, heap_dump: Optional[Path], interval: float
+    ) -> tuple:
+        errors = []
+
+        async def jcmd(*args) -> str:
+            result = await command_runner.execute(
+                as_user(self.args.user, "jcmd", pid, *args),
+                capture_output=True, text=True, check=False,
+            )
+            if result.returncode:
+                errors.append(f"jcmd {args[0]}: {(result.stdout or result.stderr).strip()}")
+                return ""
+            return result.stdout
+
+        # the CPU time of threads is measured over the interval between two dumps
+        first_dump = await jcmd("Thread.print", "-l")
+        await asyncio.sleep(interval)
+        second_dump = await jcmd("Thread.print", "-l")
+        histogram = await jcmd("GC.class_histogram")
+        if heap_dump is not None:
+            await jcmd("GC.heap_dump", heap_dump)
+
+        (directory / "threads-1.txt").write_text(first_dump)
+        (directory / "threads-2.txt").write_text(second_dump)
+        (directory / "class-histogram.txt").write_text(histogram)
+        return (
+            (parse_thread_dump(first_dump), parse_thread_dump(second_dump)),
+            parse_class_histogram(histogram),
+            errors,
+        )
+
+    def _report(self, _id, directory, threads, histogram, errors, top):
+        name = self.context.instances_settings[_id]["name"]
+        print(f"\n\033[1mInstance {_id} ({name})\033[0m, stored in {directory}")
+        for error in errors:
+            print(f"\033[91m{error}\033[0m")
+
+        first, second = threads
+        if second:
+            states = OrderedDict()
+            for thread in second:
+                states[thread.state] = states.get(thread.state, 0) + 1
+            print(
+                f"{len(second)} threads: "
+                + ", ".join(f"{v} {k or 'unknown'}" for k, v in states.items())
+            )
+            busiest = [x for x in busiest_threads(first, second, top) if x.cpu > 0]
+            if busiest:
+                table = Texttable(max_width=shutil.get_terminal_size().columns - 2)
+                table.set_deco(Texttable.HEADER | Texttable.VLINES)
+                table.header(("busiest threads", "state", "CPU time"))
+                table.set_cols_align(("l", "l", "r"))
+                for thread in busiest:
+                    table.add_row(
+                        (
+                            thread.name,
+                            thread.state or "unknown",
+                            f"{thread.cpu * 1000:.0f} ms",
+                        )
+                    )
+                print(table.draw())
+
+        if histogram:
+            total = sum(x.bytes for x in histogram)
+            table = Texttable(max_width=shutil.get_terminal_size().columns - 2)
+            table.set_deco(Texttable.HEADER | Texttable.VLINES)
+            table.header(("largest heap consumers", "instances", "size", "share"))
+            table.set_cols_align(("l", "r", "r", "r"))
+            for entry in histogram[:top]:
+                table.add_row((
+                    entry.class_name,
+                    entry.instances,
+                    format_bytes(entry.bytes),
+                    f"{entry.bytes / total:.1%}",
+                ))
+            print(table.draw())
+            print(f"Total: {format_bytes(total)}")
+
+
+@export
+class CheckDiskSpace(EphemeralAction):
+    """ Estimates the disk space that an installation or upgrade needs from the
+        sizes of the involved directories and aborts before anything is changed
+        if a filesystem doesn't provide it. """
+
+    read_only = True
+
+    def do(self):
+        context = self.context
+        upgrade = context.installation_dir.exists()
+
+        with ConcludedMessage("Checking the available disk space."):
+            sizes = disk_usage(
+                (context.installation_dir, context.data_dir) if upgrade else (),
+                cache_file=state_directory(self.config) / DISK_USAGE_CACHE_FILENAME,
+                uncached=(context.data_dir,),
+            )
+
+            needed = []
+            if upgrade:
+                # the data folder is copied as snapshot
+                needed.append((context.data_dir, sizes[context.data_dir]))
+            if installation_required(context):
+                estimate = parse_size(self.config.get(
+                    "existance", "installation_size_estimate",
+                    fallback=INSTALLATION_SIZE_ESTIMATE,
+                ))
+                if upgrade:
+                    estimate = max(estimate, sizes[context.installation_dir])
+                needed.append((context.installer_target, estimate))
+
+            reserve = parse_size(self.config.get(
+                "existance", "disk_space_reserve", fallback=DISK_SPACE_RESERVE
+            ))
+            for filesystem, (needed_bytes, available) in self._group_by_filesystem(
+                needed
+            ).items():
+                print(
+                    f"({format_bytes(needed_bytes)} of {format_bytes(available)} "
+                    f"on {filesystem})",
+                    end=" ",
+                )
+                if needed_bytes + reserve > available:
+                    raise Abort(
+                        f"{format_bytes(needed_bytes)} and a reserve of "
+                        f"{format_bytes(reserve)} are needed on {filesystem}, but "
+                        f"only {format_bytes(available)} are available."
+                    )
+
+    @staticmethod
+    def _group_by_filesystem(needed) -> "OrderedDict[Path, Tuple[int, int]]":
+        result, mountpoints = OrderedDict(), {}
+        for path, size in needed:
+            while not path.exists():
+                path = path.parent
+            device = path.stat().st_dev
+            if device not in mountpoints:
+                mountpoint = find_mountpoint(path)
+                statvfs = os.statvfs(path)
+                mountpoints[device] = mountpoint
+                result[mountpoint] = (0, statvfs.f_bavail * statvfs.f_frsize)
+            needed_bytes, available = result[mountpoints[device]]
+            result[mountpoints[device]] = (needed_bytes + size, available)
+        return result
+
+
+@export
+class CloneInstanceFiles(EphemeralAction):
+    """ Copies the source instance's installation and data directories into the
+        clone's instance directory. The source instance is stopped meanwhile if
+        it was running. """
+
+    def do(self):
+        source = self.context.clone_source
+        was_active = not external_command(
+            "systemctl", "is-active", "--quiet", f"existdb@{source.id}", check=False
+        ).returncode
+
+        if was_active:
+            with ConcludedMessage("Stopping source instance."):
+                external_command("systemctl", "stop", f"existdb@{source.id}")
+        try:
+            for source_dir, target_dir, hardlinked_suffixes in (
+                (source.installation_dir, self.context.installation_dir,
+                 IMMUTABLE_FILE_SUFFIXES),
+                (source.data_dir, self.context.data_dir, ()),
+            ):
+                with ConcludedMessage(f"Cloning {source_dir} to {target_dir}."):
+                    started = monotonic()
+                    method = clone_tree(source_dir, target_dir, hardlinked_suffixes)
+                    print(f"({method}, {monotonic() - started:.1f} s)", end=" ")
+        finally:
+            if was_active:
+                with ConcludedMessage("Starting source instance."):
+                    external_command("systemctl", "start", f"existdb@{source.id}")
+
+    def workload(self) -> int:
+        source = self.context.clone_source
+        return occupied_bytes(source.installation_dir, source.data_dir)
+
+
+@export
+class ConfigureCacheSizes(EphemeralAction):
+    """ Sets eXist-db's cache sizes and pool limits in proportion to the
+        instance's XmX value. """
+
+    def do(self):
+        with ConcludedMessage(f"Adjusting cache sizes and pools to XmX {self._xmx}."):
+            tree = ElementTree.parse(self.context.existdb_config)
+            if self.patch(tree):
+                tree.write(self.context.existdb_config)
+                self.context.restart_required = True
+
+    def drift(self) -> Optional[str]:
+        if self.patch(ElementTree.parse(self.context.existdb_config)):
+            return f"The cache sizes and pools don't match XmX {self._xmx}."
+
+    def patch(self, tree: ElementTree.ElementTree) -> bool:
+        xmx = self._xmx
+        heap, gigabytes = parse_size(xmx), parse_size(xmx) / 1024 ** 3
+
+        options = {
+            k: float(self.config.get("cache-sizing", k, fallback=v))
+            for k, v in CACHE_SIZING_DEFAULTS.items()
+        }
+        values = {
+            ".": {
+                "cacheSize": f"{int(heap * options['cache_size_ratio']) // 1024 ** 2}M",
+                "collectionCache":
+                    f"{int(heap * options['collection_cache_ratio']) // 1024 ** 2}M",
+            },
+            "./pool": {
+                "max": str(min(max(
+                    int(options["minimal_brokers"]),
+                    round(gigabytes * options["brokers_per_gigabyte"]),
+                ), int(options["maximal_brokers"]))),
+            },
+            "./query-pool": {
+                "size": str(min(max(
+                    int(options["minimal_query_pool_size"]),
+                    round(gigabytes * options["query_pool_size_per_gigabyte"]),
+                ), int(options["maximal_query_pool_size"]))),
+            },
+        }
+
+        db_connection = tree.find("./db-connection")
+        changed = False
+        for path, attributes in values.items():
+            element = db_connection.find(path)
+            if element is None:
+                continue
+            for name, value in attributes.items():
+                if element.get(name) != value:
+                    element.set(name, value)
+                    changed = True
+        return changed
+
+    @property
+    def _xmx(self) -> str:
+        xmx = getattr(self.args, "xmx", None)
+        if xmx is None:
+            xmx = self.context.instances_settings[self.args.id]["xmx"]
+        return xmx
+
+
+@export
+class ConfigureJetty(EphemeralAction):
+    """ Sets the limits of Jetty's thread pool and HTTP connector in an
+        instance's configuration to the values of its Jetty profile. As the
+        installed files are patched, this is repeated after upgrades. """
+
+    def do(self):
+        name, settings = jetty_settings(self.config, self.args.id)
+        with ConcludedMessage(f"Applying Jetty profile {name}."):
+            for path, tree in self.patch(settings).items():
+                # never write through a link into a shared distribution
+                if path.is_symlink():
+                    path.unlink()
+                tree.write(path)
+                self.context.restart_required = True
+
+    def drift(self) -> Optional[str]:
+        name, settings = jetty_settings(self.config, self.args.id)
+        if self.patch(settings):
+            return f"The Jetty configuration doesn't match the profile {name}."
+
+    def patch(
+        self, settings: Mapping[str, str]
+    ) -> Dict[Path, ElementTree.ElementTree]:
+        """ Returns the parsed files whose properties were changed. """
+        directory = self.context.installation_dir / JETTY_CONFIG_DIRECTORY
+        trees, changed = {}, {}
+        for option, value in settings.items():
+            filename, name = JETTY_PROPERTIES[option]
+            path = directory / filename
+            if path not in trees:
+                trees[path] = ElementTree.parse(path) if path.exists() else None
+            if trees[path] is None:
+                continue
+            for element in trees[path].iterfind(f".//Property[@name='{name}']"):
+                if element.get("default") != value:
+                    element.set("default", value)
+                    changed[path] = trees[path]
+        return changed
+
+
+@export
+class ConfigureResourceControls(Action):
+    """ Writes a drop-in for the instance's systemd unit with its resource
+        controls. The changed controls are applied to a running instance without
+        restarting it. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dropin_path = (
+            Path(SYSTEMD_UNITS_DIRECTORY)
+            / f"existdb@{self.args.id}.service.d"
+            / "50-existance-resources.conf"
+        )
+        self.previous = None
+
+    def do(self):
+        controls = self.context.resource_controls
+        content = self._content()
+
+        if self.dropin_path.exists():
+            self.previous = self.dropin_path.read_text()
+            if self.previous == content:
+                return
+
+        with ConcludedMessage("Writing resource controls for systemd unit."):
+            self.dropin_path.parent.mkdir(exist_ok=True)
+            self.dropin_path.write_text(content)
+            external_command("systemctl", "daemon-reload")
+        self._apply_at_runtime(controls)
+
+    def undo(self):
+        with ConcludedMessage("Restoring resource controls for systemd unit."):
+            if self.previous is None:
+                if self.dropin_path.exists():
+                    self.dropin_path.unlink()
+                parent = self.dropin_path.parent
+                if parent.exists() and not any(parent.iterdir()):
+                    parent.rmdir()
+            else:
+                self.dropin_path.write_text(self.previous)
+            external_command("systemctl", "daemon-reload")
+
+    def drift(self) -> Optional[str]:
+        if not self.dropin_path.exists():
+            return f"{self.dropin_path} is missing."
+        if self.dropin_path.read_text() != self._content():
+            return f"{self.dropin_path} differs from the resource controls."
+
+    def _apply_at_runtime(self, controls):
+        unit = f"existdb@{self.args.id}"
+        if external_command(
+            "systemctl", "is-active", "--quiet", unit, check=False
+        ).returncode:
+            return
+
+        with ConcludedMessage("Applying resource controls to running instance."):
+            external_command(
+                "systemctl", "set-property", "--runtime", unit,
+                *(f"{k}={v}" for k, v in controls.items() if k != "Slice")
+            )
+
+    def _content(self) -> str:
+        return "[Service]\n" + "".join(
+            f"{k}={v}\n" for k, v in self.context.resource_controls.items()
+        )
+
 
 # TODO make this configurable
 @export
@@ -224,11 +1099,20 @@ class ConfigureSerialization(EphemeralAction):
     def do(self):
         with ConcludedMessage("Configuring serialization settings."):
             tree = ElementTree.parse(self.context.existdb_config)
+            if self.patch(tree):
+                tree.write(self.context.existdb_config)
 
-            config = tree.find("./serializer")
-            config.set("indent", "no")
+    def drift(self) -> Optional[str]:
+        if self.patch(ElementTree.parse(self.context.existdb_config)):
+            return "The serializer indents its output."
 
-            tree.write(self.context.existdb_config)
+    @staticmethod
+    def patch(tree: ElementTree.ElementTree) -> bool:
+        config = tree.find("./serializer")
+        if config.get("indent") == "no":
+            return False
+        config.set("indent", "no")
+        return True
 
 
 @export
@@ -237,6 +1121,12 @@ class CopyDatasnapshot(EphemeralAction):
         with ConcludedMessage("Copying data snapshot to new installation."):
             shutil.copytree(self.context.data_snapshot, self.context.data_dir)
 
+    def workload(self) -> int:
+        # the snapshot doesn't exist yet when a plan is simulated
+        return occupied_bytes(
+            getattr(self.context, "data_snapshot", self.context.data_dir)
+        )
+
 
 @export
 class CreateBackupDirectory(Action):
@@ -246,12 +1136,34 @@ class CreateBackupDirectory(Action):
 
     def undo(self):
         with ConcludedMessage("Removing backup folder."):
-            shutil.rmtree(self.context.backup_dir)
+            discard(self.context.backup_dir)
+
+
+@export
+class DivertMessagesToStderr(EphemeralAction):
+    """ Reserves the standard output for data and redirects everything else that
+        is written to it, including output of external commands, to stderr. """
+
+    def do(self):
+        sys.stdout.flush()
+        self.context.output_stream = os.fdopen(os.dup(1), "wb")
+        os.dup2(2, 1)
 
 
 @export
 class DownloadInstaller(EphemeralAction):
     def do(self):
+        if not installation_required(self.context):
+            return
+
+        # the installer's console mode asks for its values on the standard input
+        if not self.interactive:
+            raise Abort(
+                f"eXist-db {self.args.version} must be installed with its "
+                "interactive installer, that's only possible from the command "
+                "line interface or with an existing shared distribution."
+            )
+
         self.context.installer_location = (
             self.args.installer_cache / f"exist-installer-{self.args.version}.jar"
         )
@@ -281,10 +1193,12 @@ class DumpTemplate(EphemeralAction):
             content = content.decode()
 
         for token, replacement in (
+            ("<existance>", Path(sys.argv[0]).resolve()),
             ("<existdb_user>", self.config["exist-db"]["user"]),
             ("<instances_root>", self.args.base_directory),
             ("<instances_settings>", self.args.instances_settings),
             ("<now>", datetime.utcnow()),
+            ("<pid_dir>", PID_DIRECTORY),
         ):
             content = content.replace(token, str(replacement))
 
@@ -301,15 +1215,53 @@ class EnableSystemdUnit(Action):
         with ConcludedMessage("Disabling systemd unit for instance."):
             external_command("systemctl", "disable", f"existdb@{self.args.id}")
 
+    def drift(self) -> Optional[str]:
+        state = external_command(
+            "systemctl", "is-enabled", f"existdb@{self.args.id}",
+            capture_output=True, check=False, text=True,
+        ).stdout.strip()
+        if state != "enabled":
+            return f"The systemd unit is {state or 'unknown'}."
+
+
+@export
+class ExportArchive(EphemeralAction):
+    def do(self):
+        source = getattr(self.context, f"{self.args.source}_dir")
+
+        if self.args.output is None:
+            target = self.context.output_stream
+        else:
+            target = self.args.output.open("xb")
+
+        archive_stream = ArchiveStream(
+            target, "w",
+            compressor=self.config.get("existance", "compressor", fallback=None),
+        )
+        with ConcludedMessage(f"Exporting {source}."):
+            started = monotonic()
+            with target, archive_stream as archive:
+                archive.add(source, arcname=self.args.source)
+            duration = monotonic() - started
+
+        print(throughput_report("Exported", archive_stream, duration))
+
+    def workload(self) -> int:
+        return occupied_bytes(getattr(self.context, f"{self.args.source}_dir"))
+
 
 @export
 class GetInstanceName(EphemeralAction):
+    read_only = True
+
     def do(self):
         self.args.name = self.context.instances_settings[self.args.id]["name"]
 
 
 @export
 class GetLatestExistVersion(EphemeralAction):
+    read_only = True
+
     def do(self):
         with ConcludedMessage("Obtaining latest available version."):
             # FIXME get the full list and filter out RC releases
@@ -325,6 +1277,9 @@ class InstallerPrologue(EphemeralAction):
     # TODO remove when solved: https://github.com/eXist-db/exist/issues/964
 
     def do(self):
+        if not installation_required(self.context):
+            return
+
         year = datetime.today().year
         print(textwrap.dedent(f"""\
             A long time ago in a galaxy far too close to be ignored…
@@ -335,12 +1290,12 @@ class InstallerPrologue(EphemeralAction):
             serious, but here are some hints to get you through:
             
             When asked for a target path, you *MUST* repeat these words:
-                {self.context.installation_dir}
+                {self.context.installer_target}
             Will this lead the way to wisdom or just a swamp hole at the galaxy's pampa
             belt?
             
             The new oil - which was gold before - is data, put its vault there:
-                {relative_path(self.context.data_dir, self.context.installation_dir)}
+                {relative_path(self.context.data_dir, self.context.installer_target)}
             
             May it be the wisdom evoked by modern computing powers you want to pretend
             or just protection against little green hoodlums, this one seems to be a good
@@ -356,31 +1311,127 @@ class InstallerPrologue(EphemeralAction):
 @export
 class ListInstances(EphemeralAction):
     def do(self):
-        table = Texttable(max_width=get_terminal_size().columns - 2)
-        table.header(("id", "name", "status", "XmX"))
-        table.set_header_align(("c", "c", "c", "c"))
-        table.set_cols_align(("r", "l", "l", "r"))
+        table = Texttable(max_width=shutil.get_terminal_size().columns - 2)
+        if self.args.paths:
+            table.header(("id", "name", "status", "XmX", "JVM profile", "paths"))
+            table.set_header_align(("c", "c", "c", "c", "c", "c"))
+            table.set_cols_align(("r", "l", "l", "r", "l", "l"))
+        else:
+            table.header(("id", "name", "status", "XmX", "JVM profile"))
+            table.set_header_align(("c", "c", "c", "c", "c"))
+            table.set_cols_align(("r", "l", "l", "r", "l"))
         table.set_deco(Texttable.HEADER | Texttable.VLINES)
 
-        for _id, settings in self.context.instances_settings.items():
-            active_state = external_command(
-                "systemctl", "is-active", f"existdb@{_id}",
-                capture_output=True, check=False, text=True
-            ).stdout.strip()
-            enabled_state = external_command(
-                "systemctl", "is-enabled", f"existdb@{_id}",
-                capture_output=True, check=False, text=True
-            ).stdout.strip()
+        instances = self.context.instances_settings
+        states = command_runner.run_many(
+            (
+                ("systemctl", query, f"existdb@{_id}")
+                for _id in instances
+                for query in ("is-active", "is-enabled")
+            ),
+            capture_output=True, check=False, text=True
+        )
+
+        if self.args.paths:
+            paths = self._describe_paths()
 
-            table.add_row((_id, settings["name"], f"{enabled_state}\n{active_state}", settings["xmx"]))
+        for index, (_id, settings) in enumerate(instances.items()):
+            active_state = states[2 * index].stdout.strip()
+            enabled_state = states[2 * index + 1].stdout.strip()
+
+            row = [
+                _id, settings["name"], f"{enabled_state}\n{active_state}",
+                settings["xmx"], settings.get("jvm_profile") or "default"
+            ]
+            if self.args.paths:
+                row.append(paths[_id])
+            table.add_row(row)
 
         print("\n" + table.draw())
         print("\nThe XmX values refer to the configuration, "
               "not necessarily the currently effective.")
 
+    def _describe_paths(self) -> dict:
+        contexts = {
+            _id: instance_executor(self.executor, _id, CalculateTargetPaths).context
+            for _id in self.context.instances_settings
+        }
+        sizes = disk_usage(
+            (
+                getattr(context, x)
+                for context in contexts.values()
+                for x in ("installation_dir", "data_dir", "backup_dir")
+            ),
+            cache_file=state_directory(self.config) / DISK_USAGE_CACHE_FILENAME,
+            uncached=[x.data_dir for x in contexts.values()],
+        )
+
+        result = {}
+        for _id, context in contexts.items():
+            lines = [str(context.instance_dir)]
+            for label, path in (
+                ("existdb", context.installation_dir),
+                ("data", context.data_dir),
+                ("backup", context.backup_dir),
+            ):
+                size = format_bytes(sizes[path]) if path.exists() else "missing"
+                lines.append(f"  {label}: {size}")
+            if context.distribution_dir is not None:
+                lines.append(f"  distribution: {context.distribution_dir}")
+            jetty = read_jetty_settings(context.installation_dir)
+            if jetty:
+                profile = instance_options(self.config, "jetty", _id).get("profile")
+                lines.append(f"  jetty profile: {profile or 'default'}")
+                lines.extend(f"    {k}: {v}" for k, v in jetty.items())
+            result[_id] = "\n".join(lines)
+        return result
+
+
+@export
+class ListSnapshots(EphemeralAction):
+    read_only = True
+
+    def do(self):
+        if self.args.id is None:
+            ids = sorted(self.context.instances_settings)
+        else:
+            ids = [self.args.id]
+
+        snapshots = []
+        for _id in ids:
+            context = instance_executor(self.executor, _id, CalculateTargetPaths).context
+            for name, folders in find_snapshots(context.instance_dir).items():
+                snapshots.append((_id, name, folders))
+
+        if not snapshots:
+            print("No snapshots found.")
+            return
+
+        sizes = disk_usage(
+            (x for _, _, folders in snapshots for x in folders.values()),
+            cache_file=state_directory(self.config) / DISK_USAGE_CACHE_FILENAME,
+        )
+
+        table = Texttable(max_width=shutil.get_terminal_size().columns - 2)
+        table.header(("id", "snapshot", "age", "folders", "size"))
+        table.set_cols_align(("r", "l", "r", "l", "r"))
+        table.set_deco(Texttable.HEADER | Texttable.VLINES)
+        for _id, name, folders in snapshots:
+            table.add_row((
+                _id,
+                name,
+                f"{snapshot_age(name).days} d",
+                ", ".join(sorted(folders)),
+                format_bytes(sum(sizes[x] for x in folders.values())),
+            ))
+        print("\n" + table.draw())
+        print(f"\nTotal: {format_bytes(sum(sizes.values()))}")
+
 
 @export
 class LoadRetainedConfigs(EphemeralAction):
+    read_only = True
+
     def do(self):
         retained_configs = {}
         with ConcludedMessage("Loading configs that will be re-used."):
@@ -390,6 +1441,9 @@ class LoadRetainedConfigs(EphemeralAction):
                 self.context.controller_config,
                 self.context.jetty_config,
             ):
+                # links to a shared distribution are unmodified
+                if config.is_symlink():
+                    continue
                 with config.open("rt") as f:
                     retained_configs[config] = f.read()
 
@@ -406,7 +1460,7 @@ class MakeDataDir(Action):
 
     def undo(self):
         with ConcludedMessage("Removing data dir."):
-            shutil.rmtree(self.context.data_dir)
+            discard(self.context.data_dir)
 
 
 @export
@@ -419,14 +1473,14 @@ class MakeInstanceDirectory(Action):
     def undo(self):
         target = self.context.instance_dir
         with ConcludedMessage(f"Removing instance directory {target}"):
-            shutil.rmtree(self.context.instance_dir)
+            discard(self.context.instance_dir)
 
 
 @export
 class MakeSnapshot(Action):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.snapshot_suffix = datetime.now().strftime("-%Y-%m-%d-%H-%M")
+        self.snapshot_suffix = datetime.now().strftime(SNAPSHOT_SUFFIX_FORMAT)
 
     def do(self):
         context = self.context
@@ -444,6 +1498,9 @@ class MakeSnapshot(Action):
             installation_dir.rename(context.installation_snapshot)
             shutil.copytree(data_dir, context.data_snapshot)
 
+    def workload(self) -> int:
+        return occupied_bytes(self.context.data_dir)
+
     def undo(self):
         context = self.context
         installation_dir = context.installation_dir
@@ -451,28 +1508,188 @@ class MakeSnapshot(Action):
 
         with ConcludedMessage("Restoring installation and data snapshot."):
             context.installation_snapshot.rename(installation_dir)
-            shutil.rmtree(data_dir)
+            discard(data_dir)
             context.data_snapshot.rename(data_dir)
 
 
+@export
+class PruneSnapshots(EphemeralAction):
+    """ Removes the snapshots that aren't retained by the policy, the newest
+        ones up to a number and all that are younger than an age are kept. The
+        folders are moved to the trash and deleted in the background. """
+
+    def do(self):
+        keep = self.args.keep
+        if keep is None:
+            keep = self.config.getint("snapshots", "keep", fallback=SNAPSHOT_RETENTION_COUNT)
+        max_age = self.args.max_age
+        if max_age is None:
+            max_age = self.config.getint("snapshots", "max_age", fallback=0)
+
+        if self.args.all:
+            ids = sorted(self.context.instances_settings)
+        else:
+            ids = [self.args.id]
+
+        pruned = []
+        for _id in ids:
+            context = instance_executor(self.executor, _id, CalculateTargetPaths).context
+            snapshots = find_snapshots(context.instance_dir)
+            for index, (name, folders) in enumerate(snapshots.items()):
+                if index >= len(snapshots) - keep:
+                    continue
+                if max_age and snapshot_age(name).days < max_age:
+                    continue
+                pruned.append((_id, name, folders))
+
+        if not pruned:
+            print("No snapshots to prune.")
+            return
+
+        for _id, name, folders in pruned:
+            with ConcludedMessage(f"Removing snapshot {name} of instance {_id}."):
+                for folder in folders.values():
+                    move_to_trash(folder)
+        purge_in_background()
+        print("The snapshots are deleted in the background.")
+
+
+@export
+class PurgeTrash(EphemeralAction):
+    def do(self):
+        with ConcludedMessage("Purging the trash folders."):
+            purged = purge_trash(
+                state_directory(self.config) / TRASH_PURGE_LOCK_FILENAME,
+                threads=self.config.getint("existance", "purge_threads", fallback=16),
+            )
+            print(f"({purged} entries)", end=" ")
+
+
 @export
 class ReadInstancesSettings(EphemeralAction):
+    read_only = True
+
     def do(self):
-        with open(self.args.instances_settings, "rt") as f:
-            self.context.instances_settings = {
-                int(x["id"]): x
-                for x in csv.DictReader(
-                    f, fieldnames=INSTANCE_SETTINGS_FIELDS, dialect="instances_settings"
+        try:
+            extra_fields = parse_extra_fields(
+                self.config.get("exist-db", "instances_settings_extra_fields", fallback="")
+            )
+        except ValueError as e:
+            raise Abort(str(e))
+        self.context.instances_settings = InstancesSettings(
+            self.args.instances_settings,
+            extra_fields,
+            environment=lambda row: {
+                "gc_log_options": gc_logging_options(
+                    self.config, self.args.log_directory, row
                 )
-            }
+            },
+        )
+
+
+@export
+class ReconcileInstances(EphemeralAction):
+    """ Compares the artifacts that existance manages for the selected instances
+        with the state that derives from the configuration and the instances'
+        settings. Only the actions that close found differences are performed,
+        these aren't rolled back as each one converges on its own. A report of
+        the drift is printed. """
+
+    def do(self):
+        if self.args.all:
+            ids = sorted(self.context.instances_settings)
+        else:
+            ids = [self.args.id]
+
+        report = []
+        for _id in ids:
+            report.extend(self._reconcile_instance(instance_executor(
+                self.executor, _id,
+                CalculateTargetPaths, ResolveJVMOptions, ResolveResourceControls,
+            )))
+
+        proxy_mappings = WriteProxyMappings(self.executor)
+        drift = proxy_mappings.drift()
+        if drift is not None:
+            report.append(("all", "nginx configuration", drift, self._fix(proxy_mappings)))
+        self.context.drift = report
+
+        if not report:
+            print("No drift found.")
+            return
+
+        table = Texttable(max_width=shutil.get_terminal_size().columns - 2)
+        table.header(("instance", "artifact", "drift", "action"))
+        table.set_deco(Texttable.HEADER | Texttable.VLINES)
+        table.add_rows(report, header=False)
+        print("\n" + table.draw())
+
+    def _fix(self, action: ActionBase) -> str:
+        if self.args.check:
+            return "none"
+        action.do()
+        return "corrected"
+
+    def _reconcile_instance(self, executor: SimpleNamespace):
+        args, context = executor.args, executor.context
+        label = f"{args.id} {args.name}"
+
+        if not context.instance_dir.is_dir():
+            yield (
+                label, "instance directory",
+                f"{context.instance_dir} is missing, was the directory pattern "
+                "changed?",
+                "none",
+            )
+            return
+
+        restart_required = False
+        for artifact, action_cls, requires_restart in (
+            ("conf.xml", ConfigureSerialization, True),
+            ("conf.xml", AddBackupTask, True),
+            ("conf.xml", ConfigureCacheSizes, True),
+            ("Jetty context", SetJettyWebappContext, True),
+            ("Jetty configuration", ConfigureJetty, True),
+            ("log folder", SetupLoggingAggregation, False),
+            ("permissions", SetFilePermissions, False),
+            ("resource controls", ConfigureResourceControls, False),
+            ("systemd unit", EnableSystemdUnit, False),
+            ("settings", UpdateInstanceSettings, False),
+        ):
+            action = action_cls(executor)
+            drift = action.drift()
+            if drift is None:
+                continue
+            fix = self._fix(action)
+            restart_required |= requires_restart and fix == "corrected"
+            yield label, artifact, drift, fix
+
+        # changed JVM options are flagged by UpdateInstanceSettings
+        if restart_required or getattr(context, "restart_required", False):
+            context.restart_required = True
+            RestartSystemdUnitIfRequired(executor).do()
 
 
 @export
 class ReloadNginx(EphemeralAction):
+    """ Validates and reloads nginx' configuration if it was changed, at most once
+        per plan. """
+
     def do(self):
+        if not getattr(self.context, "nginx_reload_required", False):
+            return
+
         with ConcludedMessage("Reloading nginx configuration."):
+            result = external_command(
+                "nginx", "-t", "-q", capture_output=True, check=False, text=True
+            )
+            if result.returncode:
+                raise Abort(f"The nginx configuration is invalid:\n{result.stderr}")
             external_command("systemctl", "reload", "nginx")
 
+        self.context.nginx_reload_required = False
+        self.context.nginx_reloaded = True
+
 
 @export
 class RemoveUnwantedJettyConfig(EphemeralAction):
@@ -498,14 +1715,491 @@ class RemoveUnwantedJettyConfig(EphemeralAction):
                 external_command("sed", "-i", f"/{token}/d", config_path)
 
 
+@export
+class ReportGarbageCollection(EphemeralAction):
+    """ Summarizes the GC logs of the selected instances, including the
+        rotated ones, and hints at XmX values that seem too small or too
+        large. """
+
+    read_only = True
+
+    def do(self):
+        if self.args.all:
+            ids = sorted(self.context.instances_settings)
+        else:
+            ids = [self.args.id]
+
+        table = Texttable(max_width=shutil.get_terminal_size().columns - 2)
+        table.set_deco(Texttable.HEADER | Texttable.VLINES)
+        table.header((
+            "id", "pauses", "p50 / p95 / p99 / max", "time paused", "allocation",
+            "heap after GC\nlast / max", "trend", "XmX", "hint",
+        ))
+        table.set_cols_align(("r", "r", "r", "r", "r", "r", "r", "r", "l"))
+
+        summaries = self.context.gc_summaries = {}
+        for _id in ids:
+            row = self.context.instances_settings[_id]
+            summary = summaries[_id] = summarize_gc_log(self._lines(
+                aggregated_log_directory(self.args.log_directory, _id, row["name"])
+            ))
+            if summary is None:
+                table.add_row((_id, 0, "", "", "", "", "", row["xmx"], "no GC log"))
+                continue
+
+            table.add_row((
+                _id,
+                f"{summary['pauses']}\n({summary['full_pauses']} full)",
+                " / ".join(
+                    f"{summary[x] * 1000:.0f}" for x in ("p50", "p95", "p99", "max")
+                ) + " ms",
+                f"{summary['pause_share']:.2%}",
+                f"{format_bytes(summary['allocation_rate'])}/s",
+                f"{format_bytes(summary['heap_after_last'])}\n"
+                f"{format_bytes(summary['heap_after_max'])}",
+                f"{format_bytes(abs(summary['heap_after_trend']) * 3600)}/h"
+                + (" ↓" if summary["heap_after_trend"] < 0 else " ↑"),
+                row["xmx"],
+                self._hint(summary, parse_size(row["xmx"])),
+            ))
+
+        print("\n" + table.draw())
+
+    @staticmethod
+    def _lines(directory: Path):
+        logs = sorted(
+            directory.glob(GC_LOG_FILENAME + "*"), key=lambda x: x.stat().st_mtime
+        )
+        for log in logs:
+            with log.open("rt", errors="replace") as f:
+                yield from f
+
+    @staticmethod
+    def _hint(summary: dict, xmx: int) -> str:
+        hints = []
+        if summary["heap_after_max"] > 0.8 * xmx:
+            hints.append("XmX seems too small, the heap remains filled after GCs")
+        elif summary["heap_after_max"] < 0.25 * xmx and summary["pauses"] >= 100:
+            hints.append("XmX might be reduced")
+        if summary["full_pauses"] and summary["full_pauses"] * 10 > summary["pauses"]:
+            hints.append("frequent full GCs")
+        if summary["heap_after_trend"] * 3600 > 0.05 * xmx:
+            hints.append("growing occupancy, possibly a leak")
+        return "\n".join(hints)
+
+
+@export
+class ReportUnitEvents(EphemeralAction):
+    """ Reads the journal entries of the instances' systemd units since the
+        last invocation and reports restart loops, OOM kills, failures and slow
+        starts. The journal's cursor is kept in the state directory. A
+        recorded export is analyzed as a whole and leaves that state alone. """
+
+    def do(self):
+        options = {**EVENTS_DEFAULTS}
+        if self.config.has_section("events"):
+            options.update(self.config.items("events", raw=True))
+
+        if self.args.journal_export is None:
+            state_file = state_directory(self.config) / EVENTS_STATE_FILENAME
+            if state_file.exists() and not self.args.from_start:
+                state = json.loads(state_file.read_text())
+            else:
+                state = {}
+            entries = self._read_journal(state.get("cursor"), options["initial_period"])
+        else:
+            state_file, state = None, {}
+            with self.args.journal_export.open("rt") as f:
+                entries = list(parse_journal_export(f))
+
+        events = self.context.unit_events = analyze_journal(
+            entries,
+            state,
+            int(options["restart_loop_count"]),
+            float(options["restart_loop_window"]),
+            float(options["slow_start"]),
+        )
+        if state_file is not None:
+            state_file.write_text(json.dumps(state))
+
+        print(f"{len(entries)} new journal entries were read.")
+        if not events:
+            print("No incidents were found.")
+            return
+
+        instances = self.context.instances_settings
+        table = Texttable(max_width=shutil.get_terminal_size().columns - 2)
+        table.set_deco(Texttable.HEADER | Texttable.VLINES)
+        table.header(("time", "instance", "event", "detail"))
+        table.set_cols_align(("l", "l", "l", "l"))
+        for event in events:
+            table.add_row((
+                datetime.fromtimestamp(event.time).strftime("%Y-%m-%d %H:%M:%S"),
+                f"{event.instance} {instances[event.instance]['name']}"
+                if event.instance in instances else event.instance,
+                event.kind,
+                event.detail,
+            ))
+        print("\n" + table.draw())
+
+    @staticmethod
+    def _read_journal(cursor: Optional[str], initial_period: str) -> list:
+        args = ["journalctl", "--output=json", "--no-pager", "--unit=existdb@*"]
+        if cursor:
+            args.append(f"--after-cursor={cursor}")
+        elif initial_period:
+            args.append(f"--since=-{initial_period}")
+        result = external_command(*args, capture_output=True, text=True)
+        return list(parse_journal_export(result.stdout.splitlines()))
+
+
+@export
+class ResolveJVMOptions(EphemeralAction):
+    """ Determines the effective JVM options from the designated or stored JVM
+        profile, XmX value and explicitly overridden options. """
+
+    read_only = True
+
+    def do(self):
+        args = self.args
+        stored = self.context.instances_settings.get(args.id) or {}
+        for field, default in (
+            ("xmx", self.config.get("exist-db", "XmX_default")),
+            (
+                "jvm_profile",
+                self.config.get("exist-db", "jvm_profile_default", fallback="default"),
+            ),
+            ("jvm_overrides", ""),
+        ):
+            if getattr(args, field, None) is None:
+                setattr(args, field, stored.get(field) or default)
+
+        if not is_valid_xmx_value(args.xmx):
+            raise Abort(f"Invalid XmX value: {args.xmx}")
+
+        section = f"jvm-profile:{args.jvm_profile}"
+        if self.config.has_section(section):
+            profile = self.config.get(section, "options", raw=True)
+        elif args.jvm_profile in JVM_PROFILES:
+            profile = JVM_PROFILES[args.jvm_profile]
+        else:
+            raise Abort(f"Unknown JVM profile: {args.jvm_profile}")
+
+        options = merge_jvm_options(
+            profile.format(
+                xmx=args.xmx,
+                instance_id=args.id,
+                instance_name=args.name,
+                instance_dir=self.context.instance_dir,
+            ),
+            args.jvm_overrides,
+        )
+        if "," in options:
+            raise Abort("JVM options must not contain commas.")
+        self.context.jvm_options = options
+
+
+@export
+class ResolveResourceControls(EphemeralAction):
+    """ Determines the systemd resource controls from the designated, stored or
+        configured values. The memory limit is derived from the XmX value plus
+        an overhead for the JVM's off-heap memory unless set explicitly. """
+
+    read_only = True
+
+    def do(self):
+        args = self.args
+        stored = self.context.instances_settings.get(args.id) or {}
+        for field, default in SYSTEMD_RESOURCE_DEFAULTS.items():
+            if getattr(args, field, None) is None:
+                setattr(
+                    args, field,
+                    stored.get(field) or self.config.get("systemd", field, fallback=default),
+                )
+
+        if args.memory_max == "auto":
+            xmx = parse_size(args.xmx)
+            overhead = self.config.get("systemd", "memory_overhead", fallback="50%")
+            if overhead.endswith("%"):
+                overhead = xmx * int(overhead[:-1]) // 100
+            else:
+                overhead = parse_size(overhead)
+            memory_max = format_size(
+                xmx + max(overhead, SYSTEMD_MEMORY_OVERHEAD_MINIMUM)
+            )
+        else:
+            memory_max = args.memory_max
+
+        self.context.resource_controls = OrderedDict((
+            ("Slice", self.config.get("systemd", "slice", fallback="existdb.slice")),
+            ("CPUWeight", args.cpu_weight),
+            ("IOWeight", args.io_weight),
+            ("MemoryMax", memory_max),
+            ("TasksMax", args.tasks_max),
+        ))
+
+
+@export
+class RestartSystemdUnitIfRequired(EphemeralAction):
+    def do(self):
+        if not getattr(self.context, "restart_required", False):
+            print("No changes that require a restart.")
+            return
+
+        is_active = not external_command(
+            "systemctl", "is-active", "--quiet", f"existdb@{self.args.id}", check=False
+        ).returncode
+        if is_active:
+            with ConcludedMessage("Restarting systemd unit for instance."):
+                external_command("systemctl", "restart", f"existdb@{self.args.id}")
+
+
+@export
+class RestoreArchive(Action):
+    """ Extracts a stream that was produced by :class:`ExportArchive` into the
+        instance's directory. Folders that are replaced are kept with a datetime
+        suffix. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replaced_suffix = datetime.now().strftime(SNAPSHOT_SUFFIX_FORMAT)
+        self.restored = []
+
+    def do(self):
+        if self.args.input is None:
+            source = sys.stdin.buffer
+        else:
+            source = self.args.input.open("rb")
+
+        instance_dir = self.context.instance_dir
+        archive_stream = ArchiveStream(source, "r")
+        with ConcludedMessage(f"Restoring archive into {instance_dir}."):
+            started = monotonic()
+            with source, archive_stream as archive:
+                for member in archive:
+                    self._verify_member(member)
+                    top_level = PurePosixPath(member.name).parts[0]
+                    if top_level not in self.restored:
+                        self._replace_folder(instance_dir / top_level)
+                        self.restored.append(top_level)
+                    archive.extract(member, path=instance_dir, **EXTRACTION_KWARGS)
+            duration = monotonic() - started
+
+        print(throughput_report("Restored", archive_stream, duration))
+
+    def workload(self) -> Optional[int]:
+        if self.args.input is None:
+            return None
+        # the compressed size, the ratio is assumed to be similar each time
+        return self.args.input.stat().st_size
+
+    def undo(self):
+        instance_dir = self.context.instance_dir
+        with ConcludedMessage("Restoring replaced folders."):
+            for top_level in self.restored:
+                target = instance_dir / top_level
+                discard(target)
+                replaced = target.with_name(target.name + self.replaced_suffix)
+                if replaced.exists():
+                    replaced.rename(target)
+
+    def _replace_folder(self, path: Path):
+        if path.exists():
+            path.rename(path.with_name(path.name + self.replaced_suffix))
+
+    @staticmethod
+    def _verify_member(member: tarfile.TarInfo):
+        path = PurePosixPath(member.name)
+        if (
+            path.is_absolute()
+            or ".." in path.parts
+            or path.parts[0] not in RESTORABLE_FOLDERS
+            or not (member.isfile() or member.isdir())
+        ):
+            raise Abort(f"Refusing to extract suspicious archive member {member.name}.")
+
+
+@export
+class RestoreSnapshot(Action):
+    """ Swaps an instance's current folders with those of a snapshot by renaming
+        them, the current folders are kept as a new snapshot. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replaced_suffix = datetime.now().strftime(SNAPSHOT_SUFFIX_FORMAT)
+        self.swapped = []
+
+    def do(self):
+        instance_dir = self.context.instance_dir
+        snapshots = find_snapshots(instance_dir)
+        if not snapshots:
+            raise Abort(f"There are no snapshots in {instance_dir}.")
+
+        name = self.args.snapshot
+        while name not in snapshots:
+            print("Select one of the following snapshots to restore:")
+            for snapshot, folders in snapshots.items():
+                print(f"{snapshot}: {', '.join(sorted(folders))}")
+            name = self.prompt("> ").strip()
+
+        if self.replaced_suffix[1:] in snapshots:
+            raise Abort("A snapshot was made within this minute, please try later.")
+
+        with ConcludedMessage(f"Restoring snapshot {name}."):
+            for folder, path in sorted(snapshots[name].items()):
+                current = instance_dir / folder
+                if current.exists():
+                    current.rename(instance_dir / (folder + self.replaced_suffix))
+                path.rename(current)
+                self.swapped.append((folder, path))
+
+    def undo(self):
+        instance_dir = self.context.instance_dir
+        with ConcludedMessage("Restoring the previous folders."):
+            for folder, path in reversed(self.swapped):
+                current = instance_dir / folder
+                current.rename(path)
+                replaced = instance_dir / (folder + self.replaced_suffix)
+                if replaced.exists():
+                    replaced.rename(current)
+
+
+@export
+class RotateLogs(EphemeralAction):
+    """ Rotates, compresses and deletes the files in the aggregated log folders
+        of the selected instances. Files that an instance's process holds open
+        for appending, like Jetty's request log, are only rotated by copying
+        and truncating them when they exceed the size limit, hence Jetty
+        continues to write to the same file. Other open files, like those of
+        log4j2's RollingRandomAccessFile appenders, would become sparse when
+        truncated and are left to log4j2's rollover, the GC logs to the JVM's
+        own rotation. """
+
+    def do(self):
+        options = {**LOG_ROTATION_DEFAULTS}
+        if self.config.has_section("log-rotation"):
+            options.update(self.config.items("log-rotation", raw=True))
+        max_size = parse_size(options["max_size"])
+        now = datetime.now().timestamp()
+        compress_before = now - float(options["compress_after"]) * 86400
+        delete_before = now - float(options["max_age"]) * 86400
+
+        if self.args.all:
+            ids = sorted(self.context.instances_settings)
+        else:
+            ids = [self.args.id]
+
+        rotated, compressible, deleted, freed = 0, [], 0, 0
+        for _id in ids:
+            pid = instance_pid(_id)
+            if pid is None and self._unit_state(_id) not in ("inactive", "failed"):
+                # the files that a running instance writes to are unknown
+                print(f"Skipping instance {_id} as its process id can't be found.")
+                continue
+            open_files = self._open_files(pid)
+            for path, stat in self._log_files(_id):
+                if path.name.endswith(".gz"):
+                    if float(options["max_age"]) and stat.st_mtime < delete_before:
+                        path.unlink()
+                        deleted += 1
+                        freed += stat.st_blocks * 512
+                elif (stat.st_dev, stat.st_ino) in open_files:
+                    appending = open_files[(stat.st_dev, stat.st_ino)]
+                    if appending and max_size and stat.st_size > max_size:
+                        compressible.append(self._copy_truncate(path))
+                        rotated += 1
+                elif float(options["compress_after"]) == 0 or stat.st_mtime < compress_before:
+                    compressible.append(path)
+
+        if rotated:
+            print(f"Rotated {rotated} open log file(s).")
+        if compressible:
+            with ConcludedMessage(f"Compressing {len(compressible)} log file(s)."):
+                compressed = compress_files(
+                    compressible,
+                    processes=int(options["processes"]),
+                    nice=int(options["nice"]),
+                    io_class=options["io_class"] or None,
+                )
+            saved = sum(x[1] - x[2] for x in compressed)
+            print(f"Compressed {len(compressed)} file(s), saved {format_bytes(saved)}.")
+        if deleted:
+            print(f"Deleted {deleted} expired file(s), freed {format_bytes(freed)}.")
+        if not (rotated or compressible or deleted):
+            print("Nothing to rotate.")
+
+    def _log_files(self, _id: int):
+        base_dir = aggregated_log_directory(
+            self.args.log_directory, _id, self.context.instances_settings[_id]["name"]
+        )
+        for directory, _, files in os.walk(base_dir, followlinks=True):
+            for name in files:
+                if directory == str(base_dir) and name.startswith(GC_LOG_FILENAME):
+                    continue
+                path = Path(directory) / name
+                stat = path.lstat()
+                if S_ISREG(stat.st_mode) and not name.endswith(".gz.tmp"):
+                    yield path, stat
+
+    @staticmethod
+    def _unit_state(_id: int) -> str:
+        return command_runner.run(
+            "systemctl", "is-active", f"existdb@{_id}",
+            capture_output=True, check=False, text=True,
+        ).stdout.strip()
+
+    @staticmethod
+    def _open_files(pid: Optional[int]) -> Dict[Tuple[int, int], bool]:
+        """ Maps the device and inode of the files that a process holds open to
+            whether all its descriptors of a file append to it. """
+        result = {}
+        if pid is None:
+            return result
+        with suppress(OSError):
+            for descriptor in Path(f"/proc/{pid}/fd").iterdir():
+                with suppress(OSError, ValueError):
+                    stat = descriptor.stat()
+                    fdinfo = Path(f"/proc/{pid}/fdinfo/{descriptor.name}").read_text()
+                    flags = next(
+                        int(x.split(":")[1], 8)
+                        for x in fdinfo.splitlines() if x.startswith("flags:")
+                    )
+                    key = (stat.st_dev, stat.st_ino)
+                    result[key] = result.get(key, True) and bool(flags & os.O_APPEND)
+        return result
+
+    @staticmethod
+    def _copy_truncate(path: Path) -> Path:
+        # the writers append to their logs, so they continue at the start
+        target = path.with_name(f"{path.name}.{datetime.now():%Y%m%d%H%M%S}")
+        shutil.copy2(path, target)
+        stat = path.stat()
+        os.chown(target, stat.st_uid, stat.st_gid)
+        os.truncate(path, 0)
+        return target
+
+
 @export
 class RunExistInstaller(Action):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.installed = False
+
     def do(self):
+        if not installation_required(self.context):
+            print(
+                f"Using the distribution at {self.context.distribution_dir}. "
+                "\033[92m✔\033[0m"
+            )
+            return
+
+        self.installed = self.context.installer_initialised_data = True
         external_command("java", "-jar", self.context.installer_location, "-console")
 
     def undo(self):
-        with ConcludedMessage("Removing installation folder."):
-            shutil.rmtree(self.context.installation_dir, ignore_errors=True)
+        if self.installed:
+            with ConcludedMessage("Removing installation folder."):
+                discard(self.context.installer_target)
 
 
 @export
@@ -513,12 +2207,17 @@ class SaveRetainedConfigs(EphemeralAction):
     def do(self):
         with ConcludedMessage("Restoring old configs."):
             for config, data in self.context.retained_configs.items():
+                # never write through a link into a shared distribution
+                if config.is_symlink():
+                    config.unlink()
                 with config.open("tw") as f:
                     print(data, file=f)
 
 
 @export
 class SelectInstanceID(EphemeralAction):
+    read_only = True
+
     def do(self):
         args = self.args
         instances_settings = self.context.instances_settings
@@ -528,23 +2227,95 @@ class SelectInstanceID(EphemeralAction):
             for item in instances_settings.values():
                 print(f'{item["id"]}: {item["name"]}')
 
-            value = input("> ")
+            value = self.prompt("> ")
             try:
                 args.id = int(value)
             except ValueError:
                 args.id = None
 
 
+@export
+class SetCloneSource(EphemeralAction):
+    """ Remembers the selected instance as source of a clone and designates the
+        requested id and name for the clone. """
+
+    def do(self):
+        args, context = self.args, self.context
+        context.clone_source = SimpleNamespace(
+            id=args.id,
+            name=args.name,
+            installation_dir=context.installation_dir,
+            data_dir=context.data_dir,
+        )
+        source_settings = context.instances_settings[args.id]
+        for field in CLONE_INHERITED_FIELDS:
+            setattr(args, field, source_settings.get(field) or None)
+        args.id, args.name = args.clone_id, args.clone_name
+
+
+@export
+class SetAdminPassword(EphemeralAction):
+    """ Sets a generated password for the admin account of a new instance whose
+        data wasn't initialised by eXist-db's installer, i.e. that uses an
+        existing shared distribution. The instance must be started. """
+
+    def do(self):
+        if getattr(self.context, "installer_initialised_data", False):
+            return
+
+        password = make_password_proposal(32)
+        try:
+            with ConcludedMessage("Setting the admin password."):
+                run_coroutine(self._set_password(password))
+        except HTTPError as e:
+            raise Abort(f"The admin password couldn't be set: {e}")
+        print(f"The password of the admin account is: {password}")
+
+    async def _set_password(self, password: str):
+        options = instance_options(self.config, "warmup", self.args.id)
+        await wait_until_reachable(
+            "localhost", self.args.id, f"/{self.args.name}/",
+            timeout=float(options.get("timeout", 300)),
+        )
+        # a freshly initialised database's admin account has an empty password
+        query = (
+            '<query xmlns="http://exist.sourceforge.net/NS/exist"><text>'
+            f'sm:passwd("admin", "{password}")'
+            "</text></query>"
+        )
+        async with ConnectionPool("localhost", self.args.id, size=1) as pool:
+            response = await pool.request(
+                "POST", f"/{self.args.name}/rest/db", query.encode(),
+                {
+                    "Authorization": "Basic " + b64encode(b"admin:").decode(),
+                    "Content-Type": "application/xml",
+                },
+            )
+        if response.status >= 400:
+            raise HTTPError(f"The query was answered with status {response.status}.")
+
+
 @export
 class SetDesignatedExistDBVersion(EphemeralAction):
+    read_only = True
+
     def do(self):
         args = self.args
         proposed_version = self.context.latest_existdb_version
 
+        # a given value must not silently be replaced by the proposal
+        if (
+            args.version is not None
+            and not is_semantical_version(args.version)
+            and not self.interactive
+        ):
+            raise Abort(f"{args.version} is not a valid version qualifier.")
+
         while args.version is None or not is_semantical_version(args.version):
-            value = input(
+            value = self.prompt(
                 "Which version of eXist-db shall be installed or upgraded to? "
-                "[{proposed_version}] ".format(proposed_version=proposed_version)
+                "[{proposed_version}] ".format(proposed_version=proposed_version),
+                default="",
             )
             if not value:
                 args.version = proposed_version
@@ -556,6 +2327,8 @@ class SetDesignatedExistDBVersion(EphemeralAction):
 
 @export
 class SetDesignatedInstanceID(EphemeralAction):
+    read_only = True
+
     def do(self):
         args, instances_settings = self.args, self.context.instances_settings
 
@@ -564,11 +2337,16 @@ class SetDesignatedInstanceID(EphemeralAction):
         else:
             proposed_id = INSTANCE_PORT_RANGE_START
 
+        # a given value must not silently be replaced by the proposal
+        if args.id is not None and args.id in instances_settings and not self.interactive:
+            raise Abort(f"The instance id {args.id} is already in use.")
+
         while args.id is None or args.id in instances_settings:
-            value = input(
+            value = self.prompt(
                 "Please enter the designated instance's ID [{proposed}]: ".format(
                     proposed=proposed_id
-                )
+                ),
+                default="",
             )
             if not value:
                 value = proposed_id
@@ -580,17 +2358,19 @@ class SetDesignatedInstanceID(EphemeralAction):
 
 @export
 class SetDesignatedInstanceName(EphemeralAction):
+    read_only = True
+
     def do(self):
         args, context = self.args, self.context
         expected_pattern = r"^[a-z_-]{4,}$"  # TODO configurable?
-        used_names = [x["name"] for x in context.instances_settings.values()]
+        used_names = context.instances_settings.by_name
 
         while (
             args.name is None
             or args.name in used_names
             or not re.match(expected_pattern, args.name)
         ):
-            value = input(
+            value = self.prompt(
                 "Please enter the designated instance's name "
                 "(must match {pattern}): ".format(pattern=expected_pattern)
             )
@@ -604,11 +2384,13 @@ class SetDesignatedInstanceName(EphemeralAction):
 
 @export
 class SetDesignatedXmXValue(EphemeralAction):
+    read_only = True
+
     def do(self):
         args = self.args
 
         while args.xmx is None or not is_valid_xmx_value(args.xmx):
-            value = input("What's the size for the memory allocation pool? ")
+            value = self.prompt("What's the size for the memory allocation pool? ")
             args.xmx = value
             if not is_valid_xmx_value(value):
                 print(
@@ -640,8 +2422,37 @@ class SetFilePermissions(EphemeralAction):
             "Allow write access to all xml-files for group-members in the "
             "application directory."
         ):
-            for xml_file in self.context.installation_dir.glob("**/*.xml"):
-                external_command("chmod", "g+w", xml_file)
+            command_runner.run_many(
+                (
+                    ("chmod", "g+w", xml_file)
+                    for xml_file in self.context.installation_dir.glob("**/*.xml")
+                    if not xml_file.is_symlink()
+                ),
+                batch=True,
+            )
+
+    def drift(self) -> Optional[str]:
+        uid = pwd.getpwnam(self.args.user).pw_uid
+        gid = grp.getgrnam(self.args.group).gr_gid
+        context = self.context
+
+        for path in (
+            context.instance_dir,
+            context.installation_dir,
+            context.backup_dir,
+            context.data_dir,
+        ):
+            stat = path.stat()
+            if (stat.st_uid, stat.st_gid) != (uid, gid):
+                return f"{path} isn't owned by {self.args.user}:{self.args.group}."
+            if not stat.st_mode & S_IWGRP:
+                return f"{path} isn't writable for the group."
+
+        for xml_file in context.installation_dir.glob("**/*.xml"):
+            if xml_file.is_symlink():
+                continue
+            if not xml_file.stat().st_mode & S_IWGRP:
+                return f"{xml_file} isn't writable for the group."
 
 
 @export
@@ -649,35 +2460,86 @@ class SetJettyWebappContext(EphemeralAction):
     def do(self):
         with ConcludedMessage("Setting Jetty's context path."):
             tree = ElementTree.parse(self.context.jetty_config)
-            tree.find("./Set[@name='contextPath']").text = f"/{self.args.name}"
-            tree.write(self.context.jetty_config)
+            if self.patch(tree):
+                tree.write(self.context.jetty_config)
+
+    def drift(self) -> Optional[str]:
+        if self.patch(ElementTree.parse(self.context.jetty_config)):
+            return f"Jetty's context path isn't /{self.args.name}."
+
+    def patch(self, tree: ElementTree.ElementTree) -> bool:
+        element = tree.find("./Set[@name='contextPath']")
+        if element.text == f"/{self.args.name}":
+            return False
+        element.text = f"/{self.args.name}"
+        return True
 
 
 @export
 class SetupLoggingAggregation(Action):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # TODO make that configurable
-        self.base_dir = (
-            Path("/var") / "log" / "existdb" / f"{self.args.id}_{self.args.name}"
+        self.base_dir = aggregated_log_directory(
+            self.args.log_directory, self.args.id, self.args.name
         )
 
     def do(self):
         with ConcludedMessage("Setting up log folder."):
-            self.base_dir.mkdir(mode=0o770, parents=True)
+            self.base_dir.mkdir(mode=0o770, parents=True, exist_ok=True)
             external_command(
                 "chown", f"{self.args.user}:{self.args.group}", self.base_dir
             )
-            (self.base_dir / "jetty").symlink_to(
-                self.context.installation_dir / "tools" / "jetty" / "logs"
-            )
-            (self.base_dir / "existdb").symlink_to(
-                self.context.installation_dir / "webapp" / "WEB-INF" / "logs"
-            )
+            for link, target in self._links().items():
+                if link.is_symlink():
+                    if Path(os.readlink(link)) == target:
+                        continue
+                    link.unlink()
+                link.symlink_to(target)
 
     def undo(self):
         with ConcludedMessage("Removing log folder."):
-            shutil.rmtree(self.base_dir)
+            discard(self.base_dir)
+
+    def drift(self) -> Optional[str]:
+        if not self.base_dir.is_dir():
+            return f"{self.base_dir} is missing."
+        for link, target in self._links().items():
+            if not link.is_symlink() or Path(os.readlink(link)) != target:
+                return f"{link} doesn't point to {target}."
+
+    def _links(self) -> dict:
+        installation_dir = self.context.installation_dir
+        return {
+            self.base_dir / "jetty": installation_dir / "tools" / "jetty" / "logs",
+            self.base_dir / "existdb": installation_dir / "webapp" / "WEB-INF" / "logs",
+        }
+
+
+@export
+class ShowTrashStatus(EphemeralAction):
+    read_only = True
+
+    def do(self):
+        directories = trash_directories()
+        if not directories:
+            print("There are no trash folders.")
+            return
+
+        sizes = disk_usage(directories)
+        table = Texttable(max_width=shutil.get_terminal_size().columns - 2)
+        table.header(("trash folder", "entries", "pending"))
+        table.set_cols_align(("l", "r", "r"))
+        table.set_deco(Texttable.HEADER | Texttable.VLINES)
+        for directory in directories:
+            table.add_row((
+                str(directory),
+                sum(1 for _ in directory.iterdir()),
+                format_bytes(sizes[directory]),
+            ))
+        print("\n" + table.draw())
+
+        if purge_running(state_directory(self.config) / TRASH_PURGE_LOCK_FILENAME):
+            print("\nA purge is running.")
 
 
 @export
@@ -691,27 +2553,267 @@ class StartSystemdUnit(Action):
             external_command("systemctl", "stop", f"existdb@{self.args.id}")
 
 
+@export
+class UpdateInstanceSettings(Action):
+    """ Writes changed settings of an existing instance and flags whether these
+        changes require a restart. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.previous = None
+
+    def do(self):
+        _id = self.args.id
+        previous = self.context.instances_settings[_id]
+        current = instance_settings_row(self.args, self.context)
+        if self.drift() is None:
+            return
+
+        with ConcludedMessage("Updating instance's settings."):
+            self.previous = previous
+            self.context.instances_settings.upsert(current)
+
+        # settings from earlier versions lack the options of the default profile
+        effective = {**previous, "jvm_options": previous.get("jvm_options")
+                     or JVM_PROFILES["default"]}
+        if any(effective[x] != str(current[x]) for x in RESTART_REQUIRING_FIELDS):
+            self.context.restart_required = True
+
+    def undo(self):
+        if self.previous is not None:
+            with ConcludedMessage("Restoring instance's previous settings."):
+                self.context.instances_settings.upsert(self.previous)
+
+    def drift(self) -> Optional[str]:
+        settings = self.context.instances_settings
+        previous = settings[self.args.id]
+        current = instance_settings_row(self.args, self.context)
+        changed = [x for x in current if (previous.get(x) or "") != str(current[x])]
+        if changed:
+            return f"The stored {', '.join(changed)} differ."
+        environment_file = settings.environment_file(self.args.id)
+        if not environment_file.exists():
+            return f"{environment_file} is missing."
+        if environment_file.read_text() != settings.environment_content(self.args.id):
+            return f"{environment_file} is outdated."
+
+
+@export
+class WarmUpInstance(EphemeralAction):
+    """ Sends the configured requests in rounds to a started instance until the
+        median latency of a round stabilises. """
+
+    def do(self):
+        options = instance_options(self.config, "warmup", self.args.id)
+        requests_specs = parse_request_specs(
+            options.get("requests", ""), self.args.name
+        )
+        if not requests_specs:
+            return
+
+        try:
+            with ConcludedMessage("Warming up the instance's caches."):
+                rounds, elapsed, latency = run_coroutine(
+                    self._warm_up(requests_specs, options)
+                )
+        except HTTPError as e:
+            print(f"The warm-up failed: {e}")
+            return
+
+        self.context.warmup_rounds = rounds
+        if rounds is None:
+            print(
+                f"The latency did not stabilise within {elapsed:.1f} s, the last "
+                f"median latency was {latency * 1000:.0f} ms."
+            )
+        else:
+            print(
+                f"The latency stabilised after {rounds} rounds in {elapsed:.1f} s at "
+                f"a median of {latency * 1000:.0f} ms."
+            )
+
+    async def _warm_up(self, requests_specs, options):
+        concurrency = int(options.get("concurrency", 4))
+        max_rounds = int(options.get("rounds", 10))
+        tolerance = float(options.get("tolerance", 0.1))
+
+        started = monotonic()
+        await wait_until_reachable(
+            "localhost", self.args.id, f"/{self.args.name}/",
+            timeout=float(options.get("timeout", 300)),
+        )
+
+        previous = latency = None
+        async with ConnectionPool("localhost", self.args.id, size=concurrency) as pool:
+            for round_ in range(1, max_rounds + 1):
+                responses = await asyncio.gather(
+                    *(pool.request(method, path) for method, path in requests_specs)
+                )
+                latency = median(x.duration for x in responses)
+                if previous is not None and abs(latency - previous) <= tolerance * previous:
+                    return round_, monotonic() - started, latency
+                previous = latency
+
+        return None, monotonic() - started, latency
+
+
+@export
+class WriteProxyMappings(Action):
+    """ Renders the nginx configurations for all instances into one file for the
+        server and one for the http context. Candidates are validated before they
+        replace the current files atomically. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.paths = tuple(
+            Path(self.config.get("nginx", f"{x}_directory", fallback=f"/etc/nginx/proxy-{x}"))
+            / NGINX_MAPPINGS_FILENAME
+            for x in ("upstreams", "mappings")
+        )
+        self.previous = {}
+
+    def do(self):
+        contents = self._render()
+        if all(
+            path.exists() and path.read_text() == content
+            for path, content in zip(self.paths, contents)
+        ):
+            return
+
+        with ConcludedMessage("Writing nginx configuration for all instances."):
+            candidates = []
+            for path, content in zip(self.paths, contents):
+                path.parent.mkdir(exist_ok=True)
+                candidate = path.with_name(f".{path.name}.tmp")
+                candidate.write_text(content)
+                external_command("chown", f"root:{self.args.group}", candidate)
+                external_command("chmod", "ug=rw,o=r", candidate)
+                candidates.append(candidate)
+
+            try:
+                self._validate(*candidates)
+            except Abort:
+                for candidate in candidates:
+                    candidate.unlink()
+                raise
+
+            for path, candidate in zip(self.paths, candidates):
+                self.previous[path] = path.read_text() if path.exists() else None
+                os.replace(candidate, path)
+            self._remove_legacy_mappings()
+
+        self.context.nginx_reload_required = True
+
+    def drift(self) -> Optional[str]:
+        differing = [
+            str(path)
+            for path, content in zip(self.paths, self._render())
+            if not path.exists() or path.read_text() != content
+        ]
+        if differing:
+            return f"{', '.join(differing)} differ from the instances' settings."
+
+    def undo(self):
+        if not self.previous:
+            return
+        with ConcludedMessage("Restoring previous nginx configuration."):
+            for path, content in self.previous.items():
+                if content is None:
+                    path.unlink()
+                else:
+                    path.write_text(content)
+            if getattr(self.context, "nginx_reloaded", False):
+                external_command("systemctl", "reload", "nginx")
+
+    def _remove_legacy_mappings(self):
+        # earlier versions wrote one file per instance that is named by its id
+        for directory in {x.parent for x in self.paths}:
+            for path in directory.iterdir():
+                if path.name.isdigit():
+                    self.previous[path] = path.read_text()
+                    path.unlink()
+
+    def _render(self):
+        trusted_clients = [
+            x
+            for x in self.config.get("nginx", "trusted_clients", fallback="").split(",")
+            if x
+        ]
+        upstreams, mappings = [], []
+        for _id, settings in sorted(self.context.instances_settings.items()):
+            upstream, mapping = render_nginx_mapping(
+                _id,
+                settings["name"],
+                instance_options(self.config, "nginx", _id),
+                trusted_clients,
+            )
+            upstreams.append(upstream)
+            mappings.append(mapping)
+        return (
+            NGINX_MAPPINGS_HEADER + "".join(upstreams),
+            NGINX_MAPPINGS_HEADER + "".join(mappings),
+        )
+
+    @staticmethod
+    def _validate(upstreams: Path, mappings: Path):
+        with TemporaryDirectory() as directory:
+            harness = Path(directory) / "nginx.conf"
+            harness.write_text(render_template(
+                NGINX_VALIDATION_HARNESS,
+                directory=directory, upstreams=upstreams, mappings=mappings,
+            ))
+            result = external_command(
+                "nginx", "-t", "-q", "-p", directory, "-c", harness,
+                capture_output=True, check=False, text=True,
+            )
+        if result.returncode:
+            raise Abort(f"The generated nginx configuration is invalid:\n{result.stderr}")
+
+
 @export
 class WriteInstanceSettings(Action):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.performed = self.inserted = False
+
     def do(self):
+        self.performed = True
         with ConcludedMessage("Adding instance's settings."):
-            _id = self.args.id
-            self.context.instances_settings[_id] = {
-                "id": _id,
-                "name": self.args.name,
-                "xmx": self.args.xmx,
-            }
-            self._write()
+            try:
+                self.context.instances_settings.insert(
+                    instance_settings_row(self.args, self.context)
+                )
+            except KeyError:
+                raise Abort(
+                    f"The id {self.args.id} or the name {self.args.name} was "
+                    "registered by another invocation meanwhile."
+                )
+            self.inserted = True
 
     def undo(self):
+        # a failed insertion must not remove the row of another invocation
+        if self.performed and not self.inserted:
+            return
         if self.args.id in self.context.instances_settings:
             with ConcludedMessage("Removing this instance's settings."):
-                self.context.instances_settings.pop(self.args.id)
-                self._write()
+                self.context.instances_settings.remove(self.args.id)
+
+
+def instance_settings_row(args, context) -> dict:
+    return {
+        "id": args.id,
+        "name": args.name,
+        "xmx": args.xmx,
+        "jvm_profile": args.jvm_profile,
+        "jvm_overrides": args.jvm_overrides,
+        "jvm_options": context.jvm_options,
+        "cpu_weight": args.cpu_weight,
+        "io_weight": args.io_weight,
+        "memory_max": args.memory_max,
+        "tasks_max": args.tasks_max,
+        "version": getattr(args, "version", None)
+        or (context.instances_settings.get(args.id) or {}).get("version")
+        or "",
+        "instance_dir": context.instance_dir,
+    }
 
-    def _write(self):
-        with open(self.args.instances_settings, "wt") as f:
-            writer = csv.DictWriter(
-                f, fieldnames=INSTANCE_SETTINGS_FIELDS, dialect="instances_settings"
-            )
-            writer.writerows((x for x in self.context.instances_settings.values()))
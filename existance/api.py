@@ -0,0 +1,289 @@
+""" A programmatic interface for orchestration code that manages instances from
+    a long-lived Python process.
+
+    The operations are performed with the same plans and actions as the
+    subcommands of the command line interface, but without elevating the
+    privileges with ``sudo`` and without parsing arguments for each call. The
+    process therefore needs an effective user id of 0 for operations that
+    change the host. Values are never asked for, where the command line
+    interface proposes one, e.g. the latest eXist-db version or the next free
+    instance id, that is used; otherwise a missing value fails the operation.
+
+    Operations of one :class:`Client` are performed one at a time as they share
+    the process' standard output and the runner of external commands. What the
+    actions print is returned with the :class:`Result`, the messages that are
+    concluded with a check mark on the command line are passed as
+    :class:`existance.actions.ProgressEvent` objects to an optional callable.
+
+    Example::
+
+        from existance.api import Client
+
+        client = Client(progress=lambda event: logger.info("%s", event))
+        result = client.install("testing", version="6.2.0", xmx="2g")
+        if not result.succeeded:
+            raise RuntimeError(result.error)
+        new_id = result.context.instances_settings.by_name["testing"]["id"]
+"""
+
+import argparse
+import io
+import threading
+from collections import namedtuple
+from configparser import ConfigParser
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+from existance import POSSIBLE_CONFIG_LOCATIONS, PlanExecutor, actions, build_argparser
+from existance.utils import configure_command_runner
+
+
+ProgressCallback = Callable[[actions.ProgressEvent], None]
+
+
+class Result(
+    namedtuple(
+        "Result", ("exit_code", "error", "context", "durations", "simulation", "output")
+    )
+):
+    """ The outcome of an operation.
+
+        :ivar exit_code: The exit code that the subcommand would emit.
+        :ivar error: The message of the abort or exception that failed the
+                     operation, ``None`` if it succeeded.
+        :ivar context: The namespace that the actions populated, e.g. with
+                       ``instances_settings``, ``drift`` of a reconciliation,
+                       ``gc_summaries``, ``diagnostics`` directories,
+                       ``unit_events`` or the ``benchmark`` result.
+        :ivar durations: A list of the performed actions' names and durations
+                         in seconds.
+        :ivar simulation: A list of the actions' names, estimated durations and
+                          workloads of a dry run.
+        :ivar output: What the actions printed.
+    """
+
+    __slots__ = ()
+
+    @property
+    def succeeded(self) -> bool:
+        return self.exit_code == 0
+
+
+class Client:
+    """ Performs operations with a configuration that is read once.
+
+        :param config: A parsed configuration, the path to a configuration file
+                       or ``None`` to read the file from the same locations as
+                       the command line interface.
+        :param progress: A callable that receives the progress of all
+                         operations, it can be overridden per operation.
+    """
+
+    def __init__(
+        self,
+        config: Union[None, str, Path, ConfigParser] = None,
+        progress: Optional[ProgressCallback] = None,
+    ):
+        if not isinstance(config, ConfigParser):
+            config = read_config(config)
+        self.config = config
+        self.progress = progress
+
+        configure_command_runner(config)
+        self._parser = build_argparser(config)
+        self._defaults = {}  # type: Dict[str, dict]
+        self._lock = threading.Lock()
+
+    def run(
+        self,
+        command: str,
+        progress: Optional[ProgressCallback] = None,
+        **parameters,
+    ) -> Result:
+        """ Performs a subcommand with parameters that are named like the
+            destinations of its command line arguments, e.g.
+            ``run("snapshots prune", all=True, keep=2)``. The values must have
+            the types that the argument parser would produce. """
+        namespace = argparse.Namespace(**self.defaults(command))
+        for name, value in parameters.items():
+            if not hasattr(namespace, name):
+                raise TypeError(f"{command} got an unexpected parameter '{name}'")
+            setattr(namespace, name, value)
+        return self.execute(
+            namespace.plan_factory(namespace), namespace, progress=progress
+        )
+
+    def defaults(self, command: str) -> dict:
+        """ Returns the default values of a subcommand's arguments, they're
+            derived from the configuration once. """
+        if command not in self._defaults:
+            try:
+                with redirect_stderr(io.StringIO()):
+                    namespace = self._parser.parse_args(command.split())
+            except SystemExit:
+                raise ValueError(f"Not a subcommand without positionals: {command}")
+            if not hasattr(namespace, "plan_factory"):
+                raise ValueError(f"Not a subcommand: {command}")
+            self._defaults[command] = vars(namespace)
+        return dict(self._defaults[command])
+
+    def execute(
+        self,
+        plan: List[type],
+        args: argparse.Namespace,
+        progress: Optional[ProgressCallback] = None,
+    ) -> Result:
+        """ Performs a plan of actions with the given arguments. """
+        executor = PlanExecutor(
+            plan,
+            args,
+            self.config,
+            interactive=False,
+            progress=progress or self.progress,
+        )
+        output = io.StringIO()
+        with self._lock, redirect_stdout(output):
+            try:
+                exit_code = executor()
+            except SystemExit as e:
+                exit_code = e.code
+        return Result(
+            exit_code,
+            executor.error,
+            executor.context,
+            executor.durations,
+            executor.simulation,
+            output.getvalue(),
+        )
+
+    # operations
+
+    def instances(self) -> Dict[int, dict]:
+        """ Returns the instances' settings by their ids. """
+        result = self.execute(
+            [actions.ReadInstancesSettings], argparse.Namespace(**self.defaults("list"))
+        )
+        return {k: dict(v) for k, v in result.context.instances_settings.items()}
+
+    def install(
+        self,
+        name: str,
+        version: Optional[str] = None,
+        xmx: Optional[str] = None,
+        id: Optional[int] = None,
+        dry_run: bool = False,
+        **parameters,
+    ) -> Result:
+        """ Installs a new instance, the latest eXist-db version, the configured
+            XmX value and the next free id are used unless given. Further
+            parameters are ``jvm_profile``, ``jvm_overrides``, ``cpu_weight``,
+            ``io_weight``, ``memory_max`` and ``tasks_max``.
+
+            As eXist-db's installer is interactive, this fails unless the
+            ``shared`` layout is configured and the distribution of the version
+            exists already, e.g. because an instance was installed with it from
+            the command line interface. The same applies to :meth:`upgrade`.
+        """
+        if xmx is not None:
+            parameters["xmx"] = xmx
+        return self.run(
+            "install", name=name, version=version, id=id, dry_run=dry_run, **parameters
+        )
+
+    def upgrade(
+        self,
+        id: int,
+        version: Optional[str] = None,
+        bench: bool = False,
+        dry_run: bool = False,
+    ) -> Result:
+        return self.run("upgrade", id=id, version=version, bench=bench, dry_run=dry_run)
+
+    def uninstall(self, id: int, dry_run: bool = False) -> Result:
+        return self.run("uninstall", id=id, dry_run=dry_run)
+
+    def clone(self, id: int, clone_name: str, clone_id: Optional[int] = None) -> Result:
+        return self.run("clone", id=id, clone_name=clone_name, clone_id=clone_id)
+
+    def tune(self, id: int, **parameters) -> Result:
+        """ Accepts the parameters ``xmx``, ``jvm_profile``, ``jvm_overrides``,
+            ``cpu_weight``, ``io_weight``, ``memory_max`` and ``tasks_max``. """
+        return self.run("tune", id=id, **parameters)
+
+    def reconcile(self, id: Optional[int] = None, check: bool = False) -> Result:
+        """ Reconciles one or, without an id, all instances. The found
+            differences are available as ``drift`` of the result's context. """
+        return self.run("reconcile", id=id, all=id is None, check=check)
+
+    def backup_export(self, id: int, output: Path, source: str = "backup") -> Result:
+        return self.run("backup export", id=id, output=Path(output), source=source)
+
+    def backup_restore(self, id: int, input: Path) -> Result:
+        return self.run("backup restore", id=id, input=Path(input))
+
+    def bench(
+        self,
+        id: int,
+        concurrency: Optional[int] = None,
+        duration: Optional[float] = None,
+        save_baseline: bool = False,
+    ) -> Result:
+        return self.run(
+            "bench",
+            id=id,
+            concurrency=concurrency,
+            duration=duration,
+            save_baseline=save_baseline,
+        )
+
+    def diagnose(self, id: Optional[int] = None, heap_dump: bool = False) -> Result:
+        return self.run("diagnose", id=id, all=id is None, heap_dump=heap_dump)
+
+    def events(self, journal_export: Optional[Path] = None) -> Result:
+        """ The found incidents are available as ``unit_events`` of the
+            result's context. """
+        return self.run(
+            "events",
+            journal_export=None if journal_export is None else Path(journal_export),
+        )
+
+    def gc(self, id: Optional[int] = None) -> Result:
+        return self.run("gc", id=id, all=id is None)
+
+    def rotate_logs(self, id: Optional[int] = None) -> Result:
+        return self.run("logs rotate", id=id, all=id is None)
+
+    def prune_snapshots(
+        self,
+        id: Optional[int] = None,
+        keep: Optional[int] = None,
+        max_age: Optional[int] = None,
+    ) -> Result:
+        return self.run(
+            "snapshots prune", id=id, all=id is None, keep=keep, max_age=max_age
+        )
+
+    def restore_snapshot(self, id: int, snapshot: str) -> Result:
+        return self.run("snapshots restore", id=id, snapshot=snapshot)
+
+    def purge_trash(self) -> Result:
+        return self.run("trash purge")
+
+
+def read_config(path: Union[None, str, Path] = None) -> ConfigParser:
+    """ Reads the given configuration file or the first of the default
+        locations.
+
+        :raises FileNotFoundError: If no file was found.
+    """
+    locations = POSSIBLE_CONFIG_LOCATIONS if path is None else (Path(path),)
+    config = ConfigParser()
+    for location in locations:
+        location = location.resolve()
+        if location.is_file():
+            config.read(location)
+            return config
+    raise FileNotFoundError(
+        f"No valid configuration file found in {' or '.join(map(str, locations))}."
+    )
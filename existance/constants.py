@@ -9,14 +9,214 @@ INTERACTIVE_SUBPROCESS_KWARGS = {
     "stderr": sys.stderr,
     "check": True,
 }
+# commands that only differ in their last argument are merged into one
+# invocation, only idempotent ones that change something and report nothing
+# per argument qualify
+BATCHABLE_COMMANDS = ("chmod", "chown")
+BENCHMARK_DEFAULTS = {
+    "concurrency": "8",
+    "duration": "30",
+    "regression_threshold": "0.2",
+    "timeout": "300",
+}
+# ratios and factors that derive eXist-db's cache and pool sizes from the XmX
+# value, following the recommendations of eXist-db's documentation and its
+# default configuration for 2g of heap memory
+CACHE_SIZING_DEFAULTS = {
+    "cache_size_ratio": "0.33",
+    "collection_cache_ratio": "0.1",
+    "brokers_per_gigabyte": "10",
+    "minimal_brokers": "10",
+    "maximal_brokers": "80",
+    "query_pool_size_per_gigabyte": "64",
+    "minimal_query_pool_size": "32",
+    "maximal_query_pool_size": "512",
+}
+# the settings that a clone takes over from its source, the version is the one
+# of the copied installation and is therefore taken over as well
+CLONE_INHERITED_FIELDS = (
+    "xmx", "jvm_profile", "jvm_overrides", "cpu_weight", "io_weight",
+    "memory_max", "tasks_max", "version",
+)
+COPY_BUFFER_SIZE = 1024 * 1024
+DEFAULT_COMMAND_CONCURRENCY = 8
+# the concurrency limits the number of instances whose JVM is inspected at the
+# same time, as each capture pauses it
+DIAGNOSTICS_DEFAULTS = {
+    "concurrency": "2",
+    "sample_interval": "5",
+    "top": "5",
+}
+# space that is kept free when the needed disk space is estimated
+DISK_SPACE_RESERVE = "1g"
+DISK_USAGE_CACHE_FILENAME = "disk_usage.json"
+# the symlink in an instance's overlay that points to its shared distribution
+DISTRIBUTION_LINK_NAME = ".distribution"
+# restarts, their window and the duration of starts are given in seconds; on the
+# first invocation the journal is read for the given period
+EVENTS_DEFAULTS = {
+    "restart_loop_count": "3",
+    "restart_loop_window": "600",
+    "slow_start": "180",
+    "initial_period": "7d",
+}
+# the journal's cursor and the state of the detection, within the state directory
+EVENTS_STATE_FILENAME = "events.json"
 EXISTDB_INSTALLER_URL = (
     "https://bintray.com/existdb/releases/download_file"
     "?file_path=eXist-db-setup-{version}.jar"
 )
+GC_LOG_FILENAME = "gc.log"
+# the JVM's unified logging writes and rotates these logs in an instance's
+# aggregated log folder
+GC_LOGGING_DEFAULTS = {
+    "enabled": "yes",
+    "selectors": "gc*",
+    "filecount": "5",
+    "filesize": "20m",
+}
+GZIP_MAGIC = b"\x1f\x8b"
+# files that eXist-db never modifies and can be shared among clones
+IMMUTABLE_FILE_SUFFIXES = (".jar",)
+# the assumed size of an eXist-db installation before it was installed
+INSTALLATION_SIZE_ESTIMATE = "1g"
+# these settings are written as variables to a shell file per instance that
+# existctl sources
+INSTANCE_ENVIRONMENT_VARIABLES = {
+    "instance_dir": "instance_dir",
+    "name": "instance_name",
+    "xmx": "xmx",
+    "jvm_options": "jvm_options",
+}
 INSTANCE_PORT_RANGE_START = 8000
-INSTANCE_SETTINGS_FIELDS = ("id", "name", "xmx")
+# new fields must only be appended as the existctl script refers to their position
+INSTANCE_SETTINGS_FIELDS = (
+    "id", "name", "xmx", "jvm_profile", "jvm_overrides", "jvm_options",
+    "cpu_weight", "io_weight", "memory_max", "tasks_max", "version", "instance_dir",
+)
+# the I/O scheduling classes for ionice that log compression can be run with
+IO_SCHEDULING_CLASSES = {"idle": ("-c", "3"), "best-effort": ("-c", "2", "-n", "7")}
+# the folder of an installation with the configurations of Jetty's server
+JETTY_CONFIG_DIRECTORY = "tools/jetty/etc"
+# the options of Jetty profiles; the default profile holds Jetty's defaults and
+# all others extend it, profiles can be added or extended in the configuration
+# file; nginx' upstream connections idle for 60 s, hence the proxied profiles
+# keep them open longer so that nginx closes them first
+JETTY_PROFILES = {
+    "default": {
+        "min_threads": "10",
+        "max_threads": "200",
+        "thread_idle_timeout": "60000",
+        "acceptors": "-1",
+        "selectors": "-1",
+        "idle_timeout": "30000",
+        "accept_queue_size": "0",
+    },
+    "proxied": {"acceptors": "1", "selectors": "2", "idle_timeout": "75000"},
+    "proxied-small": {
+        "min_threads": "4",
+        "max_threads": "50",
+        "acceptors": "1",
+        "selectors": "1",
+        "idle_timeout": "75000",
+    },
+    "proxied-large": {
+        "min_threads": "20",
+        "max_threads": "400",
+        "acceptors": "2",
+        "selectors": "4",
+        "idle_timeout": "75000",
+        "accept_queue_size": "256",
+    },
+}
+# the files in the JETTY_CONFIG_DIRECTORY and the properties whose default
+# values are set from the options of Jetty profiles
+JETTY_PROPERTIES = {
+    "min_threads": ("jetty.xml", "jetty.threadPool.minThreads"),
+    "max_threads": ("jetty.xml", "jetty.threadPool.maxThreads"),
+    "thread_idle_timeout": ("jetty.xml", "jetty.threadPool.idleTimeout"),
+    "acceptors": ("jetty-http.xml", "jetty.http.acceptors"),
+    "selectors": ("jetty-http.xml", "jetty.http.selectors"),
+    "idle_timeout": ("jetty-http.xml", "jetty.http.idleTimeout"),
+    "accept_queue_size": ("jetty-http.xml", "jetty.http.acceptQueueSize"),
+}
+# the placeholders {xmx}, {instance_id}, {instance_name} and {instance_dir} are
+# substituted, profiles can be added or redefined in the configuration file
+JVM_PROFILES = {
+    "default": "-Xms128m",
+    "server": "-Xms{xmx} -XX:+UseG1GC -XX:+AlwaysPreTouch "
+    "-XX:+HeapDumpOnOutOfMemoryError -XX:HeapDumpPath={instance_dir}",
+    "throughput": "-Xms{xmx} -XX:+UseParallelGC -XX:+AlwaysPreTouch",
+    "low-latency": "-Xms{xmx} -XX:+UseG1GC -XX:MaxGCPauseMillis=100 "
+    "-XX:+AlwaysPreTouch",
+    "large-pages": "-Xms{xmx} -XX:+UseG1GC -XX:+UseLargePages -XX:+AlwaysPreTouch",
+}
 LATEST_EXISTDB_RECORD_URL = (
     "https://api.github.com/repos/eXist-db/exist/" "releases/latest"
 )
+# sizes and ages in days that files in the aggregated log folders are rotated,
+# compressed and deleted by, 0 disables a criterion; the number of compressing
+# processes defaults to the number of CPUs
+LOG_ROTATION_DEFAULTS = {
+    "max_size": "100m",
+    "compress_after": "1",
+    "max_age": "30",
+    "processes": "0",
+    "nice": "19",
+    "io_class": "idle",
+}
+MAX_BATCHED_ARGUMENTS = 256
+NGINX_MAPPINGS_FILENAME = "existdb.conf"
+# paths within a shared distribution that instances modify and hence get a copy
+# of in their overlay, the configuration file can extend these
+OVERLAY_COPIED_PATHS = (
+    "bin",
+    "conf.xml",
+    "tools/jetty/etc/jetty-http.xml",
+    "tools/jetty/etc/jetty.xml",
+    "tools/jetty/etc/standard.enabled-jetty-configs",
+    "tools/jetty/webapps/exist-webapp-context.xml",
+    "webapp/WEB-INF/controller-config.xml",
+)
+# directories that instances write to, their content isn't linked
+OVERLAY_PRIVATE_DIRECTORIES = (
+    "tools/jetty/logs",
+    "tools/jetty/tmp",
+    "webapp/WEB-INF/logs",
+)
+# the arguments to compress to and decompress from stdout
+PARALLEL_COMPRESSORS = {
+    "zstd": (("-T0", "-q", "-c"), ("-d", "-q", "-c")),
+    "pigz": (("-c",), ("-d", "-c")),
+}
 PASSWORD_CHARACTERS = string.ascii_letters + string.digits
+# where existctl keeps the instances' pid files
+PID_DIRECTORY = "/tmp/exist_pids"
+# changes of these instance settings take effect with a restart
+RESTART_REQUIRING_FIELDS = ("xmx", "jvm_options")
+RESTORABLE_FOLDERS = ("backup", "data")
+SIZE_UNITS = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+# the number of snapshots per instance that are kept by default when pruning
+SNAPSHOT_RETENTION_COUNT = 1
+# folders that are replaced are kept with this suffix
+SNAPSHOT_SUFFIX_FORMAT = "-%Y-%m-%d-%H-%M"
+SNAPSHOT_SUFFIX_PATTERN = r"-(\d{4}-\d{2}-\d{2}-\d{2}-\d{2})"
+SNAPSHOTTED_FOLDERS = ("backup", "data", "existdb")
+STATE_DIRECTORY = "/var/lib/existance"
+SYSTEMD_MEMORY_OVERHEAD_MINIMUM = 256 * 1024 ** 2
+SYSTEMD_RESOURCE_DEFAULTS = {
+    "cpu_weight": "100",
+    "io_weight": "100",
+    "memory_max": "auto",
+    "tasks_max": "4096",
+}
+SYSTEMD_UNITS_DIRECTORY = "/etc/systemd/system"
+# the number of recorded durations per action that estimates are based on
+TIMING_SAMPLES = 20
+TIMINGS_FILENAME = "timings.json"
 TMP = gettempdir()
+# the folder at the root of a filesystem where deleted files are moved to
+TRASH_DIRECTORY_NAME = ".existance-trash"
+# serializes purges of the trash folders, within the state directory
+TRASH_PURGE_LOCK_FILENAME = "trash-purge.lock"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
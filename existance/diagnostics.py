@@ -0,0 +1,153 @@
+import re
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional
+
+from existance.utils import percentile
+
+
+ThreadInfo = namedtuple("ThreadInfo", ("name", "state", "cpu"))
+HistogramEntry = namedtuple("HistogramEntry", ("class_name", "instances", "bytes"))
+
+
+match_thread_header = re.compile(r'^"(?P<name>.*)" (?P<attributes>.*)$').match
+search_thread_cpu = re.compile(r"\bcpu=(?P<cpu>[\d.]+)ms\b").search
+match_thread_state = re.compile(r"^\s+java\.lang\.Thread\.State: (?P<state>\w+)").match
+search_gc_pause = re.compile(
+    r"\[(?P<uptime>[\d.]+)s\].*\bGC\(\d+\) (?P<kind>Pause \w+).*? "
+    r"(?P<before>\d+)(?P<before_unit>[BKMG])->(?P<after>\d+)(?P<after_unit>[BKMG])"
+    r"\((?P<capacity>\d+)(?P<capacity_unit>[BKMG])\) (?P<duration>[\d.]+)ms"
+).search
+match_histogram_line = re.compile(
+    r"^\s*\d+:\s+(?P<instances>\d+)\s+(?P<bytes>\d+)\s+(?P<class_name>\S+)"
+).match
+
+
+def parse_thread_dump(text: str) -> List[ThreadInfo]:
+    """ Parses the output of ``jcmd <pid> Thread.print``. The consumed CPU time
+        is given in seconds, it's ``None`` for JVMs before version 11 and for
+        threads that don't report it. """
+    result = []
+    name = cpu = state = None
+    for line in text.splitlines():
+        header = match_thread_header(line)
+        if header is not None:
+            if name is not None:
+                result.append(ThreadInfo(name, state, cpu))
+            name, state = header.group("name"), None
+            cpu = search_thread_cpu(header.group("attributes"))
+            cpu = float(cpu.group("cpu")) / 1000 if cpu is not None else None
+            continue
+        if name is not None and state is None:
+            matched = match_thread_state(line)
+            if matched is not None:
+                state = matched.group("state")
+    if name is not None:
+        result.append(ThreadInfo(name, state, cpu))
+    return result
+
+
+def busiest_threads(
+    first: List[ThreadInfo], second: List[ThreadInfo], count: int
+) -> List[ThreadInfo]:
+    """ Returns the threads that consumed the most CPU time between two thread
+        dumps, as ``ThreadInfo`` objects with the difference as ``cpu``. Threads
+        that only appear in the second dump are accounted completely. """
+    previous = {x.name: x.cpu or 0 for x in first}  # type: Dict[str, float]
+    deltas = [
+        x._replace(cpu=x.cpu - previous.get(x.name, 0))
+        for x in second
+        if x.cpu is not None
+    ]
+    return sorted(deltas, key=lambda x: x.cpu, reverse=True)[:count]
+
+
+def parse_class_histogram(text: str) -> List[HistogramEntry]:
+    """ Parses the output of ``jcmd <pid> GC.class_histogram``, the entries are
+        ordered by their occupied bytes as produced by the JVM. """
+    result = []
+    for line in text.splitlines():
+        matched = match_histogram_line(line)
+        if matched is not None:
+            result.append(HistogramEntry(
+                matched.group("class_name"),
+                int(matched.group("instances")),
+                int(matched.group("bytes")),
+            ))
+    return result
+
+
+GC_LOG_UNITS = {"B": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def summarize_gc_log(lines: Iterable[str]) -> Optional[dict]:
+    """ Summarizes the pauses that are logged by the JVM's unified logging with
+        the ``gc`` tag and the ``uptime`` decoration. The lines are consumed as
+        stream, JVM restarts are recognized by a decreasing uptime.
+
+        :returns: ``None`` if no pause was found, otherwise a mapping with the
+                  number of ``pauses`` and ``full_pauses``, the pause durations'
+                  ``p50``, ``p95``, ``p99`` and ``max`` in seconds, the
+                  ``pause_share`` of the logged time, the ``allocation_rate``
+                  in bytes per second, the heap occupancy after the last and
+                  the largest pause as ``heap_after_last`` and
+                  ``heap_after_max`` in bytes, and its ``heap_after_trend`` in
+                  bytes per second since the last start.
+    """
+    durations = []
+    full_pauses = 0
+    span = allocated = allocation_time = 0.0
+    heap_after_last = heap_after_max = 0
+    previous = None  # type: Optional[tuple]
+    # sums for a least squares fit of the heap occupancy after pauses
+    regression = [0, 0.0, 0.0, 0.0, 0.0]
+
+    for line in lines:
+        matched = search_gc_pause(line)
+        if matched is None:
+            continue
+
+        uptime = float(matched.group("uptime"))
+        before = int(matched.group("before")) * GC_LOG_UNITS[matched.group("before_unit")]
+        after = int(matched.group("after")) * GC_LOG_UNITS[matched.group("after_unit")]
+        durations.append(float(matched.group("duration")) / 1000)
+        if matched.group("kind") == "Pause Full":
+            full_pauses += 1
+
+        if previous is None or uptime < previous[0]:
+            regression = [0, 0.0, 0.0, 0.0, 0.0]
+        else:
+            span += uptime - previous[0]
+            if before >= previous[1]:
+                allocated += before - previous[1]
+                allocation_time += uptime - previous[0]
+        previous = (uptime, after)
+
+        heap_after_last = after
+        heap_after_max = max(heap_after_max, after)
+        regression[0] += 1
+        regression[1] += uptime
+        regression[2] += after
+        regression[3] += uptime * after
+        regression[4] += uptime * uptime
+
+    if not durations:
+        return None
+
+    count, sum_x, sum_y, sum_xy, sum_xx = regression
+    denominator = count * sum_xx - sum_x * sum_x
+    durations.sort()
+    return {
+        "pauses": len(durations),
+        "full_pauses": full_pauses,
+        "p50": percentile(durations, 0.5),
+        "p95": percentile(durations, 0.95),
+        "p99": percentile(durations, 0.99),
+        "max": durations[-1],
+        "pause_share": sum(durations) / span if span else 0.0,
+        "allocation_rate": allocated / allocation_time if allocation_time else 0.0,
+        "heap_after_last": heap_after_last,
+        "heap_after_max": heap_after_max,
+        "heap_after_trend": (
+            (count * sum_xy - sum_x * sum_y) / denominator if denominator else 0.0
+        ),
+    }
@@ -0,0 +1,243 @@
+import asyncio
+from collections import namedtuple
+from time import monotonic
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+from existance.utils import percentile
+
+
+Response = namedtuple("Response", ("status", "headers", "body", "duration"))
+
+
+class HTTPError(Exception):
+    """ Raised when a response can't be obtained or parsed. """
+
+
+class ConnectionPool:
+    """ A minimal asynchronous HTTP/1.1 client that keeps up to ``size``
+        connections to one host alive and reuses them for subsequent requests.
+
+        It's meant to query eXist-db instances on the local host and hence
+        neither supports TLS nor redirects. Instances must be created within a
+        coroutine.
+    """
+
+    def __init__(
+        self, host: str, port: int, size: int = 4, timeout: Optional[float] = 30
+    ):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._idle = []  # type: List[tuple]
+        self._semaphore = asyncio.Semaphore(size)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    async def request(
+        self, method: str, path: str, body: bytes = b"", headers: dict = None
+    ) -> Response:
+        async with self._semaphore:
+            started = monotonic()
+            try:
+                return await asyncio.wait_for(
+                    self._request(method, path, body, headers or {}, started),
+                    timeout=self.timeout,
+                )
+            except asyncio.TimeoutError:
+                raise HTTPError(f"Request timed out: {method} {path}")
+
+    async def _request(self, method, path, body, headers, started):
+        reused = bool(self._idle)
+        reader, writer = await self._connection()
+        try:
+            response, keep_alive = await self._exchange(
+                reader, writer, method, path, body, headers, started
+            )
+        except (ConnectionError, asyncio.IncompleteReadError, HTTPError):
+            writer.close()
+            if not reused:
+                raise
+            # the server may have closed an idle connection in the meantime
+            reader, writer = await self._connection(fresh=True)
+            response, keep_alive = await self._exchange(
+                reader, writer, method, path, body, headers, started
+            )
+
+        if keep_alive:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return response
+
+    async def _connection(self, fresh: bool = False):
+        if self._idle and not fresh:
+            return self._idle.pop()
+        try:
+            return await asyncio.open_connection(self.host, self.port)
+        except OSError as e:
+            raise HTTPError(f"Connection to {self.host}:{self.port} failed: {e}")
+
+    async def _exchange(self, reader, writer, method, path, body, headers, started):
+        head = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            "Connection: keep-alive",
+            f"Content-Length: {len(body)}",
+        ]
+        head.extend(f"{k}: {v}" for k, v in headers.items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise HTTPError("Connection closed by the server.")
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise HTTPError(f"Invalid status line: {status_line!r}")
+
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            response_body = b""
+        elif response_headers.get("transfer-encoding", "").lower() == "chunked":
+            response_body = await self._read_chunked(reader)
+        elif "content-length" in response_headers:
+            response_body = await reader.readexactly(
+                int(response_headers["content-length"])
+            )
+        else:
+            response_body = await reader.read()
+            response_headers["connection"] = "close"
+
+        keep_alive = response_headers.get("connection", "").lower() != "close"
+        return (
+            Response(status, response_headers, response_body, monotonic() - started),
+            keep_alive,
+        )
+
+    @staticmethod
+    async def _read_chunked(reader) -> bytes:
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if not size:
+                # skip trailers
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+
+async def wait_until_reachable(
+    host: str, port: int, path: str, timeout: float, interval: float = 1
+) -> float:
+    """ Polls a URL until it responds with a status below 500.
+
+        :returns: The waited seconds.
+        :raises HTTPError: If the timeout elapsed.
+    """
+    started = monotonic()
+    while monotonic() - started < timeout:
+        async with ConnectionPool(host, port, size=1, timeout=interval * 10) as pool:
+            try:
+                response = await pool.request("GET", path)
+            except HTTPError:
+                pass
+            else:
+                if response.status < 500:
+                    return monotonic() - started
+        await asyncio.sleep(interval)
+    raise HTTPError(f"{host}:{port}{path} wasn't reachable within {timeout} s.")
+
+
+async def measure_load(
+    host: str,
+    port: int,
+    requests_specs: List[Tuple[str, str]],
+    concurrency: int,
+    duration: float,
+) -> dict:
+    """ Sends the given requests repeatedly with the given concurrency for the
+        given seconds. A client backs off exponentially after a failed request
+        so that an unresponsive instance isn't flooded with connection attempts.
+
+        :returns: A mapping with the number of successful ``requests`` and
+                  ``errors``, the ``throughput`` per second and the latencies
+                  ``p50``, ``p95``, ``p99`` and ``max`` in seconds.
+    """
+    latencies, errors = [], 0
+
+    async def worker(pool, offset, deadline):
+        nonlocal errors
+        index, backoff = offset, 0
+        while monotonic() < deadline:
+            method, path = requests_specs[index % len(requests_specs)]
+            index += 1
+            try:
+                response = await pool.request(method, path)
+            except HTTPError:
+                errors += 1
+                backoff = min(max(backoff * 2, 0.05), 1)
+                await asyncio.sleep(min(backoff, max(deadline - monotonic(), 0)))
+                continue
+            backoff = 0
+            if response.status >= 400:
+                errors += 1
+            else:
+                latencies.append(response.duration)
+
+    async with ConnectionPool(host, port, size=concurrency) as pool:
+        started = monotonic()
+        await asyncio.gather(
+            *(worker(pool, i, started + duration) for i in range(concurrency))
+        )
+        elapsed = monotonic() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else float("nan"),
+    }
+
+
+def parse_request_specs(value: str, instance_name: str) -> List[Tuple[str, str]]:
+    """ Parses lines like ``GET /{instance_name}/apps/`` or ``XQUERY <query>``
+        into tuples of a request method and path. Queries are sent to the
+        instance's REST interface. """
+    result = []
+    for line in (x.strip() for x in value.splitlines()):
+        if not line or line.startswith("#"):
+            continue
+        method, _, argument = line.partition(" ")
+        method, argument = method.upper(), argument.strip()
+        if method == "XQUERY":
+            result.append((
+                "GET",
+                f"/{instance_name}/rest/db?_howmany=1&_query={quote(argument)}",
+            ))
+        else:
+            result.append((method, argument.replace("{instance_name}", instance_name)))
+    return result
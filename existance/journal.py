@@ -0,0 +1,112 @@
+import json
+import re
+from collections import namedtuple
+from typing import Iterable, Iterator, List
+
+from existance.utils import format_duration
+
+
+UnitEvent = namedtuple("UnitEvent", ("time", "instance", "kind", "detail"))
+
+
+# identifiers of systemd's structured messages, see `journalctl --list-catalog`
+UNIT_STARTING = "7d4958e842da4a758f6c1cdc7b36dcc5"
+UNIT_STARTED = "39f53479d3a045ac8e11786248231fbf"
+UNIT_RESTART_SCHEDULED = "5eb03494b6584870a536b337290809b3"
+UNIT_FAILURE_RESULT = "d9b373ed55a64feb8242e02dbe79a49c"
+UNIT_OUT_OF_MEMORY = "fe6faa94e7774663a0da52717891d8ef"
+
+
+match_instance_unit = re.compile(r"^existdb@(?P<id>\d+)\.service$").match
+
+
+def parse_journal_export(lines: Iterable[str]) -> Iterator[dict]:
+    """ Parses the output of ``journalctl --output=json``, one entry per line.
+        Fields that the journal holds as binary data are decoded as UTF-8. """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        entry = json.loads(line)
+        for name, value in entry.items():
+            if isinstance(value, list) and all(isinstance(x, int) for x in value):
+                entry[name] = bytes(value).decode(errors="replace")
+        yield entry
+
+
+def analyze_journal(
+    entries: Iterable[dict],
+    state: dict,
+    restart_loop_count: int,
+    restart_loop_window: float,
+    slow_start: float,
+) -> List[UnitEvent]:
+    """ Detects restart loops, OOM kills, failures and slow starts of the
+        instances' units in journal entries. The given state carries pending
+        starts and recent restarts between invocations and it's updated with
+        the ``cursor`` and ``timestamp`` of the last entry.
+
+        :param restart_loop_count: The number of scheduled restarts within the
+                                   window that are considered as a loop.
+        :param restart_loop_window: The window for restart loops in seconds.
+        :param slow_start: Starts that take longer than these seconds are
+                           reported.
+        :returns: The events in the order of their occurrence.
+    """
+    starting = state.setdefault("starting", {})
+    restarts = state.setdefault("restarts", {})
+    result = []
+
+    for entry in entries:
+        if "__REALTIME_TIMESTAMP" in entry:
+            state["timestamp"] = int(entry["__REALTIME_TIMESTAMP"])
+        if "__CURSOR" in entry:
+            state["cursor"] = entry["__CURSOR"]
+
+        # systemd's messages about a unit carry its name in the UNIT field
+        matched = match_instance_unit(
+            entry.get("UNIT") or entry.get("_SYSTEMD_UNIT") or ""
+        )
+        if matched is None or "__REALTIME_TIMESTAMP" not in entry:
+            continue
+
+        _id, key = int(matched.group("id")), matched.group("id")
+        time = int(entry["__REALTIME_TIMESTAMP"]) / 1_000_000
+        message_id, message = entry.get("MESSAGE_ID"), entry.get("MESSAGE") or ""
+
+        if message_id == UNIT_STARTING:
+            starting[key] = time
+
+        elif message_id == UNIT_STARTED:
+            began = starting.pop(key, None)
+            if began is not None and time - began > slow_start:
+                result.append(UnitEvent(
+                    time, _id, "slow start",
+                    f"started after {format_duration(time - began)}",
+                ))
+
+        elif message_id == UNIT_RESTART_SCHEDULED:
+            starting.pop(key, None)
+            recent = [x for x in restarts.get(key, []) if time - x <= restart_loop_window]
+            recent.append(time)
+            if len(recent) >= restart_loop_count:
+                counter = entry.get("N_RESTARTS")
+                result.append(UnitEvent(
+                    time, _id, "restart loop",
+                    f"{len(recent)} restarts within "
+                    f"{format_duration(restart_loop_window)}"
+                    + (f", the restart counter is at {counter}" if counter else ""),
+                ))
+                # a continuing loop is reported again after as many restarts
+                recent = []
+            restarts[key] = recent
+
+        elif message_id == UNIT_OUT_OF_MEMORY:
+            result.append(UnitEvent(time, _id, "OOM kill", message))
+
+        elif message_id == UNIT_FAILURE_RESULT:
+            # OOM kills are reported by their own message
+            if entry.get("UNIT_RESULT") != "oom-kill":
+                result.append(UnitEvent(time, _id, "failure", message))
+
+    return result
@@ -0,0 +1,233 @@
+import csv
+import fcntl
+import os
+import shlex
+from collections import OrderedDict, abc
+from contextlib import contextmanager
+from pathlib import Path
+from tempfile import mkstemp
+from types import MappingProxyType
+from typing import Callable, Iterator, Mapping, Optional
+
+from existance.constants import INSTANCE_ENVIRONMENT_VARIABLES, INSTANCE_SETTINGS_FIELDS
+
+
+csv.register_dialect(
+    "instances_settings",
+    csv.unix_dialect,
+    quoting=csv.QUOTE_NONE,
+    skipinitialspace=True,
+)
+
+
+EXTRA_FIELD_TYPES = {"float": float, "int": int, "str": str}
+
+
+def parse_extra_fields(value: str) -> "OrderedDict[str, Callable]":
+    """ Parses a comma-separated list of ``name:type`` pairs where the type is
+        one of ``str``, ``int`` or ``float``. """
+    result = OrderedDict()
+    for item in (x.strip() for x in value.split(",")):
+        if not item:
+            continue
+        name, _, type_name = item.partition(":")
+        name, type_name = name.strip(), type_name.strip() or "str"
+        if name in INSTANCE_SETTINGS_FIELDS or type_name not in EXTRA_FIELD_TYPES:
+            raise ValueError(f"Invalid extra field for the instances settings: {item}")
+        result[name] = EXTRA_FIELD_TYPES[type_name]
+    return result
+
+
+class InstancesSettings(abc.Mapping):
+    """ The instances' settings file as read-only mapping of ids to rows with
+        an additional index of names.
+
+        The file is a csv file without quoting as the ``existctl`` script reads
+        its fields by their position, lines that start with ``#`` are ignored.
+        Additional fields with a type can be appended to each row. Reads hold a
+        shared and modifications an exclusive lock on a sidecar file; the
+        latter re-read the file and then replace it atomically so that parallel
+        invocations don't lose each other's rows and readers never observe a
+        partially written file.
+
+        Along with the file, a shell file with variables for each instance is
+        maintained in a directory besides it, so that ``existctl`` doesn't need
+        to search the instance's directory and settings. The ``environment``
+        callable can supply further variables for a row that derive from the
+        configuration and hence aren't stored in the file.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        extra_fields: Optional[Mapping[str, Callable]] = None,
+        environment: Optional[Callable[[Mapping], Mapping[str, str]]] = None,
+    ):
+        self.path = Path(path)
+        self.environment = environment
+        self.extra_fields = OrderedDict(extra_fields or ())
+        self.fieldnames = INSTANCE_SETTINGS_FIELDS + tuple(self.extra_fields)
+        self._by_id = OrderedDict()
+        self._by_name = {}
+        # trailing fields that aren't declared are preserved
+        self._undeclared = {}
+        self.by_name = MappingProxyType(self._by_name)
+
+        with self._lock(fcntl.LOCK_SH):
+            self._read()
+
+    def __getitem__(self, _id: int) -> dict:
+        return self._by_id[_id]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._by_id)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    @property
+    def environment_directory(self) -> Path:
+        return self.path.with_name(self.path.name + ".d")
+
+    def environment_file(self, _id: int) -> Path:
+        return self.environment_directory / f"{_id}.env"
+
+    def environment_content(self, _id: int) -> str:
+        row = self._by_id[_id]
+        variables = OrderedDict(
+            (variable, row[field])
+            for field, variable in INSTANCE_ENVIRONMENT_VARIABLES.items()
+        )
+        if self.environment is not None:
+            variables.update(self.environment(row))
+        return "# generated by existance, changes are overwritten\n" + "".join(
+            f"{k}={shlex.quote(str(v))}\n" for k, v in variables.items() if v
+        )
+
+    def insert(self, row: Mapping) -> None:
+        """ Adds a new instance's row.
+
+            :raises KeyError: If the id or name is used by another instance,
+                              possibly one that was added concurrently.
+        """
+        with self._lock(fcntl.LOCK_EX):
+            self._read()
+            _id = int(row["id"])
+            if _id in self._by_id or row["name"] in self._by_name:
+                raise KeyError(_id)
+            self._set(row)
+            self._write()
+
+    def remove(self, _id: int) -> None:
+        with self._lock(fcntl.LOCK_EX):
+            self._read()
+            if _id in self._by_id:
+                del self._by_name[self._by_id.pop(_id)["name"]]
+                self._undeclared.pop(_id, None)
+                self._write()
+
+    def upsert(self, row: Mapping) -> None:
+        """ Adds or updates an instance's row, fields that aren't contained in
+            the given row keep their stored value. """
+        with self._lock(fcntl.LOCK_EX):
+            self._read()
+            previous = self._by_id.get(int(row["id"]))
+            if previous is not None:
+                del self._by_name[previous["name"]]
+                row = {**previous, **row}
+            self._set(row)
+            self._write()
+
+    @contextmanager
+    def _lock(self, operation: int):
+        with self.path.with_name(self.path.name + ".lock").open("a") as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read(self):
+        self._by_id.clear()
+        self._by_name.clear()
+        self._undeclared.clear()
+        if not self.path.exists():
+            return
+
+        with self.path.open("rt") as f:
+            reader = csv.DictReader(
+                (x for x in f if x.strip() and not x.startswith("#")),
+                fieldnames=self.fieldnames,
+                dialect="instances_settings",
+            )
+            for row in reader:
+                undeclared = row.pop(None, None)
+                _id = self._set(row)
+                if undeclared:
+                    self._undeclared[_id] = undeclared
+
+    def _set(self, row: Mapping) -> int:
+        normalized = {}
+        for field in self.fieldnames:
+            value = row.get(field)
+            if field in self.extra_fields:
+                normalized[field] = (
+                    None if value in (None, "") else self.extra_fields[field](value)
+                )
+            else:
+                normalized[field] = "" if value is None else str(value)
+
+        _id = int(normalized["id"])
+        self._by_id[_id] = normalized
+        self._by_name[normalized["name"]] = normalized
+        return _id
+
+    def _write(self):
+        descriptor, temporary = mkstemp(
+            prefix=f".{self.path.name}.", dir=self.path.parent
+        )
+        try:
+            with os.fdopen(descriptor, "wt") as f:
+                print(f"# {','.join(self.fieldnames)}", file=f)
+                writer = csv.writer(f, dialect="instances_settings")
+                writer.writerows(
+                    ["" if row[x] is None else row[x] for x in self.fieldnames]
+                    + self._undeclared.get(_id, [])
+                    for _id, row in self._by_id.items()
+                )
+                f.flush()
+                os.fsync(f.fileno())
+            if self.path.exists():
+                stat = self.path.stat()
+                os.chown(temporary, stat.st_uid, stat.st_gid)
+                os.chmod(temporary, stat.st_mode & 0o7777)
+            else:
+                os.chmod(temporary, 0o644)
+            os.replace(temporary, self.path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+
+        self._write_environment_files()
+
+    def _write_environment_files(self):
+        directory = self.environment_directory
+        directory.mkdir(mode=0o755, exist_ok=True)
+
+        # rows from earlier versions lack the instance's directory
+        rows = {k: v for k, v in self._by_id.items() if v["instance_dir"]}
+
+        for _id in rows:
+            content = self.environment_content(_id)
+            path = self.environment_file(_id)
+            if path.exists() and path.read_text() == content:
+                continue
+            temporary = path.with_name(f".{path.name}.tmp")
+            temporary.write_text(content)
+            temporary.chmod(0o644)
+            os.replace(temporary, path)
+
+        for path in directory.glob("*.env"):
+            if not path.stem.isdigit() or int(path.stem) not in rows:
+                path.unlink()
@@ -1,3 +1,5 @@
+from typing import Dict, Sequence, Tuple
+
 from pkg_resources import resource_string
 
 
@@ -8,14 +10,67 @@ NGINX_MAPPING_PREAMBLE = """\
 # - include this configuration in the webserver configuration
 #   - e.g. place it in /etc/nginx/proxy-mappings in conjunction with the
 #     `nginx-site` template
+#   - the upstream definition and the cache path must be placed in the http
+#     context, e.g. in /etc/nginx/proxy-upstreams
 # - replace the tokens enclosed by < and > with actual values
 
 """
 
 
+NGINX_MAPPINGS_HEADER = """\
+# This file is generated by existance, manual changes will be overwritten.
+
+"""
+
+
+NGINX_VALIDATION_HARNESS = """\
+pid <directory>/nginx.pid;
+error_log <directory>/error.log;
+events {}
+http {
+  access_log off;
+  include <upstreams>;
+  server {
+    listen 127.0.0.1:8;
+    include <mappings>;
+  }
+}
+"""
+
+
+NGINX_MAPPING_UPSTREAM = """\
+upstream existdb_<instance_id> {
+  server 127.0.0.1:<instance_id>;
+  keepalive <keepalive>;
+}
+
+"""
+
+
+NGINX_MAPPING_CACHE_PATH = """\
+proxy_cache_path <cache_directory>/<instance_id> levels=1:2 keys_zone=existdb_<instance_id>:<cache_zone_size> max_size=<cache_max_size> inactive=<cache_inactive>;
+
+"""
+
+
 NGINX_MAPPING_ROUTE = """\
 location /<instance_name>/ {
-  proxy_pass http://localhost:<instance_id>/<instance_name>/;
+  proxy_pass http://existdb_<instance_id>/<instance_name>/;
+  proxy_http_version 1.1;
+  proxy_set_header Connection "";
+<buffers>}
+
+"""
+
+
+NGINX_MAPPING_STATIC_CACHE = """\
+location ~* ^/<instance_name>/.+\\.(<cache_extensions>)$ {
+  proxy_pass http://existdb_<instance_id>;
+  proxy_http_version 1.1;
+  proxy_set_header Connection "";
+<buffers>  proxy_cache existdb_<instance_id>;
+  proxy_cache_valid 200 <cache_valid>;
+  add_header X-Cache-Status $upstream_cache_status;
 }
 
 """
@@ -26,16 +81,90 @@ NGINX_MAPPING_STATUS_FILTER = """\
 location = /<instance_name>/status {
   allow <trusted_client>;
   deny all;
-  proxy_pass http://localhost:<instance_id>/<instance_name>/status;
+  proxy_pass http://existdb_<instance_id>/<instance_name>/status;
+  proxy_http_version 1.1;
+  proxy_set_header Connection "";
 }
 """
 
 
+NGINX_MAPPING_DEFAULTS = {
+    "keepalive": "16",
+    "proxy_buffer_size": "",
+    "proxy_buffers": "",
+    "cache": "no",
+    "cache_directory": "/var/cache/nginx/existdb",
+    "cache_zone_size": "10m",
+    "cache_max_size": "1g",
+    "cache_inactive": "60m",
+    "cache_valid": "10m",
+    "cache_extensions": "css|js|gif|ico|jpe?g|png|svg|woff2?|ttf",
+}
+
+
+def render_template(template: str, **tokens) -> str:
+    """ Replaces the tokens enclosed by < and > in a template. """
+    for name, value in tokens.items():
+        template = template.replace(f"<{name}>", str(value))
+    return template
+
+
+def render_nginx_mapping(
+    instance_id: int,
+    instance_name: str,
+    options: Dict[str, str],
+    trusted_clients: Sequence[str] = (),
+) -> Tuple[str, str]:
+    """ Renders the configuration to proxy an instance with nginx.
+
+        :param options: Overrides the ``NGINX_MAPPING_DEFAULTS``.
+        :returns: The snippets for the http and the server context.
+    """
+    options = {**NGINX_MAPPING_DEFAULTS, **options}
+    cache = options["cache"].lower() in ("1", "yes", "true", "on")
+
+    buffers = "".join(
+        f"  {x} {options[x]};\n"
+        for x in ("proxy_buffer_size", "proxy_buffers")
+        if options[x]
+    )
+
+    http_snippet = NGINX_MAPPING_UPSTREAM
+    server_snippet = NGINX_MAPPING_ROUTE
+    if cache:
+        http_snippet += NGINX_MAPPING_CACHE_PATH
+        server_snippet += NGINX_MAPPING_STATIC_CACHE
+    if trusted_clients:
+        server_snippet += NGINX_MAPPING_STATUS_FILTER
+        server_snippet = server_snippet.replace(
+            "allow <trusted_client>;", " ".join(f"allow {x};" for x in trusted_clients)
+        )
+
+    tokens = {
+        k: v for k, v in options.items() if k not in ("proxy_buffer_size", "proxy_buffers")
+    }
+    tokens.update(instance_id=instance_id, instance_name=instance_name, buffers=buffers)
+    return (
+        render_template(http_snippet, **tokens),
+        render_template(server_snippet, **tokens),
+    )
+
+
 TEMPLATES = {
     "existctl": resource_string(__name__, 'files/existctl.template'),
     "nginx-site": resource_string(__name__, 'files/nginx-default-site.template'),
     "nginx-mapping": NGINX_MAPPING_PREAMBLE
+    + NGINX_MAPPING_UPSTREAM
+    + NGINX_MAPPING_CACHE_PATH
     + NGINX_MAPPING_ROUTE
+    + NGINX_MAPPING_STATIC_CACHE
     + NGINX_MAPPING_STATUS_FILTER,
+    "systemd-log-rotation-service": resource_string(
+        __name__, 'files/existance-log-rotation.service.template'
+    ),
+    "systemd-log-rotation-timer": resource_string(
+        __name__, 'files/existance-log-rotation.timer.template'
+    ),
+    "systemd-slice": resource_string(__name__, 'files/existdb.slice.template'),
     "systemd-unit": resource_string(__name__, 'files/existdb@.service.template'),
 }
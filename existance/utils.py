@@ -1,24 +1,1071 @@
+import asyncio
+import fcntl
+import gzip
+import json
+import math
+import os
 import random
+import re
+import shutil
 import subprocess
+import sys
+import tarfile
+import threading
+from collections import namedtuple, OrderedDict
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
+from contextlib import suppress
+from datetime import datetime
 from pathlib import Path
+from stat import S_IMODE, S_ISDIR, S_IWUSR
+from time import monotonic
+from typing import (
+    Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+)
+from uuid import uuid4
 
 from existance.constants import (
+    BATCHABLE_COMMANDS,
+    COPY_BUFFER_SIZE,
+    DEFAULT_COMMAND_CONCURRENCY,
+    GZIP_MAGIC,
     INTERACTIVE_SUBPROCESS_KWARGS,
+    IO_SCHEDULING_CLASSES,
+    MAX_BATCHED_ARGUMENTS,
+    PARALLEL_COMPRESSORS,
     PASSWORD_CHARACTERS,
-    SEPARATOR
+    SEPARATOR,
+    SIZE_UNITS,
+    STATE_DIRECTORY,
+    TIMING_SAMPLES,
+    TRASH_DIRECTORY_NAME,
+    ZSTD_MAGIC,
 )
 
 
+CommandRecord = namedtuple("CommandRecord", ("args", "returncode", "duration"))
+
+
+# commands
+
+
+class CommandRunner:
+    """ Runs external commands concurrently on an asyncio event loop.
+
+    :param limits: A mapping of command names (the executable as first argument)
+                   to the number of concurrently allowed invocations.
+    :param default_limit: The concurrency limit for commands without an entry in
+                          ``limits``.
+    :param timeout: A default timeout in seconds for each invocation.
+    :param stub: If given, nothing is executed. Instead the argument tuples are
+                 looked up in this mapping or passed to this callable to obtain
+                 ``(returncode, stdout, stderr)`` tuples (or only a returncode).
+                 Unknown commands are answered with a return code of ``0``.
+
+    All invocations are recorded with their durations in :attr:`history`.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Mapping[str, int]] = None,
+        default_limit: int = DEFAULT_COMMAND_CONCURRENCY,
+        timeout: Optional[float] = None,
+        stub: Union[None, Mapping, Callable] = None,
+    ):
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self.timeout = timeout
+        self.stub = stub
+        self.history = []  # type: List[CommandRecord]
+        self._semaphores = {}
+        self._loop = None
+
+    # synchronous interface
+
+    def run(self, *args, **kwargs) -> subprocess.CompletedProcess:
+        """ Runs one command and blocks until it finished. The keyword arguments
+            are the same as those of :meth:`execute`. """
+        return run_coroutine(self.execute(args, **kwargs))
+
+    def run_many(
+        self, commands: Iterable[Sequence], batch: bool = False, **kwargs
+    ) -> List[subprocess.CompletedProcess]:
+        """ Runs all commands concurrently and blocks until all finished.
+            See :meth:`execute_many` for the arguments. """
+        return run_coroutine(self.execute_many(commands, batch=batch, **kwargs))
+
+    # asynchronous interface
+
+    async def execute(
+        self,
+        args: Sequence,
+        check: bool = True,
+        capture_output: bool = False,
+        text: bool = False,
+        timeout: Optional[float] = None,
+        input: Union[None, bytes, str] = None,
+        **kwargs,
+    ) -> subprocess.CompletedProcess:
+        """ Runs one command once the concurrency limit for its kind allows it.
+
+            The returned object carries an additional attribute ``duration`` with
+            the elapsed seconds. As with :func:`subprocess.run`,
+            :exc:`subprocess.CalledProcessError` is raised for non-zero exit
+            codes if ``check`` is set and :exc:`subprocess.TimeoutExpired` when
+            the timeout elapses. Further keyword arguments like ``cwd`` or
+            ``env`` are passed to the subprocess. """
+
+        args = tuple(str(x) for x in args)
+        if timeout is None:
+            timeout = self.timeout
+
+        async with self._semaphore(command_name(args)):
+            started = monotonic()
+            if self.stub is not None:
+                returncode, stdout, stderr = self._stubbed_response(args)
+            else:
+                returncode, stdout, stderr = await self._spawn(
+                    args, capture_output, timeout, input, kwargs
+                )
+            duration = monotonic() - started
+
+        self.history.append(CommandRecord(args, returncode, duration))
+
+        if text:
+            if isinstance(stdout, bytes):
+                stdout = stdout.decode()
+            if isinstance(stderr, bytes):
+                stderr = stderr.decode()
+
+        result = subprocess.CompletedProcess(args, returncode, stdout, stderr)
+        result.duration = duration
+        if check:
+            result.check_returncode()
+        return result
+
+    async def execute_many(
+        self, commands: Iterable[Sequence], batch: bool = False, **kwargs
+    ) -> List[subprocess.CompletedProcess]:
+        """ Runs all given commands concurrently within the configured limits.
+
+            :param batch: Commands that are listed in ``BATCHABLE_COMMANDS`` and
+                          only differ in their last argument are merged into one
+                          invocation. Each of the merged commands is answered
+                          with the result of that invocation.
+            :returns: The results in the order of the given commands.
+        """
+
+        commands = [tuple(str(x) for x in c) for c in commands]
+        if not batch:
+            return await gather_or_cancel(*(self.execute(c, **kwargs) for c in commands))
+
+        groups = OrderedDict()  # type: Dict[tuple, List[List[int]]]
+        for index, command in enumerate(commands):
+            if command[0] in BATCHABLE_COMMANDS and len(command) > 1:
+                key = command[:-1]
+            else:
+                key = (index,)
+            chunks = groups.setdefault(key, [[]])
+            if len(chunks[-1]) == MAX_BATCHED_ARGUMENTS:
+                chunks.append([])
+            chunks[-1].append(index)
+
+        batches, invocations = [], []
+        for key, chunks in groups.items():
+            for indexes in chunks:
+                batches.append(indexes)
+                if len(indexes) == 1:
+                    invocations.append(commands[indexes[0]])
+                else:
+                    invocations.append(key + tuple(commands[i][-1] for i in indexes))
+
+        results = await gather_or_cancel(
+            *(self.execute(c, **kwargs) for c in invocations)
+        )
+
+        merged = [None] * len(commands)
+        for indexes, result in zip(batches, results):
+            for index in indexes:
+                merged[index] = result
+        return merged
+
+    # internals
+
+    def _semaphore(self, command: str) -> asyncio.Semaphore:
+        loop = asyncio.get_event_loop()
+        if loop is not self._loop:
+            # semaphores are bound to the loop that they're first used with
+            self._loop, self._semaphores = loop, {}
+        if command not in self._semaphores:
+            self._semaphores[command] = asyncio.Semaphore(
+                self.limits.get(command, self.default_limit)
+            )
+        return self._semaphores[command]
+
+    async def _spawn(self, args, capture_output, timeout, input, kwargs):
+        if capture_output:
+            streams = {"stdout": subprocess.PIPE, "stderr": subprocess.PIPE}
+        else:
+            streams = {
+                x: INTERACTIVE_SUBPROCESS_KWARGS[x] for x in ("stdout", "stderr")
+            }
+        if input is not None:
+            streams["stdin"] = subprocess.PIPE
+            if isinstance(input, str):
+                input = input.encode()
+        else:
+            streams["stdin"] = INTERACTIVE_SUBPROCESS_KWARGS["stdin"]
+
+        process = await asyncio.create_subprocess_exec(*args, **{**streams, **kwargs})
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(input), timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise subprocess.TimeoutExpired(args, timeout)
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        return process.returncode, stdout, stderr
+
+    def _stubbed_response(self, args):
+        if callable(self.stub):
+            response = self.stub(args)
+        else:
+            response = self.stub.get(args)
+
+        if response is None:
+            return 0, b"", b""
+        if isinstance(response, int):
+            return response, b"", b""
+        returncode, stdout, stderr = response
+        return returncode, stdout, stderr
+
+
+def as_user(user: str, *args) -> tuple:
+    """ Wraps a command so that it's run as another user. """
+    return ("runuser", "-u", user, "--") + args
+
+
+def command_name(args: Sequence[str]) -> str:
+    """ Returns the name of a command's executable, also of those that are
+        wrapped with :func:`as_user`. """
+    if Path(args[0]).name == "runuser" and "--" in args:
+        return Path(args[args.index("--") + 1]).name
+    return Path(args[0]).name
+
+
+def configure_command_runner(config) -> None:
+    """ Applies the ``command_concurrency`` setting from the ``existance``
+        section of the configuration to the :data:`command_runner`. """
+    value = config.get("existance", "command_concurrency", fallback="")
+    for item in (x.strip() for x in value.split(",")):
+        if item:
+            command, limit = item.split(":")
+            command_runner.limits[command.strip()] = int(limit)
+
+
+def instance_options(config, section: str, instance_id: int) -> Dict[str, str]:
+    """ Returns the uninterpolated options of a configuration section merged with
+        those of an instance specific section whose name is suffixed with a colon
+        and the instance's id, e.g. ``[warmup:8001]``. """
+    result = {}
+    for name in (section, f"{section}:{instance_id}"):
+        if config.has_section(name):
+            result.update(config.items(name, raw=True))
+    return result
+
+
 def external_command(*args, **kwargs) -> subprocess.CompletedProcess:
     # TODO *maybe* the input argument can be used to provide input and thus the
     #      installer may not require user input
+    return command_runner.run(*args, **kwargs)
+
+
+def state_directory(config, *parts: str) -> Path:
+    """ Returns a (sub-)directory of the configured directory where existance
+        keeps data between invocations and creates it if needed. """
+    result = Path(
+        config.get("existance", "state_directory", fallback=STATE_DIRECTORY), *parts
+    )
+    result.mkdir(mode=0o750, parents=True, exist_ok=True)
+    return result
+
+
+async def gather_or_cancel(*coroutines) -> list:
+    """ Like :func:`asyncio.gather`, but if one of the coroutines fails, the
+        others are cancelled and awaited before the exception is propagated. """
+    tasks = [asyncio.ensure_future(x) for x in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def run_coroutine(coroutine):
+    """ Runs a coroutine to completion on a fresh event loop. """
+    # since Python 3.8 the default child watcher observes subprocesses from
+    # any thread's loop, hence the loop isn't set as the thread's current one
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+command_runner = CommandRunner()
+
+
+class TimingHistory:
+    """ Keeps the durations of recent runs of actions along with the number of
+        bytes that they processed, if applicable, in a json file. """
+
+    def __init__(self, path: Path, samples: int = TIMING_SAMPLES):
+        self.path = path
+        self.samples = samples
+        try:
+            self.records = json.loads(path.read_text()) if path.exists() else {}
+        except ValueError:
+            self.records = {}
+
+    def estimate(self, name: str, workload: Optional[int] = None) -> Optional[float]:
+        """ Estimates the seconds that an action takes from the median
+            throughput of earlier runs if a workload in bytes is given and these
+            were recorded with one, from the median duration otherwise.
+
+            :returns: ``None`` if there are no records for the action.
+        """
+        records = self.records.get(name)
+        if not records:
+            return None
+        if workload is not None:
+            rates = sorted(b / d for d, b in records if b and d)
+            if rates:
+                return workload / rates[len(rates) // 2]
+        return sorted(d for d, _ in records)[len(records) // 2]
+
+    def record(self, name: str, duration: float, workload: Optional[int] = None):
+        records = self.records.setdefault(name, [])
+        records.append((duration, workload))
+        del records[:-self.samples]
+
+    def save(self):
+        temporary = self.path.with_name(f".{self.path.name}.tmp")
+        temporary.write_text(json.dumps(self.records))
+        os.replace(temporary, self.path)
+
+
+# archives
+
+
+class CountingStream:
+    """ Wraps a binary stream and counts the bytes that pass through it. """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def read(self, size=-1) -> bytes:
+        data = self.stream.read(size)
+        self.count += len(data)
+        return data
+
+    def write(self, data) -> int:
+        self.count += len(data)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class PrefixedStream:
+    """ Wraps a binary stream for reading and returns the given bytes, which
+        were already read from it, first. """
+
+    def __init__(self, prefix: bytes, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1) -> bytes:
+        if not self.prefix:
+            return self.stream.read(size)
+        if size is None or size < 0:
+            data, self.prefix = self.prefix + self.stream.read(), b""
+        else:
+            data, self.prefix = self.prefix[:size], self.prefix[size:]
+        return data
+
+
+class ArchiveStream:
+    """ A context manager that provides a tarfile in stream mode which is
+        (de)compressed by an external, multithreaded compressor if available.
+
+        :param stream: The binary stream that the compressed data is written to
+                       or read from.
+        :param mode: Either ``w`` or ``r``.
+        :param compressor: The name of the preferred compressor when writing.
+
+        The attributes ``raw_bytes`` and ``compressed_bytes`` hold the amounts of
+        transferred data after the context was left.
+    """
+
+    def __init__(self, stream, mode: str, compressor: Optional[str] = None):
+        assert mode in ("r", "w")
+        self.stream = stream
+        self.mode = mode
+        self.compressor = compressor
+        self.raw_bytes = self.compressed_bytes = 0
+        self._process = self._feeder = self._counter = self._outer = None
+
+    def __enter__(self) -> tarfile.TarFile:
+        if self.mode == "w":
+            return self._open_writer()
+        else:
+            return self._open_reader()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._archive.close()
+        if self._process is None:
+            self._counter.stream.close()
+        else:
+            if self.mode == "w":
+                self._process.stdin.close()
+            else:
+                if exc_type is None:
+                    # the decompressor may still emit the archive's padding
+                    while self._process.stdout.read(COPY_BUFFER_SIZE):
+                        pass
+                self._process.stdout.close()
+            returncode = self._process.wait()
+            if self._feeder is not None:
+                self._feeder.join()
+            if returncode and exc_type is None:
+                raise subprocess.CalledProcessError(returncode, self._process.args)
+        if self.mode == "w":
+            self.stream.flush()
+        self.raw_bytes = self._counter.count
+        self.compressed_bytes = (
+            self._outer.count if self._outer is not None else self.raw_bytes
+        )
+
+    def _open_writer(self):
+        command = compressor_command(self.compressor)
+        self._outer = CountingStream(self.stream)
+        if command is None:
+            self._counter = CountingStream(
+                gzip.GzipFile(fileobj=self._outer, mode="wb", compresslevel=6)
+            )
+            self._archive = tarfile.open(fileobj=self._counter, mode="w|")
+            return self._archive
+
+        self._process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        self._feeder = threading.Thread(
+            target=shutil.copyfileobj, args=(self._process.stdout, self._outer)
+        )
+        self._feeder.start()
+        self._counter = CountingStream(self._process.stdin)
+        self._archive = tarfile.open(fileobj=self._counter, mode="w|")
+        return self._archive
+
+    def _open_reader(self):
+        # a pipe may return fewer bytes than requested per read
+        magic = b""
+        while len(magic) < len(ZSTD_MAGIC):
+            chunk = self.stream.read(len(ZSTD_MAGIC) - len(magic))
+            if not chunk:
+                break
+            magic += chunk
+        self.stream = PrefixedStream(magic, self.stream)
+
+        if magic.startswith(ZSTD_MAGIC):
+            command = decompressor_command("zstd")
+        elif magic.startswith(GZIP_MAGIC):
+            command = decompressor_command("pigz")
+        else:
+            raise ValueError("The input is neither gzip nor zstd compressed.")
+
+        self._outer = CountingStream(self.stream)
+        if command is None:
+            self._counter = CountingStream(gzip.GzipFile(fileobj=self._outer, mode="rb"))
+        else:
+            self._process = subprocess.Popen(
+                command, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            )
+            self._feeder = threading.Thread(
+                target=self._feed, args=(self._outer, self._process.stdin)
+            )
+            self._feeder.start()
+            self._counter = CountingStream(self._process.stdout)
+
+        self._archive = tarfile.open(fileobj=self._counter, mode="r|")
+        return self._archive
+
+    @staticmethod
+    def _feed(source, target):
+        try:
+            shutil.copyfileobj(source, target)
+        except BrokenPipeError:
+            pass
+        finally:
+            try:
+                target.close()
+            except BrokenPipeError:
+                pass
+
+
+def compress_files(
+    paths: Sequence[Path], processes: Optional[int] = None, nice: int = 0,
+    io_class: Optional[str] = None,
+) -> List[Tuple[Path, int, int]]:
+    """ Compresses files with gzip in a pool of processes that run with the
+        given niceness and I/O scheduling class. Each file is replaced by its
+        compressed copy with the same owner, permissions and modification time
+        unless it was modified in the meantime.
+
+        :returns: The paths of the compressed files with their original and
+                  compressed sizes.
+    """
+    if not paths:
+        return []
+    with ProcessPoolExecutor(
+        max_workers=processes or None,
+        initializer=lower_process_priority,
+        initargs=(nice, io_class),
+    ) as executor:
+        results = executor.map(compress_file, (str(x) for x in paths))
+        return [(Path(x), *r) for x, r in zip(paths, results) if r is not None]
+
+
+def compress_file(path: str) -> Optional[Tuple[int, int]]:
+    """ Compresses a file to ``<path>.gz`` or, if that exists already, to the
+        first unused ``<path>.<n>.gz``. """
+    stat = os.stat(path)
+    target = path + ".gz"
+    temporary = f"{target}.tmp"
+    try:
+        with open(path, "rb") as source, gzip.open(temporary, "wb") as compressed:
+            shutil.copyfileobj(source, compressed, COPY_BUFFER_SIZE)
+        current = os.stat(path)
+        if (current.st_size, current.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            os.unlink(temporary)
+            return None
+        os.chown(temporary, stat.st_uid, stat.st_gid)
+        os.chmod(temporary, stat.st_mode & 0o7777)
+        os.utime(temporary, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        # linking fails instead of replacing an existing target
+        number = 0
+        while True:
+            try:
+                os.link(temporary, target)
+            except FileExistsError:
+                number += 1
+                target = f"{path}.{number}.gz"
+            else:
+                break
+        os.unlink(temporary)
+        os.unlink(path)
+    except OSError:
+        with suppress(FileNotFoundError):
+            os.unlink(temporary)
+        return None
+    return stat.st_size, os.stat(target).st_size
+
+
+def lower_process_priority(nice: int, io_class: Optional[str]) -> None:
+    """ Lowers the CPU and I/O priority of the current process. """
+    if nice:
+        os.nice(nice)
+    if io_class is not None and shutil.which("ionice"):
+        subprocess.run(
+            ["ionice", *IO_SCHEDULING_CLASSES[io_class], "-p", str(os.getpid())],
+            check=False,
+        )
+
+
+def compressor_command(preferred: Optional[str] = None) -> Optional[Tuple[str, ...]]:
+    """ Returns the command line of the preferred or otherwise first available
+        parallel compressor, ``None`` if none is installed. """
+    for name in (preferred,) + tuple(PARALLEL_COMPRESSORS):
+        if name in PARALLEL_COMPRESSORS and shutil.which(name):
+            return (name,) + PARALLEL_COMPRESSORS[name][0]
+    return None
+
+
+def decompressor_command(name: str) -> Optional[Tuple[str, ...]]:
+    """ Returns the command line to decompress with the named tool. For gzip
+        data, ``None`` signals to fall back to Python's decompressor. """
+    if shutil.which(name):
+        return (name,) + PARALLEL_COMPRESSORS[name][1]
+    elif name == "zstd":
+        raise RuntimeError("zstd compressed data requires the zstd command.")
+    return None
+
+
+# files
+
+
+def clone_tree(
+    source: Path, target: Path, hardlinked_suffixes: Sequence[str] = ()
+) -> str:
+    """ Copies a directory tree as cheap as the filesystem allows. Reflinks that
+        share all data blocks until these are modified are tried first. If the
+        filesystem doesn't support these, files with one of the given suffixes
+        are hardlinked and all others are copied.
+
+        :returns: The name of the used method, ``reflink``, ``hardlink`` or
+                  ``copy``.
+    """
+
+    try:
+        external_command(
+            "cp", "-a", "--reflink=always", source, target, capture_output=True
+        )
+        return "reflink"
+    except subprocess.CalledProcessError:
+        shutil.rmtree(target, ignore_errors=True)
+
+    if not hardlinked_suffixes:
+        external_command("cp", "-a", source, target, capture_output=True)
+        return "copy"
+
+    def link_or_copy(src, dst):
+        if src.endswith(tuple(hardlinked_suffixes)):
+            os.link(src, dst)
+        else:
+            shutil.copy2(src, dst)
+
+    shutil.copytree(source, target, symlinks=True, copy_function=link_or_copy)
+    return "hardlink"
+
+
+def build_overlay(
+    distribution: Path,
+    target: Path,
+    copied_paths: Iterable[str],
+    private_directories: Iterable[str] = (),
+) -> Tuple[int, int]:
+    """ Mirrors a distribution's directories into the target and links its files
+        symbolically, so that instances share one copy of them on disk and in
+        the page cache. Files and directories that are matched by the given
+        relative paths are copied instead, the content of the private
+        directories is omitted.
+
+        :returns: The numbers of linked and copied files.
+    """
+    copied_paths = {Path(x) for x in copied_paths}
+    private_directories = {Path(x) for x in private_directories}
+    linked = copied = 0
+
+    for root, directories, files in os.walk(distribution):
+        relative_root = Path(root).relative_to(distribution)
+        (target / relative_root).mkdir(exist_ok=True)
+        if relative_root in private_directories:
+            directories.clear()
+            continue
+
+        # symlinked directories aren't walked into
+        linked_directories = [x for x in directories if (Path(root) / x).is_symlink()]
+        for name in linked_directories:
+            directories.remove(name)
+
+        for name in files + linked_directories:
+            source, relative = Path(root) / name, relative_root / name
+            if copied_paths.intersection((relative, *relative.parents)):
+                shutil.copy2(source, target / relative, follow_symlinks=False)
+                if not source.is_symlink():
+                    (target / relative).chmod(source.stat().st_mode | S_IWUSR)
+                copied += 1
+            else:
+                (target / relative).symlink_to(source)
+                linked += 1
+
+    return linked, copied
+
+
+def find_mountpoint(path: Path) -> Path:
+    """ Returns the mountpoint of the filesystem that contains the path. """
+    path = path.resolve()
+    device = path.stat().st_dev
+    while path.parent != path and path.parent.stat().st_dev == device:
+        path = path.parent
+    return path
+
+
+def discard(*paths: Path) -> None:
+    """ Moves the given files or directories to the trash and starts a purge
+        in the background. The content of a mountpoint is moved instead. """
+    trashed = False
+    for path in paths:
+        if not (path.exists() or path.is_symlink()):
+            continue
+        if path.is_mount():
+            for child in path.iterdir():
+                move_to_trash(child)
+        else:
+            move_to_trash(path)
+        trashed = True
+    if trashed:
+        purge_in_background()
+
+
+def move_to_trash(path: Path) -> Path:
+    """ Moves a file or directory into the trash folder at the root of its
+        filesystem, which is an atomic and instant operation.
+
+        :returns: The path within the trash folder.
+        :raises PermissionError: If an existing trash folder is accessible by
+                                 other users than the executing one.
+    """
+    trash = find_mountpoint(path.parent) / TRASH_DIRECTORY_NAME
+    with suppress(FileExistsError):
+        trash.mkdir(mode=0o700)
+    if not is_private_directory(trash.lstat()):
+        raise PermissionError(
+            f"{trash} must be a directory that only its owner {os.geteuid()} can "
+            "access."
+        )
+    target = trash / f"{datetime.now():%Y%m%d%H%M%S}-{uuid4().hex[:8]}-{path.name}"
+    path.rename(target)
+    return target
+
+
+def is_private_directory(stat: os.stat_result) -> bool:
+    """ Tells whether the stat of a path that wasn't followed if it's a
+        symbolic link is that of a directory which only the executing user,
+        i.e. root, owns and can access. """
+    return (
+        S_ISDIR(stat.st_mode)
+        and stat.st_uid == os.geteuid()
+        and S_IMODE(stat.st_mode) == 0o700
+    )
+
+
+def open_directory(name: str, parent: Optional[int] = None) -> Optional[int]:
+    """ Opens a directory relative to the descriptor of its parent without
+        following a symbolic link.
+
+        :returns: The directory's descriptor or ``None`` if it's no directory.
+        :raises OSError: If the directory was replaced meanwhile.
+    """
+    stat = os.stat(name, dir_fd=parent, follow_symlinks=False)
+    if not S_ISDIR(stat.st_mode):
+        return None
+    descriptor = os.open(
+        name, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW, dir_fd=parent
+    )
+    if not os.path.samestat(stat, os.fstat(descriptor)):
+        os.close(descriptor)
+        raise OSError(f"{name} was replaced while it was opened.")
+    return descriptor
+
+
+def remove_tree(parent: int, name: str) -> None:
+    """ Removes a file or a directory tree relative to the descriptor of its
+        parent. Like :func:`shutil.rmtree` where it's supported, each
+        directory is opened relative to its parent's descriptor, so that a
+        symbolic link that is swapped in by another user is never followed. """
+    descriptor = open_directory(name, parent)
+    if descriptor is None:
+        with suppress(FileNotFoundError):
+            os.unlink(name, dir_fd=parent)
+        return
+    try:
+        with os.scandir(descriptor) as entries:
+            names = [x.name for x in entries]
+        for child in names:
+            remove_tree(descriptor, child)
+    finally:
+        os.close(descriptor)
+    os.rmdir(name, dir_fd=parent)
+
+
+def purge_in_background() -> None:
+    """ Starts ``existance trash purge`` in a detached process with the lowest
+        CPU and I/O priority. """
+    command = ["nice", "-n", "19", sys.executable, "-m", "existance", "trash", "purge"]
+    if shutil.which("ionice"):
+        command[:0] = ["ionice", "-c", "3"]
+    subprocess.Popen(
+        command,
+        cwd=Path(__file__).parent.parent,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def purge_trash(lock_file: Path, threads: int = 16) -> int:
+    """ Deletes the content of all trash folders. The entries of trashed
+        directories are removed by parallel threads, all relative to the
+        descriptors of their opened parents, see :func:`remove_tree`. Purges
+        are serialized with the lock file and repeated until no new entries
+        were added in the meantime.
+
+        :returns: The number of purged trash entries.
+    """
+    def remove_quietly(parent: int, name: str):
+        # what can't be removed stays in the trash for the next purge
+        with suppress(OSError):
+            remove_tree(parent, name)
+
+    purged = set()
+    with lock_file.open("a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        while True:
+            trashes = []
+            try:
+                for path in trash_directories():
+                    with suppress(OSError):
+                        trashes.append(open_directory(str(path)))
+                entries = []
+                for trash in (x for x in trashes if x is not None):
+                    stat = os.fstat(trash)
+                    if not is_private_directory(stat):
+                        continue
+                    entries.extend(
+                        (trash, name, (stat.st_dev, stat.st_ino, name))
+                        for name in os.listdir(trash)
+                        if (stat.st_dev, stat.st_ino, name) not in purged
+                    )
+                if not entries:
+                    return len(purged)
+
+                emptied = []
+                with ThreadPoolExecutor(max_workers=threads) as executor:
+                    for trash, name, _ in entries:
+                        try:
+                            descriptor = open_directory(name, trash)
+                        except OSError:
+                            continue
+                        if descriptor is None:
+                            executor.submit(remove_quietly, trash, name)
+                            continue
+                        emptied.append((trash, name, descriptor))
+                        with os.scandir(descriptor) as children:
+                            for child in children:
+                                executor.submit(remove_quietly, descriptor, child.name)
+
+                for trash, name, descriptor in emptied:
+                    os.close(descriptor)
+                    with suppress(OSError):
+                        os.rmdir(name, dir_fd=trash)
+                purged.update(x[2] for x in entries)
+            finally:
+                for trash in (x for x in trashes if x is not None):
+                    os.close(trash)
+
+
+def purge_running(lock_file: Path) -> bool:
+    """ Tells whether a purge of the trash folders holds the lock. """
+    if not lock_file.exists():
+        return False
+    with lock_file.open("a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return False
+
+
+def trash_directories() -> List[Path]:
+    """ Returns the existing trash folders on all mounted filesystems, those
+        that other users can access are ignored. """
+    result, seen = [], set()
+    with open("/proc/self/mounts", "rt") as f:
+        mountpoints = [
+            # spaces and the like are escaped as octal sequences
+            re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), x.split()[1])
+            for x in f
+            if x.strip()
+        ]
+    for mountpoint in mountpoints:
+        candidate = Path(mountpoint) / TRASH_DIRECTORY_NAME
+        try:
+            stat = candidate.lstat()
+        except OSError:
+            continue
+        # others could swap in links to files that would be deleted as root
+        if is_private_directory(stat) and (stat.st_dev, stat.st_ino) not in seen:
+            seen.add((stat.st_dev, stat.st_ino))
+            result.append(candidate)
+    return result
+
+
+# sizes
+
+
+def disk_usage(
+    directories: Iterable[Path],
+    cache_file: Optional[Path] = None,
+    uncached: Iterable[Path] = (),
+    threads: int = 16,
+) -> Dict[Path, int]:
+    """ Sums the allocated bytes of all files within the given directories,
+        symbolic links aren't followed. The directories are scanned in
+        parallel.
+
+        If a cache file is given, the sum of a directory's files and the names
+        of its subdirectories are stored there along with the directory's
+        modification time. Directories whose modification time didn't change
+        since aren't scanned again. As that doesn't cover files that are
+        modified in place, trees like eXist-db's data directory can be passed
+        as ``uncached``.
+    """
+    directories = [Path(x) for x in directories]
+    uncached = tuple(str(x) for x in uncached)
+    cache = {}
+    if cache_file is not None and cache_file.exists():
+        try:
+            cache = json.loads(cache_file.read_text())
+        except ValueError:
+            pass
+    lock = threading.Lock()
+
+    def scan(directory: str) -> Tuple[int, List[str]]:
+        use_cache = cache_file is not None and not any(
+            directory == x or directory.startswith(x + os.sep) for x in uncached
+        )
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            return 0, []
+        if use_cache:
+            with lock:
+                cached = cache.get(directory)
+            if cached is not None and cached[0] == mtime:
+                return cached[1], [os.path.join(directory, x) for x in cached[2]]
+
+        size, subdirectories = 0, []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.name)
+                    elif entry.is_file(follow_symlinks=False):
+                        size += entry.stat(follow_symlinks=False).st_blocks * 512
+        except FileNotFoundError:
+            return 0, []
+
+        if use_cache:
+            with lock:
+                cache[directory] = (mtime, size, subdirectories)
+        return size, [os.path.join(directory, x) for x in subdirectories]
+
+    result = {}
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = {}
+        for directory in directories:
+            result[directory] = 0
+            pending[executor.submit(scan, str(directory))] = directory
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                root = pending.pop(future)
+                size, subdirectories = future.result()
+                result[root] += size
+                for subdirectory in subdirectories:
+                    pending[executor.submit(scan, subdirectory)] = root
+
+    if cache_file is not None:
+        with lock:
+            temporary = cache_file.with_name(f".{cache_file.name}.tmp")
+            temporary.write_text(json.dumps(cache))
+            os.replace(temporary, cache_file)
 
-    args = tuple(str(x) for x in args)
-    run_kwargs = {} if "capture_output" in kwargs else INTERACTIVE_SUBPROCESS_KWARGS
-    result = subprocess.run(args, **{'check': True, **run_kwargs, **kwargs})
     return result
 
 
+def format_bytes(value: int) -> str:
+    """ Formats a number of bytes for humans. """
+    for unit, factor in (("TiB", 1024 ** 4), ("GiB", 1024 ** 3), ("MiB", 1024 ** 2)):
+        if value >= factor:
+            return f"{value / factor:.1f} {unit}"
+    return f"{value / 1024:.1f} KiB"
+
+
+def format_duration(seconds: float) -> str:
+    """ Formats a duration for humans. """
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes:02}m"
+    if minutes:
+        return f"{minutes}m {seconds:02}s"
+    return f"{seconds}s"
+
+
+def format_size(value: int) -> str:
+    """ Formats a number of bytes with the largest binary unit that represents it
+        without a fraction, as understood by the JVM and systemd. """
+    for unit, factor in (("G", 1024 ** 3), ("M", 1024 ** 2), ("K", 1024)):
+        if value and not value % factor:
+            return f"{value // factor}{unit}"
+    return str(value)
+
+
+def parse_size(value: str) -> int:
+    """ Parses a size like ``1024m`` or ``2G`` into a number of bytes. """
+    value = value.strip()
+    factor = SIZE_UNITS.get(value[-1:].lower())
+    if factor is None:
+        return int(value)
+    return int(value[:-1]) * factor
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """ Returns the nearest-rank percentile of sorted values. """
+    if not values:
+        return float("nan")
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+# jvm
+
+
+is_garbage_collector_option = re.compile(r"^-XX:[+-]Use\w+GC$").match
+
+
+def jvm_option_key(option: str) -> str:
+    """ Returns the part of a JVM option that identifies the setting it controls,
+        e.g. ``-XX:MaxGCPauseMillis`` for ``-XX:MaxGCPauseMillis=200``. All
+        options that select a garbage collector, like ``-XX:+UseG1GC``, share
+        the key ``-XX:Use*GC`` as only one collector can be used. """
+    if is_garbage_collector_option(option):
+        return "-XX:Use*GC"
+    if option.startswith("-XX:"):
+        return "-XX:" + option[4:].lstrip("+-").split("=", maxsplit=1)[0]
+    for prefix in ("-Xms", "-Xmx", "-Xss", "-Xmn"):
+        if option.startswith(prefix):
+            return prefix
+    return option.split("=", maxsplit=1)[0]
+
+
+def merge_jvm_options(*options: str) -> str:
+    """ Merges whitespace-separated JVM option strings where options of a later
+        string override those of earlier ones that control the same setting. """
+    result = OrderedDict()
+    for value in options:
+        for option in value.split():
+            key = jvm_option_key(option)
+            result.pop(key, None)
+            result[key] = option
+    return " ".join(result.values())
+
+
+#
+
+
 def make_password_proposal(length: int = 32) -> str:
     result = ""
     while len(result) < length:
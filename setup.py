@@ -25,13 +25,13 @@ setup(
         " :: GNU Library or Lesser General Public License (LGPL)",
         "Operating System :: POSIX",
         "Programming Language :: Python :: 3 :: Only",
-        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3.8",
         "Topic :: System :: Installation/Setup",
     ],
     keywords="eXist-db",
     packages=find_packages(exclude=["docs", "tests"]),
     package_data={"existance": ["files/*"]},
     requires=["requests", "texttable"],
-    python_requires=">=3.6",
+    python_requires=">=3.8",
     entry_points={"console_scripts": ["existance=existance:main"]},
 )
@@ -0,0 +1,78 @@
+import pytest
+
+from existance.diagnostics import summarize_gc_log
+
+
+M = 1024 ** 2
+
+
+def pause(
+    uptime, before, after, duration, kind="Pause Young (Normal) (G1 Evacuation Pause)"
+):
+    return (
+        f"[{uptime:.3f}s][info][gc] GC(1) {kind} "
+        f"{before}M->{after}M(1024M) {duration:.3f}ms\n"
+    )
+
+
+
+def test_no_pauses():
+    assert summarize_gc_log([]) is None
+    assert summarize_gc_log(["[0.010s][info][gc] Using G1\n"]) is None
+
+
+def test_summary():
+    lines = [
+        "[0.010s][info][gc] Using G1\n",
+        pause(1, 100, 20, 10),
+        pause(2, 120, 30, 20),
+        "[2.500s][info][gc,heap] unrelated line\n",
+        pause(3, 130, 40, 30),
+        pause(4, 240, 50, 40, kind="Pause Full (System.gc())"),
+    ]
+
+    summary = summarize_gc_log(lines)
+
+    assert summary["pauses"] == 4
+    assert summary["full_pauses"] == 1
+    assert summary["p50"] == pytest.approx(0.02)
+    assert summary["p99"] == summary["max"] == pytest.approx(0.04)
+    # 100 ms of pauses within 3 s
+    assert summary["pause_share"] == pytest.approx(0.1 / 3)
+    # 100 + 100 + 200 MiB were allocated within 3 s
+    assert summary["allocation_rate"] == pytest.approx(400 * M / 3)
+    assert summary["heap_after_last"] == 50 * M
+    assert summary["heap_after_max"] == 50 * M
+    # the occupancy after the pauses grows by 10 MiB per second
+    assert summary["heap_after_trend"] == pytest.approx(10 * M)
+
+
+def test_restarts():
+    lines = [
+        pause(100, 500, 400, 10),
+        pause(200, 900, 800, 10),
+        # the JVM was restarted
+        pause(1, 100, 60, 10),
+        pause(3, 100, 50, 10),
+        pause(5, 100, 40, 10),
+    ]
+
+    summary = summarize_gc_log(lines)
+
+    assert summary["pauses"] == 5
+    # the time between the JVM runs isn't accounted
+    assert summary["pause_share"] == pytest.approx(0.05 / 104)
+    assert summary["allocation_rate"] == pytest.approx(
+        (500 + 40 + 50) * M / 104
+    )
+    assert summary["heap_after_last"] == 40 * M
+    assert summary["heap_after_max"] == 800 * M
+    # the trend is only fitted since the last start
+    assert summary["heap_after_trend"] == pytest.approx(-5 * M)
+
+
+def test_a_single_pause_has_no_trend():
+    summary = summarize_gc_log([pause(1, 100, 20, 10)])
+    assert summary["heap_after_trend"] == 0.0
+    assert summary["pause_share"] == 0.0
+    assert summary["allocation_rate"] == 0.0
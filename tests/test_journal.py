@@ -0,0 +1,116 @@
+import json
+
+from existance.journal import (
+    UNIT_FAILURE_RESULT,
+    UNIT_OUT_OF_MEMORY,
+    UNIT_RESTART_SCHEDULED,
+    UNIT_STARTED,
+    UNIT_STARTING,
+    analyze_journal,
+    parse_journal_export,
+)
+
+
+def entry(seconds, message_id, unit="existdb@1.service", **fields):
+    return {
+        "__CURSOR": f"s=0;i={seconds}",
+        "__REALTIME_TIMESTAMP": str(int(seconds * 1_000_000)),
+        "MESSAGE_ID": message_id,
+        "UNIT": unit,
+        **fields,
+    }
+
+
+def analyze(entries, state=None):
+    return analyze_journal(
+        entries,
+        {} if state is None else state,
+        restart_loop_count=3,
+        restart_loop_window=60,
+        slow_start=30,
+    )
+
+
+def test_parse_journal_export():
+    lines = [
+        json.dumps({"MESSAGE": "plain"}),
+        "",
+        json.dumps({"MESSAGE": list(b"bin\xffary")}),
+    ]
+    assert [x["MESSAGE"] for x in parse_journal_export(lines)] == [
+        "plain", "bin�ary"
+    ]
+
+
+def test_slow_starts():
+    events = analyze([
+        entry(100, UNIT_STARTING),
+        entry(110, UNIT_STARTED),
+        entry(200, UNIT_STARTING),
+        entry(245, UNIT_STARTED),
+    ])
+    assert [(x.time, x.instance, x.kind) for x in events] == [
+        (245, 1, "slow start")
+    ]
+
+
+def test_restart_loops():
+    events = analyze([
+        entry(t, UNIT_RESTART_SCHEDULED, N_RESTARTS=str(n))
+        for n, t in enumerate((0, 10, 100, 110, 120, 130, 140, 150), 1)
+    ])
+    # the restarts at 0 and 10 are too far apart from the others, a continuing
+    # loop is reported again after as many restarts
+    assert [(x.time, x.kind) for x in events] == [
+        (120, "restart loop"), (150, "restart loop")
+    ]
+    assert events[0].detail.endswith("the restart counter is at 5")
+
+
+def test_state_is_carried_between_invocations():
+    state = {}
+    analyze([
+        entry(0, UNIT_RESTART_SCHEDULED),
+        entry(10, UNIT_RESTART_SCHEDULED),
+        entry(20, UNIT_STARTING, unit="existdb@2.service"),
+    ], state)
+    assert state["cursor"] == "s=0;i=20"
+    assert state["timestamp"] == 20_000_000
+
+    state = json.loads(json.dumps(state))
+    events = analyze([
+        entry(30, UNIT_RESTART_SCHEDULED),
+        entry(60, UNIT_STARTED, unit="existdb@2.service"),
+    ], state)
+    assert [(x.instance, x.kind) for x in events] == [
+        (1, "restart loop"), (2, "slow start")
+    ]
+
+
+def test_failures_and_oom_kills():
+    events = analyze([
+        entry(1, UNIT_OUT_OF_MEMORY, MESSAGE="A process of this unit was killed"),
+        entry(2, UNIT_FAILURE_RESULT, UNIT_RESULT="oom-kill", MESSAGE="oom"),
+        entry(3, UNIT_FAILURE_RESULT, UNIT_RESULT="exit-code", MESSAGE="failed"),
+    ])
+    assert [(x.kind, x.detail) for x in events] == [
+        ("OOM kill", "A process of this unit was killed"),
+        ("failure", "failed"),
+    ]
+
+
+def test_other_units_are_ignored():
+    state = {}
+    events = analyze([
+        entry(1, UNIT_FAILURE_RESULT, unit="nginx.service"),
+        entry(2, UNIT_FAILURE_RESULT, unit="existdb@x.service"),
+        {"_SYSTEMD_UNIT": "existdb@3.service", "__CURSOR": "c", "MESSAGE": "x"},
+    ], state)
+    assert events == []
+    assert state["cursor"] == "c"
+    # systemd's own messages name the unit in the UNIT field, the unit's own
+    # output in _SYSTEMD_UNIT
+    events = analyze([
+        {**entry(3, UNIT_FAILURE_RESULT, unit=""), "_SYSTEMD_UNIT": "existdb@3.service"}
+    ])
+    assert [x.instance for x in events] == [3]
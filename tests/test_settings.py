@@ -0,0 +1,179 @@
+import fcntl
+import threading
+from argparse import Namespace
+from types import SimpleNamespace
+
+import pytest
+
+from existance import actions
+from existance.settings import InstancesSettings, parse_extra_fields
+
+
+def make_row(_id, name, **fields):
+    return {
+        "id": _id,
+        "name": name,
+        "xmx": "1g",
+        "version": "6.2.0",
+        "instance_dir": f"/opt/existdb/{name}",
+        **fields,
+    }
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "instances.csv"
+
+
+def test_insert(path):
+    settings = InstancesSettings(path)
+    settings.insert(make_row(1, "alpha"))
+    settings.insert(make_row(2, "beta"))
+
+    assert list(settings) == [1, 2]
+    assert settings.by_name["beta"]["id"] == "2"
+
+    reread = InstancesSettings(path)
+    assert reread[1] == settings[1]
+    assert path.read_text().startswith("# id,name,xmx,")
+    assert (path.stat().st_mode & 0o777) == 0o644
+    assert "instance_name=alpha\n" in settings.environment_file(1).read_text()
+
+
+def test_insert_rejects_used_ids_and_names(path):
+    settings = InstancesSettings(path)
+    settings.insert(make_row(1, "alpha"))
+
+    with pytest.raises(KeyError):
+        settings.insert(make_row(1, "beta"))
+    with pytest.raises(KeyError):
+        settings.insert(make_row(2, "alpha"))
+    assert list(InstancesSettings(path)) == [1]
+
+
+def test_modifications_keep_concurrently_added_rows(path):
+    first, second = InstancesSettings(path), InstancesSettings(path)
+    first.insert(make_row(1, "alpha"))
+    second.insert(make_row(2, "beta"))
+    first.upsert({"id": 1, "xmx": "4g"})
+
+    assert list(first) == [1, 2]
+    assert first[1]["xmx"] == "4g"
+    assert first[1]["name"] == "alpha"
+
+
+def test_upsert(path):
+    settings = InstancesSettings(path)
+    settings.upsert(make_row(1, "alpha"))
+    settings.upsert({"id": 1, "name": "gamma", "memory_max": "8G"})
+
+    assert settings[1]["memory_max"] == "8G"
+    assert settings[1]["version"] == "6.2.0"
+    assert dict(settings.by_name) == {"gamma": settings[1]}
+
+
+def test_remove(path):
+    settings = InstancesSettings(path)
+    settings.insert(make_row(1, "alpha"))
+    settings.insert(make_row(2, "beta"))
+    settings.remove(1)
+    settings.remove(3)
+
+    assert list(InstancesSettings(path)) == [2]
+    assert "alpha" not in settings.by_name
+    assert not settings.environment_file(1).exists()
+    assert settings.environment_file(2).exists()
+
+
+def test_comments_and_undeclared_fields_are_preserved(path):
+    path.write_text("# a comment\n1,alpha,1g,,,,,,,,6.2.0,/opt/alpha,foo,bar\n")
+    settings = InstancesSettings(path)
+    settings.insert(make_row(2, "beta"))
+
+    lines = path.read_text().splitlines()
+    assert lines[1].endswith("/opt/alpha,foo,bar")
+    assert InstancesSettings(path)[1]["instance_dir"] == "/opt/alpha"
+
+
+def test_extra_fields(path):
+    extra_fields = parse_extra_fields("owner, port:int")
+    settings = InstancesSettings(path, extra_fields)
+    settings.insert(make_row(1, "alpha", port="8081"))
+
+    assert InstancesSettings(path, extra_fields)[1]["port"] == 8081
+    assert InstancesSettings(path, extra_fields)[1]["owner"] is None
+    with pytest.raises(ValueError):
+        parse_extra_fields("name")
+    with pytest.raises(ValueError):
+        parse_extra_fields("port:bool")
+
+
+def test_modifications_wait_for_the_lock(path):
+    settings = InstancesSettings(path)
+    inserted = threading.Event()
+
+    def insert():
+        settings.insert(make_row(1, "alpha"))
+        inserted.set()
+
+    with path.with_name(path.name + ".lock").open("a") as f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        thread = threading.Thread(target=insert)
+        thread.start()
+        assert not inserted.wait(0.2)
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+    thread.join(5)
+    assert inserted.is_set()
+    assert list(InstancesSettings(path)) == [1]
+
+
+# the settings actions
+
+
+def make_executor(path, **args):
+    return SimpleNamespace(
+        args=Namespace(**args),
+        config=None,
+        context=SimpleNamespace(instances_settings=InstancesSettings(path)),
+        interactive=False,
+    )
+
+
+def test_uninstall_removes_the_settings(path):
+    InstancesSettings(path).insert(make_row(1, "alpha"))
+    executor = make_executor(path, id=1)
+
+    action = actions.counter(actions.WriteInstanceSettings)(executor)
+    assert action.prompted == 0.0
+    action.do()
+
+    assert 1 not in executor.context.instances_settings
+    assert list(InstancesSettings(path)) == []
+
+
+def test_failed_insertion_keeps_the_other_row(path):
+    InstancesSettings(path).insert(make_row(1, "alpha"))
+    executor = make_executor(
+        path,
+        id=1,
+        name="beta",
+        xmx="1g",
+        jvm_profile=None,
+        jvm_overrides=None,
+        cpu_weight=None,
+        io_weight=None,
+        memory_max=None,
+        tasks_max=None,
+        version="6.2.0",
+    )
+    executor.context.jvm_options = ""
+    executor.context.instance_dir = "/opt/existdb/beta"
+    action = actions.WriteInstanceSettings(executor)
+
+    with pytest.raises(actions.Abort):
+        action.do()
+    action.undo()
+
+    assert list(InstancesSettings(path)) == [1]
+    assert InstancesSettings(path)[1]["name"] == "alpha"
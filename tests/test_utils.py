@@ -0,0 +1,160 @@
+import subprocess
+
+import pytest
+
+from existance import utils
+from existance.constants import MAX_BATCHED_ARGUMENTS, TRASH_DIRECTORY_NAME
+from existance.utils import CommandRunner, as_user, command_name
+
+
+def test_command_name():
+    assert command_name(("/usr/bin/chown", "a", "b")) == "chown"
+    assert command_name(as_user("existdb", "/usr/bin/gzip", "x")) == "gzip"
+
+
+def test_stubbed_responses():
+    runner = CommandRunner(
+        stub={("false",): 1, ("echo", "x"): (0, b"x\n", b""), ("true",): None}
+    )
+
+    assert runner.run("echo", "x", text=True).stdout == "x\n"
+    assert runner.run("true").returncode == 0
+    # unknown commands succeed silently
+    assert runner.run("rm", "-rf", "/").returncode == 0
+    assert runner.run("false", check=False).returncode == 1
+    with pytest.raises(subprocess.CalledProcessError):
+        runner.run("false")
+
+    assert [x.args for x in runner.history] == [
+        ("echo", "x"), ("true",), ("rm", "-rf", "/"), ("false",), ("false",)
+    ]
+
+
+def test_callable_stub_receives_strings(tmp_path):
+    received = []
+    runner = CommandRunner(stub=lambda args: received.append(args) or 0)
+    runner.run("chmod", "600", tmp_path)
+    assert received == [("chmod", "600", str(tmp_path))]
+
+
+def test_stubbed_commands_arent_executed(tmp_path):
+    target = tmp_path / "file"
+    CommandRunner(stub={}).run("touch", target)
+    assert not target.exists()
+
+    CommandRunner().run("touch", target, input="")
+    assert target.exists()
+
+
+def test_batching_merges_batchable_commands():
+    runner = CommandRunner(stub={})
+    commands = [
+        ("chmod", "640", "a"),
+        ("chown", "existdb", "a"),
+        ("chmod", "640", "b"),
+        ("chmod", "600", "c"),
+        ("chown", "existdb", "b"),
+    ]
+
+    results = runner.run_many(commands, batch=True)
+
+    assert [x.args for x in runner.history] == [
+        ("chmod", "640", "a", "b"),
+        ("chown", "existdb", "a", "b"),
+        ("chmod", "600", "c"),
+    ]
+    # each command is answered with the result of its invocation
+    assert results[0] is results[2]
+    assert results[1] is results[4]
+    assert results[3].args == ("chmod", "600", "c")
+
+
+def test_batching_excludes_other_commands():
+    runner = CommandRunner(stub={})
+    commands = [("systemctl", "restart", "a"), ("systemctl", "restart", "b")]
+
+    runner.run_many(commands, batch=True)
+
+    assert sorted(x.args for x in runner.history) == commands
+
+
+def test_batching_is_optional():
+    runner = CommandRunner(stub={})
+    commands = [("chmod", "640", "a"), ("chmod", "640", "b")]
+
+    results = runner.run_many(commands)
+
+    assert sorted(x.args for x in runner.history) == commands
+    assert [x.args for x in results] == commands
+
+
+def test_batches_are_limited():
+    runner = CommandRunner(stub={})
+    commands = [("chown", "existdb", str(i)) for i in range(MAX_BATCHED_ARGUMENTS + 1)]
+
+    results = runner.run_many(commands, batch=True)
+
+    assert sorted(len(x.args) for x in runner.history) == [
+        3, MAX_BATCHED_ARGUMENTS + 2
+    ]
+    assert results[-1].args == ("chown", "existdb", str(MAX_BATCHED_ARGUMENTS))
+
+
+def test_batched_failures_are_raised():
+    runner = CommandRunner(stub={("chmod", "640", "a", "b"): 1})
+    with pytest.raises(subprocess.CalledProcessError):
+        runner.run_many([("chmod", "640", "a"), ("chmod", "640", "b")], batch=True)
+
+
+# trash
+
+
+@pytest.fixture
+def filesystem(tmp_path, monkeypatch):
+    root = tmp_path / "filesystem"
+    root.mkdir()
+    trash = root / TRASH_DIRECTORY_NAME
+    monkeypatch.setattr(utils, "find_mountpoint", lambda path: root)
+    monkeypatch.setattr(
+        utils,
+        "trash_directories",
+        lambda: [trash] if utils.is_private_directory(trash.lstat()) else [],
+    )
+    return root
+
+
+def test_purge_trash(filesystem, tmp_path):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    (outside / "file").write_text("")
+    tree = filesystem / "tree"
+    (tree / "sub").mkdir(parents=True)
+    for i in range(32):
+        (tree / "sub" / str(i)).write_text("")
+    (tree / "link").symlink_to(outside)
+    (filesystem / "file").write_text("")
+
+    trashed = utils.move_to_trash(tree)
+    utils.move_to_trash(filesystem / "file")
+
+    assert trashed.parent == filesystem / TRASH_DIRECTORY_NAME
+    assert not tree.exists()
+    assert utils.purge_trash(tmp_path / "lock", threads=4) == 2
+    assert list(trashed.parent.iterdir()) == []
+    assert (outside / "file").exists()
+
+
+def test_other_users_trash_is_refused(filesystem):
+    trash = filesystem / TRASH_DIRECTORY_NAME
+    trash.mkdir(mode=0o777)
+    trash.chmod(0o777)
+    (filesystem / "file").write_text("")
+
+    with pytest.raises(PermissionError):
+        utils.move_to_trash(filesystem / "file")
+    assert (filesystem / "file").exists()
+
+    trash.rmdir()
+    trash.symlink_to(filesystem)
+    with pytest.raises(PermissionError):
+        utils.move_to_trash(filesystem / "file")